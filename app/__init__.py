@@ -14,9 +14,49 @@ def create_app():
         DB_NAME=os.getenv('DB_NAME'), 
         DB_USER=os.getenv('DB_USER'),
         DB_PASSWORD=os.getenv('DB_PASSWORD'),
-        DB_PORT=os.getenv('DB_PORT', '5432')
+        DB_PORT=os.getenv('DB_PORT', '5432'),
+        JSON_FAST_SERIALIZER=os.getenv('JSON_FAST_SERIALIZER', 'true').lower() == 'true',
+        DB_NUMERIC_AS_FLOAT=os.getenv('DB_NUMERIC_AS_FLOAT', 'false').lower() == 'true',
+        DEVIATION_ENGINE=os.getenv('DEVIATION_ENGINE', 'sql').lower(),
+        BLOCK_INDEX_REFRESH_INTERVAL=int(os.getenv('BLOCK_INDEX_REFRESH_INTERVAL', '300')),
+        NOTIFY_LISTENER_ENABLED=os.getenv('NOTIFY_LISTENER_ENABLED', 'true').lower() == 'true',
+        NOTIFY_COALESCE_WINDOW=float(os.getenv('NOTIFY_COALESCE_WINDOW', '0.25')),
+        PROGRESS_RECONCILE_INTERVAL=int(os.getenv('PROGRESS_RECONCILE_INTERVAL', '900')),
+        PROGRESS_STALE_AFTER=int(os.getenv('PROGRESS_STALE_AFTER', '60')),
+        EXPORT_JOB_WORKERS=int(os.getenv('EXPORT_JOB_WORKERS', '2')),
+        EXPORT_JOB_MAX_PENDING=int(os.getenv('EXPORT_JOB_MAX_PENDING', '16')),
+        EXPORT_JOB_TTL=int(os.getenv('EXPORT_JOB_TTL', '3600')),
+        EXPORT_JOB_REUSE_TTL=int(os.getenv('EXPORT_JOB_REUSE_TTL', '300')),
+        EXPORT_JOB_DIR=os.getenv('EXPORT_JOB_DIR'),
+        BULK_EXPORT_PARALLELISM=int(os.getenv('BULK_EXPORT_PARALLELISM', '4')),
+        BULK_EXPORT_DB_SLOTS=int(os.getenv('BULK_EXPORT_DB_SLOTS', '4')),
+        EXPORT_CACHE_DIR=os.getenv('EXPORT_CACHE_DIR'),
+        EXPORT_CACHE_MAX_BYTES=int(os.getenv('EXPORT_CACHE_MAX_BYTES', str(512 * 1024 * 1024))),
+        EXPORT_CACHE_TTL=int(os.getenv('EXPORT_CACHE_TTL', '300')),
+        RIG_ROLLUPS_ENABLED=os.getenv('RIG_ROLLUPS_ENABLED', 'false').lower() == 'true',
+        RIG_ROLLUP_REFRESH_INTERVAL=int(os.getenv('RIG_ROLLUP_REFRESH_INTERVAL', '300')),
+        RIG_ROLLUP_SHIFT_HOURS=int(os.getenv('RIG_ROLLUP_SHIFT_HOURS', '12')),
+        RIG_ROLLUP_SHIFT_OFFSET=int(os.getenv('RIG_ROLLUP_SHIFT_OFFSET', '8')),
+        FORECAST_SIMULATIONS=int(os.getenv('FORECAST_SIMULATIONS', '2000')),
+        FORECAST_WORKERS=int(os.getenv('FORECAST_WORKERS', '4')),
+        GRID_REGULARITY_TOLERANCE=float(os.getenv('GRID_REGULARITY_TOLERANCE', '0.25')),
+        GRID_REGULARITY_CACHE_SIZE=int(os.getenv('GRID_REGULARITY_CACHE_SIZE', '128')),
+        RELIEF_SURFACE_CACHE_SIZE=int(os.getenv('RELIEF_SURFACE_CACHE_SIZE', '64')),
+        RELIEF_GRID_RESOLUTION=float(os.getenv('RELIEF_GRID_RESOLUTION', '1.0')),
+        BLAST_EXPLOSIVE_ENERGY=float(os.getenv('BLAST_EXPLOSIVE_ENERGY', '3.8')),
+        BLAST_CELL_SAMPLES=int(os.getenv('BLAST_CELL_SAMPLES', '8')),
+        BLAST_VOLUME_CACHE_SIZE=int(os.getenv('BLAST_VOLUME_CACHE_SIZE', '128')),
+        DEVIATION_STATS_WORKERS=int(os.getenv('DEVIATION_STATS_WORKERS', '4')),
+        DASHBOARD_STREAMING=os.getenv('DASHBOARD_STREAMING', 'true').lower() == 'true',
+        FRAGMENT_CACHE_MAX_BYTES=int(os.getenv('FRAGMENT_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+        STATIC_FINGERPRINT=os.getenv('STATIC_FINGERPRINT', 'true').lower() == 'true'
     )
     
+    # Быстрый компактный JSON для jsonify (orjson, если установлен)
+    if app.config['JSON_FAST_SERIALIZER']:
+        from app.utils.serialization import FastJSONProvider
+        app.json = FastJSONProvider(app)
+    
     # Импорт и регистрация blueprint
     from app.routes.main import main_bp
     from app.routes.analytics import analytics_bp
@@ -30,4 +70,64 @@ def create_app():
     app.register_blueprint(boreholes_bp)
     app.register_blueprint(export_bp)
     
+    # Слушатель LISTEN/NOTIFY для сброса кэшей блоков (см. sql/notify_triggers.sql)
+    if app.config['NOTIFY_LISTENER_ENABLED']:
+        from app.models.invalidation import start_listener
+        start_listener(app)
+    
+    # Резидентный индекс блоков для разрешения ID/названий и подсказок
+    from app.models.block_index import block_index
+    block_index.init_app(app)
+    
+    # Инкрементальные счетчики прогресса бурения
+    from app.models.progress_model import progress_model
+    progress_model.init_app(app)
+    
+    # Очередь фоновых выгрузок
+    from app.models.export_jobs import export_jobs
+    export_jobs.init_app(app)
+    
+    from app.models.bulk_export import bulk_exporter
+    bulk_exporter.init_app(app)
+    
+    # Дисковый кэш готовых файлов выгрузок
+    from app.models.export_cache import export_cache
+    export_cache.init_app(app)
+    
+    # Сменная свертка производительности станков (sql/rig_productivity_rollups.sql)
+    from app.models.rig_rollups import rig_rollups
+    rig_rollups.init_app(app)
+    
+    # Прогноз оставшихся смен методом Монте-Карло
+    from app.models.shift_forecast import shift_forecast
+    shift_forecast.init_app(app)
+    
+    # Расчет отклонений в приложении вместо SQL функций calc_*_deviations
+    from app.models.deviation_engine import deviation_engine
+    deviation_engine.init_app(app)
+    
+    # Анализ регулярности фактических сеток скважин
+    from app.models.grid_regularity import grid_regularity
+    grid_regularity.init_app(app)
+    
+    # Кэш поверхностей рельефа для сверки высот устьев
+    from app.models.relief_surface import relief_surfaces
+    relief_surfaces.init_app(app)
+    
+    # Объем взрываемой породы и потребный заряд по скважинам
+    from app.models.blast_volume import blast_volumes
+    blast_volumes.init_app(app)
+    
+    # Сводные распределения отклонений по наборам блоков
+    from app.models.deviation_stats import deviation_stats
+    deviation_stats.init_app(app)
+    
+    # Кэш отрисованных страниц блока и скважин и их фрагментов
+    from app.models.fragment_cache import fragment_cache
+    fragment_cache.init_app(app)
+    
+    # Статика с хэшем содержимого в имени, сжатыми вариантами и бессрочным кэшем
+    from app.utils.static_assets import static_assets
+    static_assets.init_app(app)
+    
     return app
\ No newline at end of file
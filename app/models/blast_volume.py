@@ -0,0 +1,266 @@
+# blast_volume.py
+import logging
+import math
+import time
+
+import numpy as np
+from psycopg2.extras import RealDictCursor
+from scipy.spatial import ConvexHull, QhullError, cKDTree
+
+from app.models.database import db_manager
+from app.models.grid_regularity import AXIS_TOLERANCE, grid_orientation
+from app.models.invalidation import VersionedCache, invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Таблицы исходных данных расчета
+SOURCE_TABLES = ('Boreholes', 'BlockInfo')
+
+# Точек растра на наименьший проектный шаг: площадь ячейки Вороного считается по ~samples² точкам
+DEFAULT_SAMPLES = 8
+
+# Предел точек растра на блок; при превышении шаг растра увеличивается
+MAX_BLOCK_SAMPLES = 2000000
+
+# Точки растра проверяются на попадание в контур пачками
+CHUNK_SIZE = 262144
+
+HOLES_QUERY = """
+    SELECT b."BlockID"::text AS block_id, b."Name" AS name, b."X" AS x, b."Y" AS y,
+           b."Length" AS length, b."Diameter" AS diameter, b."Angle" AS angle
+    FROM public."Boreholes" b
+    WHERE b."T" = 3 AND b."X" IS NOT NULL AND b."Y" IS NOT NULL{condition}
+    ORDER BY b."BlockID", b."Name"
+"""
+
+BLOCKS_QUERY = """
+    SELECT "BlockID"::text AS block_id, "BlockName" AS block_name,
+           "CrushEnergy" AS crush_energy, "RockDensity" AS rock_density,
+           "HolesSpace" AS holes_space, "RowsDistance" AS rows_distance
+    FROM public."BlockInfo"{condition}
+"""
+
+def _row_axis(xy, spacing, burden):
+    """Единичные векторы вдоль рядов (шаг spacing) и поперек (burden)"""
+    k = min(4, len(xy) - 1)
+    _, neighbours = cKDTree(xy).query(xy, k=k + 1)
+    vectors = (xy[neighbours[:, 1:]] - xy[:, None, :]).reshape(-1, 2)
+    angle = grid_orientation(vectors)
+    first = np.array([math.cos(angle), math.sin(angle)])
+    second = np.array([-first[1], first[0]])
+
+    along, across = np.abs(vectors @ first), np.abs(vectors @ second)
+    on_first, on_second = across <= along * AXIS_TOLERANCE, along <= across * AXIS_TOLERANCE
+    if on_first.any() and on_second.any():
+        step_first, step_second = np.median(along[on_first]), np.median(across[on_second])
+        if abs(step_first - burden) + abs(step_second - spacing) < abs(step_first - spacing) + abs(step_second - burden):
+            return second, first
+    return first, second
+
+def cell_areas(xy, spacing, burden, samples=DEFAULT_SAMPLES):
+    """Площади ячеек Вороного скважин, обрезанных по контуру блока.
+
+    Контур - выпуклая оболочка устьев, раздвинутая на половину проектного
+    шага по нормали каждой стороны (крайние скважины отвечают за полосу
+    до середины несуществующего соседнего ряда). Ячейки считаются
+    растрированием: каждая точка растра внутри контура относится к
+    ближайшей скважине, но не дальше половины диагонали проектной ячейки.
+    Кандидаты - окна растра вокруг скважин, поэтому работа пропорциональна
+    числу скважин. Для регулярной сетки площадь внутренней скважины равна
+    spacing * burden.
+    """
+    xy = np.asarray(xy, dtype=float)
+    count = len(xy)
+    nominal = np.full(count, spacing * burden)
+    if count < 3:
+        return nominal
+    try:
+        hull = ConvexHull(xy)
+    except QhullError:
+        # Скважины на одной линии: проектная площадь
+        return nominal
+
+    along, across = _row_axis(xy, spacing, burden)
+    normals, offsets = hull.equations[:, :2], hull.equations[:, 2]
+    buffers = 0.5 * (np.abs(normals @ along) * spacing + np.abs(normals @ across) * burden)
+
+    reach = 0.5 * math.hypot(spacing, burden)
+    low = xy.min(axis=0) - reach
+    extent = xy.max(axis=0) + reach - low
+    step = max(min(spacing, burden) / samples, math.sqrt(extent[0] * extent[1] / MAX_BLOCK_SAMPLES))
+    shape = np.ceil(extent / step).astype(int)
+
+    # Точки растра внутри контура
+    centers_x = low[0] + (np.arange(shape[0]) + 0.5) * step
+    centers_y = low[1] + (np.arange(shape[1]) + 0.5) * step
+    inside = np.zeros(shape, dtype=bool)
+    rows_per_chunk = max(1, CHUNK_SIZE // shape[1])
+    for start in range(0, shape[0], rows_per_chunk):
+        points = np.stack(np.meshgrid(centers_x[start:start + rows_per_chunk], centers_y, indexing='ij'), axis=-1)
+        inside[start:start + rows_per_chunk] = np.all(points @ normals.T + offsets <= buffers, axis=-1)
+
+    radius = int(math.ceil(reach / step))
+    window = np.arange(-radius, radius + 1)
+    home = np.floor((xy - low) / step).astype(int)
+    holes_per_chunk = max(1, CHUNK_SIZE // len(window) ** 2)
+
+    def candidates(first, last):
+        """Точки растра в окнах скважин first..last: номер точки, скважина, квадрат расстояния"""
+        last = min(last, count)
+        i = (home[first:last, 0, None, None] + window[None, :, None]).repeat(len(window), axis=2)
+        j = (home[first:last, 1, None, None] + window[None, None, :]).repeat(len(window), axis=1)
+        hole = np.broadcast_to(np.arange(first, last)[:, None, None], i.shape)
+        i, j, hole = i.ravel(), j.ravel(), hole.ravel()
+        valid = (i >= 0) & (i < shape[0]) & (j >= 0) & (j < shape[1])
+        i, j, hole = i[valid], j[valid], hole[valid]
+        distance = (centers_x[i] - xy[hole, 0]) ** 2 + (centers_y[j] - xy[hole, 1]) ** 2
+        valid = inside[i, j] & (distance <= reach * reach)
+        return (i * shape[1] + j)[valid], hole[valid], distance[valid]
+
+    # Расстояние до ближайшей скважины в каждой точке растра, затем ее владелец
+    chunks = [candidates(first, first + holes_per_chunk) for first in range(0, count, holes_per_chunk)]
+    best = np.full(shape[0] * shape[1], np.inf)
+    for cell, _, distance in chunks:
+        np.minimum.at(best, cell, distance)
+
+    taken = np.zeros(shape[0] * shape[1], dtype=bool)
+    counts = np.zeros(count, dtype=np.int64)
+    for cell, hole, distance in chunks:
+        winner = (distance == best[cell]) & ~taken[cell]
+        # Точка на равном расстоянии от нескольких скважин достается одной из них
+        cell, unique = np.unique(cell[winner], return_index=True)
+        taken[cell] = True
+        counts += np.bincount(hole[winner][unique], minlength=count)
+
+    return counts * step * step
+
+def hole_metrics(area, length, angle, crush_energy, rock_density, explosive_energy):
+    """Объем, масса и заряд скважин массивами.
+
+    Высота уступа - вертикальная проекция фактической длины (угол от
+    вертикали); энергия дробления в МДж/м³, плотность породы в т/м³,
+    теплота взрыва ВВ в МДж/кг.
+    """
+    bench_height = length * np.cos(np.radians(np.nan_to_num(angle)))
+    volume = area * bench_height
+    energy = volume * crush_energy
+    return {
+        'area_m2': area,
+        'bench_height_m': bench_height,
+        'volume_m3': volume,
+        'rock_mass_t': volume * rock_density,
+        'energy_mj': energy,
+        'charge_kg': energy / explosive_energy if explosive_energy else np.full(len(area), np.nan)
+    }
+
+def _total(values):
+    values = values[np.isfinite(values)]
+    return round(float(values.sum()), 2)
+
+def _value(value, digits=2):
+    return None if not np.isfinite(value) else round(float(value), digits)
+
+class BlastVolumes:
+    """Объем взрываемой породы и потребный заряд по фактическим скважинам.
+
+    Для каждой скважины (T=3) площадь влияния берется как ее ячейка
+    Вороного в контуре блока, объем - площадь на высоту уступа, масса и
+    заряд - по RockDensity и CrushEnergy блока. Все скважины шахты
+    читаются одной выборкой; итоги по блокам кэшируются на версию шахты,
+    детали блока - на версию блока (не больше max_blocks блоков).
+    """
+
+    def __init__(self, explosive_energy=3.8, samples=DEFAULT_SAMPLES, max_blocks=128, fallback_ttl=300):
+        self.explosive_energy = explosive_energy
+        self.samples = samples
+        self._blocks = VersionedCache(SOURCE_TABLES, fallback_ttl, max_entries=max_blocks)
+        self._totals = VersionedCache(SOURCE_TABLES, fallback_ttl, max_entries=1)
+
+    def init_app(self, app):
+        self.explosive_energy = float(app.config.get('BLAST_EXPLOSIVE_ENERGY', self.explosive_energy))
+        self.samples = int(app.config.get('BLAST_CELL_SAMPLES', self.samples))
+        self._blocks.max_entries = int(app.config.get('BLAST_VOLUME_CACHE_SIZE', self._blocks.max_entries))
+
+    def _load(self, block_id=None):
+        params = (block_id,) if block_id is not None else ()
+        with db_manager.get_cursor(RealDictCursor, numeric_as_float=True) as cursor:
+            cursor.execute(HOLES_QUERY.format(condition=' AND b."BlockID" = %s' if block_id is not None else ''), params)
+            holes = cursor.fetchall()
+            cursor.execute(BLOCKS_QUERY.format(condition=' WHERE "BlockID" = %s' if block_id is not None else ''), params)
+            blocks = {row['block_id']: row for row in cursor.fetchall()}
+        return holes, blocks
+
+    def _compute(self, holes, blocks, with_holes=False):
+        """Итоги по блокам и (with_holes) строки скважин с метриками"""
+        if not holes:
+            return [], []
+
+        block_ids = np.array([row['block_id'] for row in holes])
+        xy = np.array([(row['x'], row['y']) for row in holes], dtype=float)
+        length = np.array([row['length'] for row in holes], dtype=float)
+        angle = np.array([row['angle'] for row in holes], dtype=float)
+
+        def design(field):
+            return np.array([(blocks.get(key) or {}).get(field) for key in block_ids], dtype=float)
+
+        spacing, burden = design('holes_space'), design('rows_distance')
+        area = np.full(len(holes), np.nan)
+        # Скважины отсортированы по блоку: границы блоков - места смены block_id
+        starts = np.flatnonzero(np.r_[True, block_ids[1:] != block_ids[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(holes)]):
+            if spacing[start] > 0 and burden[start] > 0:
+                area[start:end] = cell_areas(xy[start:end], spacing[start], burden[start], self.samples)
+
+        metrics = hole_metrics(area, length, angle, design('crush_energy'), design('rock_density'),
+                               self.explosive_energy)
+
+        hole_rows = [] if not with_holes else [
+            {
+                'block_id': row['block_id'],
+                'borehole_name': row['name'],
+                **{key: _value(values[i]) for key, values in metrics.items()}
+            }
+            for i, row in enumerate(holes)
+        ]
+
+        totals = []
+        for start, end in zip(starts, np.r_[starts[1:], len(holes)]):
+            info = blocks.get(block_ids[start]) or {}
+            volume, mass, charge = (_total(metrics[key][start:end]) for key in ('volume_m3', 'rock_mass_t', 'charge_kg'))
+            totals.append({
+                'block_id': str(block_ids[start]),
+                'block_name': info.get('block_name'),
+                'hole_count': int(end - start),
+                'area_m2': _total(metrics['area_m2'][start:end]),
+                'volume_m3': volume,
+                'rock_mass_t': mass,
+                'energy_mj': _total(metrics['energy_mj'][start:end]),
+                'charge_kg': charge,
+                'specific_charge_kg_m3': round(charge / volume, 3) if volume else None,
+                'charge_kg_per_t': round(charge / mass, 3) if mass else None
+            })
+        return hole_rows, totals
+
+    def block(self, block_id):
+        """Скважины блока с объемом и зарядом и итоги блока (None - нет фактических скважин)"""
+        block_id = str(block_id)
+
+        def build():
+            holes, totals = self._compute(*self._load(block_id), with_holes=True)
+            return {**totals[0], 'holes': holes} if totals else None
+
+        return self._blocks.get_or_build(block_id, invalidation_bus.block_version(block_id), build)
+
+    def totals(self):
+        """Итоги по всем блокам шахты"""
+        return self._totals.get_or_build('totals', invalidation_bus.mine_version(), self._compute_totals)
+
+    def _compute_totals(self):
+        started = time.monotonic()
+        _, rows = self._compute(*self._load())
+        hole_count = sum(row['hole_count'] for row in rows)
+        logger.info(f"Blast volumes computed for {hole_count} holes in {len(rows)} blocks "
+                    f"in {time.monotonic() - started:.2f}s")
+        return rows
+
+blast_volumes = BlastVolumes()
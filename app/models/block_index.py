@@ -0,0 +1,274 @@
+# block_index.py
+import bisect
+import logging
+import threading
+import time
+
+from psycopg2.extensions import cursor as tuple_cursor
+
+from app.models.database import db_manager
+from app.models.prepared_statements import prepared_statements
+from app.models.invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Типизированное сравнение по ключу, чтобы поиск шел по индексу первичного ключа
+prepared_statements.register('block_by_id', """
+    SELECT "BlockID", "BlockName" FROM public."BlockInfo"
+    WHERE "BlockID" = $1::bigint
+""")
+
+prepared_statements.register('block_ids_names', """
+    SELECT "BlockID", "BlockName" FROM public."BlockInfo"
+""")
+
+# Разделитель записей в строке для поиска подстроки
+_SEPARATOR = '\x00'
+
+class BlockIndex:
+    """Резидентный двунаправленный индекс BlockID <-> BlockName.
+
+    Разрешает ввод пользователя (ID или название блока) без обращения к БД
+    и поддерживает поиск по префиксу и подстроке для подсказок.
+    """
+
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = refresh_interval
+        self._by_id = {}
+        self._by_name = {}
+        self._lock = threading.RLock()
+        self._loaded_at = 0.0
+        self._reloading = False
+        # Поисковые структуры, перестраиваются лениво после изменений
+        self._dirty = True
+        self._entries = []
+        self._name_keys = []
+        self._id_keys = []
+        self._id_order = []
+        self._haystack = ''
+        self._offsets = []
+
+    def init_app(self, app):
+        """Загрузка индекса в фоне при старте приложения"""
+        self.refresh_interval = int(app.config.get('BLOCK_INDEX_REFRESH_INTERVAL', self.refresh_interval))
+        self._reloading = True
+        threading.Thread(target=self._safe_load, name='block-index-load', daemon=True).start()
+        invalidation_bus.subscribe(self._on_invalidation)
+
+    def _on_invalidation(self, events):
+        """Точечное обновление блоков по уведомлениям об изменении BlockInfo"""
+        for event in events:
+            if 'BlockInfo' not in event.tables and event.tables:
+                continue
+            if event.block_id is None:
+                self._loaded_at = 0.0
+                self._refresh_if_stale()
+            else:
+                self.refresh_block(event.block_id)
+
+    def load(self):
+        """Полная загрузка индекса из BlockInfo"""
+        with db_manager.get_cursor(tuple_cursor) as cursor:
+            prepared_statements.execute(cursor, 'block_ids_names')
+            rows = cursor.fetchall()
+
+        by_id = {}
+        by_name = {}
+        for block_id, block_name in rows:
+            block_id = str(block_id)
+            by_id[block_id] = block_name
+            if block_name is not None:
+                by_name[block_name] = block_id
+
+        with self._lock:
+            self._by_id = by_id
+            self._by_name = by_name
+            self._loaded_at = time.monotonic()
+            self._dirty = True
+
+        logger.info(f"Block index loaded: {len(by_id)} blocks")
+        return len(by_id)
+
+    def _safe_load(self):
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Error loading block index: {e}")
+        finally:
+            self._reloading = False
+
+    def _refresh_if_stale(self):
+        """Фоновая перезагрузка индекса по истечении интервала"""
+        if self._reloading or time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._safe_load, name='block-index-refresh', daemon=True).start()
+
+    def upsert(self, block_id, block_name):
+        """Добавление или переименование блока"""
+        block_id = str(block_id)
+        with self._lock:
+            old_name = self._by_id.get(block_id)
+            if old_name is not None and self._by_name.get(old_name) == block_id:
+                del self._by_name[old_name]
+            self._by_id[block_id] = block_name
+            if block_name is not None:
+                self._by_name[block_name] = block_id
+            self._dirty = True
+
+    def remove(self, block_id):
+        """Удаление блока из индекса"""
+        block_id = str(block_id)
+        with self._lock:
+            block_name = self._by_id.pop(block_id, None)
+            if block_name is not None and self._by_name.get(block_name) == block_id:
+                del self._by_name[block_name]
+            self._dirty = True
+
+    @staticmethod
+    def _fetch_by_id(block_id):
+        """Строка блока по ID; ввод, не являющийся bigint, в БД не отправляется"""
+        block_id = str(block_id).strip()
+        if not block_id.lstrip('-').isdigit() or not -2 ** 63 <= int(block_id) < 2 ** 63:
+            return []
+        return db_manager.execute_prepared('block_by_id', (int(block_id),), cursor_factory=tuple_cursor)
+
+    def refresh_block(self, block_id):
+        """Точечное обновление одного блока из БД"""
+        rows = self._fetch_by_id(block_id)
+        if rows:
+            self.upsert(rows[0][0], rows[0][1])
+        else:
+            self.remove(block_id)
+
+    def resolve(self, block_input):
+        """Разрешение ID или названия блока в пару (block_id, block_name)"""
+        block_input = (block_input or '').strip()
+        if not block_input:
+            return None
+
+        self._refresh_if_stale()
+
+        with self._lock:
+            if block_input in self._by_id:
+                return block_input, self._by_id[block_input]
+            if block_input in self._by_name:
+                return self._by_name[block_input], block_input
+
+        # Блок мог появиться после последней загрузки индекса
+        rows = self._fetch_by_id(block_input) or db_manager.execute_prepared(
+            'block_by_name', (block_input,), cursor_factory=tuple_cursor
+        )
+        if not rows:
+            return None
+
+        block_id, block_name = str(rows[0][0]), rows[0][1]
+        self.upsert(block_id, block_name)
+        return block_id, block_name
+
+    def get_name(self, block_id):
+        """Название блока по ID без обращения к БД"""
+        return self._by_id.get(str(block_id))
+
+    def block_ids(self):
+        """Все известные ID блоков"""
+        with self._lock:
+            return list(self._by_id)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def _rebuild(self):
+        """Перестроение структур поиска по текущему содержимому индекса"""
+        entries = sorted(self._by_id.items(), key=lambda item: ((item[1] or '').lower(), item[0]))
+        self._entries = entries
+        self._name_keys = [(name or '').lower() for _, name in entries]
+
+        self._id_order = sorted(range(len(entries)), key=lambda i: entries[i][0])
+        self._id_keys = [entries[i][0] for i in self._id_order]
+
+        # Одна строка вида "\0name\x01id\0name\x01id..." для поиска подстроки средствами str.find
+        offsets = []
+        parts = []
+        position = 0
+        for (block_id, _), name_key in zip(entries, self._name_keys):
+            offsets.append(position)
+            part = f"{_SEPARATOR}{name_key}\x01{block_id.lower()}"
+            parts.append(part)
+            position += len(part)
+        self._haystack = ''.join(parts)
+        self._offsets = offsets
+        self._dirty = False
+
+    def with_name_prefix(self, prefix):
+        """Все блоки, название которых начинается с префикса (пустой - все блоки)"""
+        prefix = (prefix or '').strip().lower()
+        self._refresh_if_stale()
+
+        with self._lock:
+            if self._dirty:
+                self._rebuild()
+            entries = self._entries
+            name_keys = self._name_keys
+
+        i = bisect.bisect_left(name_keys, prefix)
+        j = bisect.bisect_left(name_keys, prefix + '\uffff') if prefix else len(name_keys)
+        return [entries[k] for k in range(i, j)]
+
+    def suggest(self, query, limit=20):
+        """Поиск блоков по префиксу, затем по подстроке ID или названия"""
+        query = (query or '').strip().lower()
+        if not query or limit <= 0:
+            return []
+
+        self._refresh_if_stale()
+
+        with self._lock:
+            if self._dirty:
+                self._rebuild()
+            entries = self._entries
+            name_keys = self._name_keys
+            id_keys = self._id_keys
+            id_order = self._id_order
+            haystack = self._haystack
+            offsets = self._offsets
+
+        found = []
+        seen = set()
+
+        def add(index):
+            if index not in seen:
+                seen.add(index)
+                found.append(index)
+            return len(found) >= limit
+
+        # Совпадения по префиксу названия
+        i = bisect.bisect_left(name_keys, query)
+        while i < len(name_keys) and name_keys[i].startswith(query):
+            if add(i):
+                break
+            i += 1
+
+        # Совпадения по префиксу ID
+        if len(found) < limit:
+            i = bisect.bisect_left(id_keys, query)
+            while i < len(id_keys) and id_keys[i].startswith(query):
+                if add(id_order[i]):
+                    break
+                i += 1
+
+        # Совпадения по подстроке
+        position = haystack.find(query)
+        while position != -1 and len(found) < limit:
+            index = bisect.bisect_right(offsets, position) - 1
+            add(index)
+            # Переходим к следующей записи, чтобы не находить ту же повторно
+            next_start = offsets[index + 1] if index + 1 < len(offsets) else len(haystack)
+            position = haystack.find(query, next_start)
+
+        return [{'block_id': entries[i][0], 'block_name': entries[i][1]} for i in found[:limit]]
+
+block_index = BlockIndex()
@@ -0,0 +1,179 @@
+# bulk_export.py
+import logging
+import queue
+import tempfile
+import threading
+import time
+import zipfile
+from collections import namedtuple
+
+from app.models.columnar_export import StreamSink
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Готовящийся файл архива держится в памяти до этого размера, дальше - во временном файле
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Файл архива: имя внутри zip, функция produce(fileobj), пишущая содержимое,
+# и способ сжатия (уже сжатые форматы сохраняются без повторного сжатия)
+BulkEntry = namedtuple('BulkEntry', ['arcname', 'produce', 'compress_type'])
+
+class ExportCancelled(Exception):
+    """Клиент прервал скачивание архива"""
+
+class _StagedWriter:
+    """Файлоподобный приемник во временном буфере, прерывающий сборку после отмены"""
+
+    def __init__(self, staged, cancelled):
+        self._staged = staged
+        self._cancelled = cancelled
+        self.closed = False
+
+    def write(self, data):
+        if self._cancelled.is_set():
+            raise ExportCancelled()
+        return self._staged.write(data)
+
+    def tell(self):
+        return self._staged.tell()
+
+    def flush(self):
+        pass
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return False
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        self.closed = True
+
+class BulkZipExporter:
+    """Потоковая сборка ZIP архива из файлов нескольких блоков.
+
+    Файлы готовятся в фоновых потоках (не больше window вперед от текущего)
+    во временных буферах; потребитель пишет готовые файлы в архив по
+    порядку, сжимая на лету, и сразу отдает байты ответа. Вместо файла,
+    сборка которого упала, в архив пишется <имя>.error.txt. Общее число
+    одновременных выборок из БД по всем запросам ограничено семафором
+    db_slots. Поток держит слот только пока пишет свой буфер: к моменту
+    передачи файла потребителю курсор закрыт, а слот освобожден. Потребитель
+    ждет слот блокирующе только когда у него нет запущенных выборок - это
+    исключает взаимную блокировку между запросами.
+    """
+
+    def __init__(self, window=4, db_slots=4):
+        self.window = window
+        self.app = None
+        self._slots = threading.BoundedSemaphore(db_slots)
+
+    def init_app(self, app):
+        self.app = app
+        self.window = int(app.config.get('BULK_EXPORT_PARALLELISM', self.window))
+        self._slots = threading.BoundedSemaphore(int(app.config.get('BULK_EXPORT_DB_SLOTS', self.window)))
+
+    def _produce(self, entry, result, cancelled):
+        """Сборка файла в буфер под слотом БД; результат (буфер или ошибка) - в очередь result"""
+        staged = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            try:
+                with self.app.app_context():
+                    entry.produce(_StagedWriter(staged, cancelled))
+            finally:
+                self._slots.release()
+        except ExportCancelled:
+            staged.close()
+            return
+        except Exception as e:
+            staged.close()
+            logger.error(f"Bulk export of {entry.arcname} failed: {e}")
+            result.put(e)
+            return
+
+        if cancelled.is_set():
+            staged.close()
+            return
+        staged.seek(0)
+        # В очереди одно место на один результат: put не ждет
+        result.put(staged)
+
+    def stream(self, entries):
+        """Генератор байтов ZIP архива"""
+        entries = list(entries)
+        cancelled = threading.Event()
+        started = {}
+        next_to_start = 0
+        errors = []
+        files = 0
+        begin = time.monotonic()
+
+        def start(index, blocking):
+            if not self._slots.acquire(blocking=blocking):
+                return False
+            result = queue.Queue(maxsize=1)
+            started[index] = result
+            threading.Thread(
+                target=self._produce,
+                args=(entries[index], result, cancelled),
+                name='bulk-export',
+                daemon=True
+            ).start()
+            return True
+
+        sink = StreamSink()
+        archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED)
+        try:
+            for index, entry in enumerate(entries):
+                if index not in started:
+                    # Запущенных выборок нет - можно ждать слот
+                    start(index, blocking=True)
+                    next_to_start = index + 1
+                while next_to_start < min(len(entries), index + self.window) and start(next_to_start, blocking=False):
+                    next_to_start += 1
+
+                # Упавший файл не попадает в архив обрезанным: пишется только готовый буфер
+                item = started.pop(index).get()
+                if isinstance(item, Exception):
+                    errors.append(f"{entry.arcname}: {item}")
+                    archive.writestr(f"{entry.arcname}.error.txt", f"{item}\n")
+                else:
+                    with item as staged:
+                        info = zipfile.ZipInfo(entry.arcname, date_time=time.localtime()[:6])
+                        info.compress_type = entry.compress_type
+                        with archive.open(info, 'w', force_zip64=True) as member:
+                            while True:
+                                block = staged.read(CHUNK_SIZE)
+                                if not block:
+                                    break
+                                member.write(block)
+                                data = sink.drain()
+                                if data:
+                                    yield data
+                    files += 1
+                yield sink.drain()
+
+            if errors:
+                archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+            archive.close()
+            yield sink.drain()
+            logger.info(f"Bulk export streamed {files} files ({len(errors)} failed) "
+                        f"in {time.monotonic() - begin:.1f}s")
+        finally:
+            # При обрыве соединения фоновые потоки завершаются по флагу отмены,
+            # а уже готовые буферы закрываются
+            cancelled.set()
+            for result in started.values():
+                try:
+                    item = result.get_nowait()
+                except queue.Empty:
+                    continue
+                if not isinstance(item, Exception):
+                    item.close()
+
+bulk_exporter = BulkZipExporter()
@@ -0,0 +1,274 @@
+# columnar_export.py
+import logging
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - формат недоступен без pyarrow
+    pa = pc = pq = None
+
+from app.models.database import db_manager
+from app.models.deviation_frame import SOURCES
+
+logger = logging.getLogger(__name__)
+
+# Поддерживаемые колоночные форматы: MIME тип и расширение файла
+COLUMNAR_FORMATS = {
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+DEFAULT_BATCH_SIZE = 10000
+
+# OID типов PostgreSQL -> типы Arrow
+_PG_INT_OIDS = {20, 21, 23}
+_PG_FLOAT_OIDS = {700, 701, 1700}
+_PG_BOOL_OID = 16
+_PG_DATE_OID = 1082
+_PG_TIMESTAMP_OIDS = {1114, 1184}
+
+def is_available():
+    """Доступны ли колоночные форматы (установлен ли pyarrow)"""
+    return pa is not None
+
+def _arrow_type(type_code):
+    if type_code in _PG_INT_OIDS:
+        return pa.int64()
+    if type_code in _PG_FLOAT_OIDS:
+        return pa.float64()
+    if type_code == _PG_BOOL_OID:
+        return pa.bool_()
+    if type_code == _PG_DATE_OID:
+        return pa.date32()
+    if type_code in _PG_TIMESTAMP_OIDS:
+        return pa.timestamp('us')
+    return pa.string()
+
+def schema_from_description(description):
+    """Схема Arrow по описанию колонок курсора"""
+    return pa.schema([pa.field(desc[0], _arrow_type(desc[1])) for desc in description])
+
+def _column(values, arrow_type):
+    """Типизированная колонка из значений строки результата"""
+    if pa.types.is_string(arrow_type):
+        values = [str(v) if v is not None else None for v in values]
+    return pa.array(values, type=arrow_type)
+
+def _batch_from_tuples(rows, schema):
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    return pa.record_batch([_column(values, field.type) for values, field in zip(columns, schema)], schema=schema)
+
+class StreamSink:
+    """Файлоподобный приемник, отдающий накопленные байты по частям"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+class ColumnarWriter:
+    """Запись пачек строк в Arrow IPC stream или Parquet (пачка - группа строк)"""
+
+    def __init__(self, format_type, schema, sink):
+        self.format_type = format_type
+        self.schema = schema
+        if format_type == 'arrow':
+            self._writer = pa.ipc.new_stream(sink, schema)
+        elif format_type == 'parquet':
+            self._writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        else:
+            raise ValueError(f"Unsupported columnar format: {format_type}")
+
+    def write_batch(self, batch):
+        if batch.num_rows == 0:
+            return
+        if self.format_type == 'arrow':
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write_table(pa.Table.from_batches([batch]))
+
+    def close(self):
+        self._writer.close()
+
+def stream_cursor(cursor, format_type, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Потоковая запись результата курсора: байты отдаются после каждой пачки.
+
+    progress(n) вызывается с числом строк каждой записанной пачки.
+    NUMERIC должен декодироваться курсором во float (numeric_as_float).
+    """
+    # У именованного курсора описание колонок появляется после первой выборки
+    rows = cursor.fetchmany(batch_size)
+    schema = schema_from_description(cursor.description)
+    sink = StreamSink()
+    writer = ColumnarWriter(format_type, schema, sink)
+
+    total = 0
+    while rows:
+        writer.write_batch(_batch_from_tuples(rows, schema))
+        total += len(rows)
+        if progress is not None:
+            progress(len(rows))
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+        rows = cursor.fetchmany(batch_size)
+
+    writer.close()
+    yield sink.drain()
+    logger.info(f"Streamed {total} rows as {format_type}")
+
+def stream_query(query, params, format_type, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Потоковый экспорт запроса через серверный курсор"""
+    with db_manager.get_server_cursor('columnar_export', batch_size, numeric_as_float=True) as cursor:
+        cursor.execute(query, params or ())
+        yield from stream_cursor(cursor, format_type, batch_size, progress)
+
+def stream_deviation_frame(frame, format_type):
+    """Экспорт отклонений блока: одна строка на скважину, колонки - метрики"""
+    columns = [column for _, source_columns in SOURCES.values() for column in source_columns]
+    arrays = [pa.array(frame.names, type=pa.string())]
+    for column in columns:
+        values = frame.columns[column]
+        # Массив array('d') передается в Arrow без копирования, NaN -> null
+        array = pa.Array.from_buffers(pa.float64(), len(values), [None, pa.py_buffer(values)])
+        arrays.append(pc.if_else(pc.is_nan(array), pa.scalar(None, pa.float64()), array))
+
+    schema = pa.schema([pa.field('borehole_name', pa.string())] + [pa.field(c, pa.float64()) for c in columns])
+    sink = StreamSink()
+    writer = ColumnarWriter(format_type, schema, sink)
+    batch = pa.record_batch(arrays, schema=schema)
+    for offset in range(0, batch.num_rows, DEFAULT_BATCH_SIZE):
+        writer.write_batch(batch.slice(offset, DEFAULT_BATCH_SIZE))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def critical_schema():
+    """Схема критических отклонений (DeviationFrame.critical_export_rows()).
+
+    Порог - число у отклонений расстояния и строка ('10%', '5°') у
+    остальных, поэтому задается строкой; planned и percent_deviation есть
+    только у отклонений длины и диаметра.
+    """
+    return pa.schema([
+        pa.field('borehole_name', pa.string()),
+        pa.field('type', pa.string()),
+        pa.field('deviation', pa.float64()),
+        pa.field('planned', pa.float64()),
+        pa.field('percent_deviation', pa.float64()),
+        pa.field('threshold', pa.string()),
+        pa.field('is_critical', pa.bool_()),
+    ])
+
+def _value_kind(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    # float и Decimal
+    if isinstance(value, float) or hasattr(value, 'as_integer_ratio'):
+        return 'float'
+    if isinstance(value, datetime):
+        return 'timestamp'
+    return 'string'
+
+def _record_type(values):
+    """Тип колонки по значениям: int и float - float64, другие смешанные типы - строка"""
+    kinds = {_value_kind(value) for value in values if value is not None}
+    if kinds == {'int', 'float'}:
+        return pa.float64()
+    if len(kinds) != 1:
+        return pa.string()
+    return {
+        'bool': pa.bool_(),
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'timestamp': pa.timestamp('us'),
+        'string': pa.string(),
+    }[kinds.pop()]
+
+def _record_column(values, arrow_type):
+    """Колонка из значений словарей с приведением к типу схемы (Decimal -> float)"""
+    if pa.types.is_floating(arrow_type):
+        values = [float(v) if v is not None else None for v in values]
+    elif pa.types.is_integer(arrow_type):
+        values = [int(v) if v is not None else None for v in values]
+    elif pa.types.is_string(arrow_type):
+        values = [str(v) if v is not None else None for v in values]
+    return pa.array(values, type=arrow_type)
+
+def schema_from_records(records):
+    """Схема по объединению ключей и типам значений всех записей"""
+    keys = list(dict.fromkeys(key for record in records for key in record))
+    return pa.schema([pa.field(key, _record_type([record.get(key) for record in records])) for key in keys])
+
+def stream_records(records, format_type, batch_size=DEFAULT_BATCH_SIZE, schema=None):
+    """Потоковый экспорт словарей.
+
+    Без schema схема выводится по первой пачке; ключи, появившиеся только в
+    следующих пачках, в файл не попадают, поэтому для записей с заранее
+    известным набором колонок схему нужно передавать явно.
+    """
+    records = iter(records)
+    writer = None
+    sink = StreamSink()
+
+    while True:
+        chunk = [record for _, record in zip(range(batch_size), records)]
+        if not chunk:
+            break
+        if writer is None:
+            writer = ColumnarWriter(format_type, schema or schema_from_records(chunk), sink)
+        arrays = [_record_column([record.get(field.name) for record in chunk], field.type) for field in writer.schema]
+        writer.write_batch(pa.record_batch(arrays, schema=writer.schema))
+        yield sink.drain()
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+def primed(chunks):
+    """Запуск генератора до первого фрагмента, чтобы ошибки запроса возникли до начала ответа"""
+    first = next(chunks)
+
+    def generate():
+        try:
+            yield first
+            yield from chunks
+        finally:
+            chunks.close()
+
+    return generate()
+
+def download_name(report_type, format_type):
+    """Имя файла выгрузки"""
+    extension = COLUMNAR_FORMATS[format_type][1]
+    return f"{report_type}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
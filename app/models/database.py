@@ -1,9 +1,14 @@
 # database.py
 import psycopg2
 from psycopg2 import sql
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import connection as pg_connection
+from psycopg2.extensions import DECIMAL, new_type, register_type
 from psycopg2.extras import RealDictCursor
 import logging
 import os
+import threading
+import time
 from contextlib import contextmanager
 from dotenv import load_dotenv
 
@@ -13,10 +18,62 @@ load_dotenv('config.env')
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+def _cast_float(value, cursor):
+    return float(value) if value is not None else None
+
+# Декодирование NUMERIC сразу во float вместо Decimal (включается на курсоре)
+NUMERIC_AS_FLOAT = new_type(DECIMAL.values, 'NUMERIC_AS_FLOAT', _cast_float)
+
+def register_float_types(scope, oids=None):
+    """Декодирование NUMERIC (или перечисленных OID типов) во float для курсора или соединения"""
+    caster = NUMERIC_AS_FLOAT if oids is None else new_type(tuple(oids), 'FLOAT_COLUMNS', _cast_float)
+    register_type(caster, scope)
+
+class PooledConnection(pg_connection):
+    """Соединение пула, помнящее подготовленные на нем запросы"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+class RetainingConnectionPool(pg_pool.ThreadedConnectionPool):
+    """Пул, который хранит возвращенные соединения и ждет свободного.
+
+    ThreadedConnectionPool оставляет возвращенное соединение, только пока
+    в пуле меньше minconn, остальные закрывает - вместе с подготовленными
+    на них запросами. Здесь хранятся до maxconn соединений (открываются по
+    мере надобности), а при исчерпании getconn ждет возврата соединения до
+    wait_timeout секунд вместо немедленного PoolError.
+    """
+
+    def __init__(self, minconn, maxconn, *args, wait_timeout=30, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        # Порог хранения в _putconn; при создании открыто только minconn соединений
+        self.minconn = maxconn
+        self.wait_timeout = wait_timeout
+        self._available = threading.Condition(self._lock)
+
+    def getconn(self, key=None):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._available:
+            while not self._pool and len(self._used) >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise pg_pool.PoolError(f"No free database connection within {self.wait_timeout}s")
+                self._available.wait(remaining)
+            return self._getconn(key)
+
+    def putconn(self, conn=None, key=None, close=False):
+        with self._available:
+            self._putconn(conn, key, close)
+            self._available.notify()
+
 class DatabaseManager:
     def __init__(self, app=None):
         self.app = app
         self.db_config = self._load_config()
+        self._pool = None
+        self._pool_config = None
+        self._pool_lock = threading.Lock()
     
     def _load_config(self):
         """Загрузка конфигурации БД"""
@@ -46,34 +103,77 @@ class DatabaseManager:
         except RuntimeError:
             return self.db_config
     
+    def _get_pool(self, db_config):
+        """Пул соединений для текущей конфигурации БД"""
+        with self._pool_lock:
+            if self._pool is None or self._pool_config != db_config:
+                if self._pool is not None:
+                    self._pool.closeall()
+                logger.info(f"Creating connection pool: {db_config['host']}:{db_config['port']}")
+                # Запас на фоновые потоки: задачи выгрузки, прогноз, статистика отклонений
+                self._pool = RetainingConnectionPool(
+                    int(os.getenv('DB_POOL_MIN', '0')),
+                    int(os.getenv('DB_POOL_MAX', '20')),
+                    wait_timeout=float(os.getenv('DB_POOL_WAIT', '30')),
+                    connection_factory=PooledConnection,
+                    connect_timeout=10,
+                    **db_config
+                )
+                self._pool_config = dict(db_config)
+            return self._pool
+    
     @contextmanager
     def get_connection(self):
-        """Контекстный менеджер для соединения с БД"""
+        """Контекстный менеджер для соединения с БД (из пула)"""
         conn = None
+        pool = None
+        broken = False
         try:
             db_config = self.get_db_config()
-            logger.info(f"Connecting to database: {db_config['host']}:{db_config['port']}")
-            
-            conn = psycopg2.connect(
-                **db_config,
-                connect_timeout=10
-            )
+            pool = self._get_pool(db_config)
+            conn = pool.getconn()
             yield conn
         except psycopg2.OperationalError as e:
+            broken = True
             logger.error(f"Database connection failed: {e}")
             raise Exception(f"Unable to connect to database: {e}")
         except psycopg2.Error as e:
             logger.error(f"Database error: {e}")
             raise
         finally:
-            if conn:
-                conn.close()
+            if conn is not None:
+                # Незавершенная транзакция откатывается пулом при возврате
+                pool.putconn(conn, close=broken or bool(conn.closed))
+    
+    def _numeric_as_float(self, numeric_as_float):
+        """Явный флаг курсора или значение DB_NUMERIC_AS_FLOAT из конфигурации"""
+        if numeric_as_float is not None:
+            return numeric_as_float
+        try:
+            from flask import current_app
+            return bool(current_app.config.get('DB_NUMERIC_AS_FLOAT', False))
+        except RuntimeError:
+            return False
+    
+    def _prepare_cursor(self, cursor, numeric_as_float, float_types):
+        if self._numeric_as_float(numeric_as_float):
+            register_float_types(cursor)
+        if float_types:
+            register_float_types(cursor, float_types)
+        return cursor
     
     @contextmanager
-    def get_cursor(self, cursor_factory=None):
-        """Контекстный менеджер для курсора"""
+    def get_cursor(self, cursor_factory=None, numeric_as_float=None, float_types=None):
+        """Контекстный менеджер для курсора.
+
+        numeric_as_float - декодировать NUMERIC во float на уровне драйвера,
+        float_types - OID дополнительных типов, приводимых к float.
+        """
         with self.get_connection() as conn:
-            cursor = conn.cursor(cursor_factory=cursor_factory or RealDictCursor)
+            cursor = self._prepare_cursor(
+                conn.cursor(cursor_factory=cursor_factory or RealDictCursor),
+                numeric_as_float, float_types
+            )
             try:
                 yield cursor
                 conn.commit()
@@ -84,15 +184,36 @@ class DatabaseManager:
             finally:
                 cursor.close()
     
-    def execute_query(self, query, params=None, cursor_factory=None):
+    @contextmanager
+    def get_server_cursor(self, name, itersize=2000, numeric_as_float=None):
+        """Серверный (именованный) курсор для выборки больших результатов пачками"""
+        with self.get_connection() as conn:
+            cursor = self._prepare_cursor(conn.cursor(name=name), numeric_as_float, None)
+            cursor.itersize = itersize
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+    
+    def execute_query(self, query, params=None, cursor_factory=None, numeric_as_float=None):
         """Выполнить запрос и вернуть результаты"""
-        with self.get_cursor(cursor_factory) as cursor:
+        with self.get_cursor(cursor_factory, numeric_as_float) as cursor:
             cursor.execute(query, params or ())
             if cursor.description:  # Если есть результаты
                 return cursor.fetchall()
             return None
     
-    def execute_function(self, function_name, params=None):
+    def execute_prepared(self, name, params=None, cursor_factory=None, numeric_as_float=None):
+        """Выполнить горячий запрос из реестра подготовленных запросов"""
+        from app.models.prepared_statements import prepared_statements
+        
+        with self.get_cursor(cursor_factory, numeric_as_float) as cursor:
+            prepared_statements.execute(cursor, name, params or ())
+            if cursor.description:
+                return cursor.fetchall()
+            return None
+    
+    def execute_function(self, function_name, params=None, numeric_as_float=None):
         """Выполнить PostgreSQL функцию"""
         try:
             if params:
@@ -101,10 +222,10 @@ class DatabaseManager:
                     sql.Identifier(function_name),
                     sql.SQL(placeholders)
                 )
-                return self.execute_query(query, params)
+                return self.execute_query(query, params, numeric_as_float=numeric_as_float)
             else:
                 query = sql.SQL("SELECT * FROM {}()").format(sql.Identifier(function_name))
-                return self.execute_query(query)
+                return self.execute_query(query, numeric_as_float=numeric_as_float)
         except Exception as e:
             logger.error(f"Error executing function {function_name}: {e}")
             raise
@@ -0,0 +1,127 @@
+# deviation_engine.py
+import logging
+
+import numpy as np
+
+from app.models.deviation_frame import DeviationFrame
+
+logger = logging.getLogger(__name__)
+
+PLANNED_T = 2
+ACTUAL_T = 3
+
+# Колонки Boreholes в порядке выборки после имени и типа
+FIELDS = ('x', 'y', 'z', 'length', 'diameter', 'angle', 'azimuth')
+
+BOREHOLES_QUERY = """
+    SELECT "Name", "T", "X", "Y", "Z", "Length", "Diameter", "Angle", "Azimuth"
+    FROM public."Boreholes"
+    WHERE "BlockID" = %s AND "T" IN (2, 3){condition}
+    ORDER BY "Name"
+"""
+
+def azimuth_difference(planned, actual):
+    """Наименьший угол между азимутами с учетом перехода через 0/360 (0..180)"""
+    return np.abs((actual - planned + 180.0) % 360.0 - 180.0)
+
+def toe_points(x, y, z, length, angle, azimuth):
+    """Координаты забоев: угол от вертикали, азимут в плане (как в 3D виде дашборда)"""
+    angle = np.radians(np.nan_to_num(angle))
+    azimuth = np.radians(np.nan_to_num(azimuth))
+    horizontal = length * np.sin(angle)
+    return np.stack((
+        x + horizontal * np.cos(azimuth),
+        y + horizontal * np.sin(azimuth),
+        z - length * np.cos(angle)
+    ), axis=-1)
+
+def compute(names, planned, actual):
+    """Все метрики отклонений одним векторным проходом.
+
+    planned и actual - словари колонок FIELDS (массивы float, NULL - NaN)
+    для пар проектная/фактическая скважина с одинаковыми именами.
+    Возвращает колонки DeviationFrame.
+    """
+    with np.errstate(invalid='ignore'):
+        columns = {
+            'planned_x': planned['x'],
+            'planned_y': planned['y'],
+            'actual_x': actual['x'],
+            'actual_y': actual['y'],
+            'deviation': np.hypot(actual['x'] - planned['x'], actual['y'] - planned['y']),
+            'planned_length': planned['length'],
+            'actual_length': actual['length'],
+            'length_diff': actual['length'] - planned['length'],
+            'planned_diameter': planned['diameter'],
+            'actual_diameter': actual['diameter'],
+            'diameter_diff': actual['diameter'] - planned['diameter'],
+            'planned_angle': planned['angle'],
+            'actual_angle': actual['angle'],
+            'angle_diff': actual['angle'] - planned['angle'],
+            'planned_azimuth': planned['azimuth'],
+            'actual_azimuth': actual['azimuth'],
+            'azimuth_diff': azimuth_difference(planned['azimuth'], actual['azimuth'])
+        }
+        planned_toe = toe_points(*(planned[field] for field in ('x', 'y', 'z', 'length', 'angle', 'azimuth')))
+        actual_toe = toe_points(*(actual[field] for field in ('x', 'y', 'z', 'length', 'angle', 'azimuth')))
+        columns['toe_offset'] = np.linalg.norm(actual_toe - planned_toe, axis=1)
+    return columns
+
+def pair_rows(rows):
+    """Пары проектная/фактическая скважина по имени из строк BOREHOLES_QUERY.
+
+    Как соединение по имени в SQL функциях calc_*_deviations: при повторах
+    имени каждая проектная строка образует пару с каждой фактической.
+    """
+    planned_rows = {}
+    actual_rows = {}
+    for row in rows:
+        name = row[0]
+        if name is None:
+            continue
+        target = planned_rows if row[1] == PLANNED_T else actual_rows
+        target.setdefault(str(name), []).append(row[2:])
+
+    names = []
+    planned = []
+    actual = []
+    for name, planned_values in planned_rows.items():
+        for planned_row in planned_values:
+            for actual_row in actual_rows.get(name, ()):
+                names.append(name)
+                planned.append(planned_row)
+                actual.append(actual_row)
+
+    def columns(source):
+        values = np.array(source, dtype=float).reshape(len(names), len(FIELDS))
+        return {field: values[:, i] for i, field in enumerate(FIELDS)}
+
+    return names, columns(planned), columns(actual)
+
+class DeviationEngine:
+    """Расчет отклонений блока в процессе приложения.
+
+    Вместо четырех SQL функций calc_*_deviations, каждая из которых заново
+    читает и сопоставляет строки Boreholes, строки блока читаются один раз,
+    сопоставляются по имени и все метрики считаются массивами NumPy.
+    Колонки полезной длины и перебура в Boreholes не хранятся и остаются
+    пустыми; дополнительно считается смещение забоя в 3D (toe_offset).
+    Включается настройкой DEVIATION_ENGINE=python.
+    """
+
+    def __init__(self):
+        self.enabled = False
+
+    def init_app(self, app):
+        self.enabled = app.config.get('DEVIATION_ENGINE', 'sql') == 'python'
+
+    def load(self, cursor, block_id, borehole_name=None):
+        """DeviationFrame блока (или одной скважины) по одной выборке Boreholes"""
+        if borehole_name is None:
+            cursor.execute(BOREHOLES_QUERY.format(condition=''), (block_id,))
+        else:
+            cursor.execute(BOREHOLES_QUERY.format(condition=' AND "Name" = %s'), (block_id, borehole_name))
+        names, planned, actual = pair_rows(cursor.fetchall())
+        return DeviationFrame.from_columns(names, compute(names, planned, actual))
+
+deviation_engine = DeviationEngine()
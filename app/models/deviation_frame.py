@@ -0,0 +1,391 @@
+# deviation_frame.py
+from array import array
+from contextlib import contextmanager
+from itertools import chain
+
+NAN = float('nan')
+
+# Источники отклонений: SQL функция и ее числовые колонки (после borehole_name)
+SOURCES = {
+    'distance': ('calc_distance_deviations',
+                 ('planned_x', 'planned_y', 'actual_x', 'actual_y', 'deviation')),
+    'length': ('calc_length_deviations',
+               ('planned_length', 'actual_length', 'length_diff',
+                'useful_length_planned', 'useful_length_actual', 'useful_length_diff')),
+    'diameter': ('calc_diameter_deviations',
+                 ('planned_diameter', 'actual_diameter', 'diameter_diff',
+                  'overboring_planned', 'overboring_actual', 'overboring_diff')),
+    'direction': ('calc_direction_deviations',
+                  ('planned_angle', 'actual_angle', 'angle_diff',
+                   'planned_azimuth', 'actual_azimuth', 'azimuth_diff')),
+}
+
+# Колонки, которые считает только расчет в приложении (app/models/deviation_engine.py)
+DERIVED_COLUMNS = ('toe_offset',)
+
+def _to_float(value):
+    if value is None:
+        return NAN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+def _is_set(value):
+    """Аналог проверки `if value` для исходных строк: не NULL и не ноль"""
+    return value == value and value != 0
+
+def _or_none(value):
+    return None if value != value else value
+
+def _or_zero(value):
+    return 0.0 if value != value else value
+
+def _source_rows(source, description, records):
+    """Строки источника (name, values...) из строк его SQL функции; NULL - NaN"""
+    columns = SOURCES[source][1]
+    positions = {desc[0]: i for i, desc in enumerate(description)}
+    name_pos = positions.get('borehole_name', 0)
+    value_pos = [positions.get(column, i + 1) for i, column in enumerate(columns)]
+
+    for record in records:
+        name = record[name_pos]
+        if name is None:
+            continue
+        yield (str(name),) + tuple(_to_float(record[p]) if p < len(record) else NAN for p in value_pos)
+
+def export_rows(rows):
+    """Строки отклонений для экспорта; rows(source) - строки источника (name, values...)"""
+    for name, planned_x, planned_y, actual_x, actual_y, deviation in rows('distance'):
+        yield {
+            'borehole_name': name,
+            'type': 'distance',
+            'planned_x': _or_zero(planned_x),
+            'planned_y': _or_zero(planned_y),
+            'actual_x': _or_zero(actual_x),
+            'actual_y': _or_zero(actual_y),
+            'deviation': _or_zero(deviation)
+        }
+    for source in ('length', 'diameter'):
+        for name, planned, actual, diff, *_ in rows(source):
+            yield {
+                'borehole_name': name,
+                'type': source,
+                'planned': _or_zero(planned),
+                'actual': _or_zero(actual),
+                'deviation': _or_zero(diff)
+            }
+    for name, angle_planned, angle_actual, angle_diff, azimuth_planned, azimuth_actual, azimuth_diff in rows('direction'):
+        yield {
+            'borehole_name': name,
+            'type': 'direction',
+            'angle_planned': _or_zero(angle_planned),
+            'angle_actual': _or_zero(angle_actual),
+            'angle_deviation': _or_zero(angle_diff),
+            'azimuth_planned': _or_zero(azimuth_planned),
+            'azimuth_actual': _or_zero(azimuth_actual),
+            'azimuth_deviation': _or_zero(azimuth_diff)
+        }
+
+def critical_export_rows(rows):
+    """Критические отклонения для экспорта: расстояние > 5 м, длина и диаметр > 10%, угол > 5°, азимут > 10°"""
+    for name, *_, deviation in rows('distance'):
+        deviation = _or_zero(deviation)
+        if deviation and abs(deviation) > 5:
+            yield {
+                'borehole_name': name,
+                'type': 'distance',
+                'deviation': deviation,
+                'threshold': 5,
+                'is_critical': True
+            }
+
+    for source in ('length', 'diameter'):
+        for name, planned, _, diff, *_ in rows(source):
+            planned, diff = _or_zero(planned), _or_zero(diff)
+            if planned and diff:
+                percent_deviation = abs(diff / planned) * 100
+                if percent_deviation > 10:
+                    yield {
+                        'borehole_name': name,
+                        'type': source,
+                        'deviation': diff,
+                        'planned': planned,
+                        'percent_deviation': round(percent_deviation, 1),
+                        'threshold': '10%',
+                        'is_critical': True
+                    }
+
+    for name, _, _, angle_diff, _, _, azimuth_diff in rows('direction'):
+        angle_diff, azimuth_diff = _or_zero(angle_diff), _or_zero(azimuth_diff)
+        if angle_diff and abs(angle_diff) > 5:
+            yield {
+                'borehole_name': name,
+                'type': 'angle',
+                'deviation': angle_diff,
+                'threshold': '5°',
+                'is_critical': True
+            }
+        if azimuth_diff and abs(azimuth_diff) > 10:
+            yield {
+                'borehole_name': name,
+                'type': 'azimuth',
+                'deviation': azimuth_diff,
+                'threshold': '10°',
+                'is_critical': True
+            }
+
+class DeviationFrame:
+    """Колоночное хранилище отклонений скважин одного блока.
+
+    Каждая метрика хранится в типизированном массиве array('d'), NULL - NaN.
+    Строка соответствует скважине (индекс name -> row), а для каждого
+    источника хранится порядок его строк, чтобы выдача совпадала с порядком
+    строк SQL функций. Повтор имени в одном источнике получает отдельную
+    строку вне индекса: выгрузки отдают обе строки, а поиск по имени, как
+    и раньше, - первую.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.columns = {
+            column: array('d')
+            for _, columns in SOURCES.values()
+            for column in columns
+        }
+        for column in DERIVED_COLUMNS:
+            self.columns[column] = array('d')
+        self.order = {source: array('l') for source in SOURCES}
+        self._seen = {source: set() for source in SOURCES}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _row(self, source, name):
+        row = self.index.get(name)
+        if row is None or name in self._seen[source]:
+            row = len(self.names)
+            self.index.setdefault(name, row)
+            self.names.append(name)
+            for values in self.columns.values():
+                values.append(NAN)
+        self._seen[source].add(name)
+        return row
+
+    def add(self, source, name, values):
+        """Добавление строки источника: values в порядке колонок SOURCES"""
+        row = self._row(source, name)
+        self.order[source].append(row)
+        for column, value in zip(SOURCES[source][1], values):
+            self.columns[column][row] = _to_float(value)
+
+    def fill(self, source, cursor):
+        """Заполнение из курсора, выполнившего функцию источника"""
+        for name, *values in _source_rows(source, cursor.description, cursor.fetchall()):
+            self.add(source, name, values)
+
+    @classmethod
+    def from_columns(cls, names, columns):
+        """Набор из готовых колонок: все источники содержат все строки в порядке names"""
+        frame = cls()
+        frame.names = list(names)
+        for row, name in enumerate(frame.names):
+            frame.index.setdefault(name, row)
+        for column, values in frame.columns.items():
+            source = columns.get(column)
+            if source is None:
+                values.extend([NAN] * len(frame.names))
+            else:
+                values.frombytes(source.astype('d').tobytes())
+        for source, order in frame.order.items():
+            order.extend(range(len(frame.names)))
+            frame._seen[source].update(frame.names)
+        return frame
+
+    @classmethod
+    def load(cls, cursor, block_id, borehole_name=None):
+        """Загрузка отклонений блока (или одной скважины) одним проходом по курсору"""
+        from app.models.database import register_float_types
+        from app.models.deviation_engine import deviation_engine
+
+        # NUMERIC декодируется драйвером сразу во float, без промежуточных Decimal
+        register_float_types(cursor)
+        if deviation_engine.enabled:
+            return deviation_engine.load(cursor, block_id, borehole_name)
+        frame = cls()
+        for source, (function, _) in SOURCES.items():
+            if borehole_name is None:
+                cursor.execute(f"SELECT * FROM public.{function}(%s)", (block_id,))
+            else:
+                cursor.execute(f"SELECT * FROM public.{function}(%s) WHERE borehole_name = %s",
+                               (block_id, borehole_name))
+            frame.fill(source, cursor)
+        return frame
+
+    @classmethod
+    def fetch(cls, block_id, borehole_name=None):
+        """Загрузка отклонений на отдельном соединении из пула"""
+        from app.models.database import db_manager
+
+        with db_manager.get_connection() as conn:
+            with conn.cursor() as cursor:
+                return cls.load(cursor, block_id, borehole_name)
+
+    @classmethod
+    @contextmanager
+    def streamed(cls, block_id, itersize=2000):
+        """rows(source) блока для export_rows() без сборки набора в памяти.
+
+        Строки SQL функции источника читаются серверным курсором по мере
+        обхода. Расчет в приложении (DEVIATION_ENGINE=python) сопоставляет
+        строки блока все сразу, поэтому отдает строки загруженного набора.
+        """
+        from app.models.database import db_manager, register_float_types
+        from app.models.deviation_engine import deviation_engine
+
+        if deviation_engine.enabled:
+            yield cls.fetch(block_id).rows
+            return
+
+        with db_manager.get_connection() as conn:
+            def rows(source):
+                with conn.cursor(name=f"deviations_{source}") as cursor:
+                    cursor.itersize = itersize
+                    register_float_types(cursor)
+                    cursor.execute(f"SELECT * FROM public.{SOURCES[source][0]}(%s)", (block_id,))
+                    # Описание колонок серверного курсора известно после первой пачки
+                    records = iter(cursor)
+                    first = next(records, None)
+                    if first is not None:
+                        yield from _source_rows(source, cursor.description, chain((first,), records))
+            yield rows
+
+    def value(self, name, column):
+        """Значение метрики скважины или None"""
+        row = self.index.get(name)
+        if row is None:
+            return None
+        return _or_none(self.columns[column][row])
+
+    def rows(self, source):
+        """Строки источника в исходном порядке: (name, values...)"""
+        columns = [self.columns[column] for column in SOURCES[source][1]]
+        for row in self.order[source]:
+            yield (self.names[row],) + tuple(values[row] for values in columns)
+
+    def charts_data(self):
+        """Данные графиков отклонений для дашборда"""
+        charts = {
+            'dist_deviations': [],
+            'length_deviations': [],
+            'diameter_deviations': [],
+            'angle_deviations': [],
+            'azimuth_deviations': []
+        }
+        for name, _, _, _, _, deviation in self.rows('distance'):
+            if name and deviation == deviation:
+                charts['dist_deviations'].append({'name': name, 'deviation': deviation})
+        for name, _, _, diff, *_ in self.rows('length'):
+            if name and diff == diff:
+                charts['length_deviations'].append({'name': name, 'diff': diff})
+        for name, _, _, diff, *_ in self.rows('diameter'):
+            if name and diff == diff:
+                charts['diameter_deviations'].append({'name': name, 'diff': diff})
+        for name, _, _, angle_diff, _, _, azimuth_diff in self.rows('direction'):
+            if not name:
+                continue
+            if angle_diff == angle_diff:
+                charts['angle_deviations'].append({'name': name, 'diff': angle_diff})
+            if azimuth_diff == azimuth_diff:
+                charts['azimuth_deviations'].append({'name': name, 'diff': azimuth_diff})
+        return charts
+
+    def critical_deviations(self):
+        """Критические отклонения для дашборда: расстояние > 5 м, остальное > 10%"""
+        critical = {
+            'dist': [],
+            'length': [],
+            'diameter': [],
+            'angle': [],
+            'azimuth': []
+        }
+
+        for name, _, _, _, _, deviation in self.rows('distance'):
+            if _is_set(deviation) and deviation > 5:
+                critical['dist'].append({'name': name, 'deviation': deviation})
+
+        for source, key in (('length', 'length'), ('diameter', 'diameter'), ('direction', 'angle')):
+            for name, planned, actual, diff, *_ in self.rows(source):
+                if _is_set(planned) and _is_set(actual) and _is_set(diff) and abs(diff) > planned * 0.1:
+                    critical[key].append({
+                        'name': name,
+                        'diff': diff,
+                        'percent': round(abs(diff) / planned * 100, 1)
+                    })
+
+        for name, _, _, _, planned_azimuth, actual_azimuth, azimuth_diff in self.rows('direction'):
+            if _is_set(planned_azimuth) and _is_set(actual_azimuth) and azimuth_diff == azimuth_diff:
+                if azimuth_diff > planned_azimuth * 0.1 or azimuth_diff > (360 - planned_azimuth) * 0.1:
+                    critical['azimuth'].append({
+                        'name': name,
+                        'diff': azimuth_diff,
+                        'percent': round(azimuth_diff / planned_azimuth * 100, 1)
+                    })
+
+        return critical
+
+    def export_rows(self):
+        """Строки отклонений для экспорта данных блока"""
+        return export_rows(self.rows)
+
+    def critical_export_rows(self):
+        """Критические отклонения для экспорта"""
+        return critical_export_rows(self.rows)
+
+    def borehole(self, name):
+        """Данные страницы деталей скважины"""
+        row = self.index.get(name)
+
+        def get(column, default=None):
+            if row is None:
+                return default
+            value = self.columns[column][row]
+            return default if value != value else value
+
+        def has(source):
+            return name in self._seen[source]
+
+        return {
+            'name': name,
+            'dist': {
+                'planned': (get('planned_x', 0), get('planned_y', 0)),
+                'actual': (get('actual_x', 0), get('actual_y', 0)),
+                'deviation': get('deviation', 0),
+                'toe_offset': get('toe_offset')
+            } if has('distance') else None,
+            'length': {
+                'planned': get('planned_length', 0.0),
+                'actual': get('actual_length', 0.0),
+                'diff': get('length_diff', 0.0),
+                'useful_planned': get('useful_length_planned'),
+                'useful_actual': get('useful_length_actual'),
+                'useful_diff': get('useful_length_diff')
+            } if has('length') else None,
+            'diameter': {
+                'planned': get('planned_diameter', 0.0),
+                'actual': get('actual_diameter', 0.0),
+                'diff': get('diameter_diff', 0.0),
+                'overboring_planned': get('overboring_planned'),
+                'overboring_actual': get('overboring_actual'),
+                'overboring_diff': get('overboring_diff')
+            } if has('diameter') else None,
+            'direction': {
+                'angle_planned': get('planned_angle'),
+                'angle_actual': get('actual_angle'),
+                'angle_diff': get('angle_diff'),
+                'azimuth_planned': get('planned_azimuth'),
+                'azimuth_actual': get('actual_azimuth'),
+                'azimuth_diff': get('azimuth_diff')
+            } if has('direction') else None
+        }
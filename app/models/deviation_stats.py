@@ -0,0 +1,220 @@
+# deviation_stats.py
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.models.deviation_frame import DeviationFrame
+from app.models.invalidation import VersionedCache, invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Таблица исходных данных сводок
+SOURCE_TABLES = ('Boreholes',)
+
+# Метрика: источник DeviationFrame, колонка и фиксированные корзины гистограммы (от, до, ширина)
+METRICS = {
+    'distance': ('distance', 'deviation', (0.0, 10.0, 0.25)),
+    'length': ('length', 'length_diff', (-5.0, 5.0, 0.25)),
+    'diameter': ('diameter', 'diameter_diff', (-0.1, 0.1, 0.005)),
+    'angle': ('direction', 'angle_diff', (-15.0, 15.0, 0.5)),
+    'azimuth': ('direction', 'azimuth_diff', (-180.0, 180.0, 5.0)),
+}
+
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+# Относительная точность квантилей скетча
+RELATIVE_ACCURACY = 0.01
+
+class QuantileSketch:
+    """Сливаемый скетч квантилей с относительной точностью (как DDSketch).
+
+    Значение попадает в логарифмическую корзину ceil(log_gamma(|x|)),
+    отрицательные и положительные значения хранятся раздельно; слияние -
+    сложение счетчиков корзин. Квантиль возвращается с относительной
+    погрешностью не больше relative_accuracy.
+    """
+
+    __slots__ = ('gamma', 'positive', 'negative', 'zeros', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def _buckets(self, values):
+        indexes, counts = np.unique(np.ceil(np.log(values) / math.log(self.gamma)).astype(np.int64),
+                                    return_counts=True)
+        return dict(zip(indexes.tolist(), counts.tolist()))
+
+    @classmethod
+    def from_values(cls, values, relative_accuracy=RELATIVE_ACCURACY):
+        sketch = cls(relative_accuracy)
+        values = np.asarray(values, dtype=float)
+        if not values.size:
+            return sketch
+        sketch.positive = sketch._buckets(values[values > 0])
+        sketch.negative = sketch._buckets(-values[values < 0])
+        sketch.zeros = int((values == 0).sum())
+        sketch.count = int(values.size)
+        sketch.total = float(values.sum())
+        sketch.minimum = float(values.min())
+        sketch.maximum = float(values.max())
+        return sketch
+
+    def merge(self, other):
+        """Добавление другого скетча той же точности"""
+        for target, source in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in source.items():
+                target[index] = target.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def _value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return max(-self._value(index), self.minimum)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return min(self._value(index), self.maximum)
+        return self.maximum
+
+class FixedHistogram:
+    """Гистограмма с фиксированными корзинами и счетчиками выхода за диапазон"""
+
+    __slots__ = ('low', 'high', 'width', 'counts', 'underflow', 'overflow')
+
+    def __init__(self, low, high, width):
+        self.low, self.high, self.width = low, high, width
+        self.counts = np.zeros(int(round((high - low) / width)), dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    @classmethod
+    def from_values(cls, values, low, high, width):
+        histogram = cls(low, high, width)
+        values = np.asarray(values, dtype=float)
+        histogram.underflow = int((values < low).sum())
+        histogram.overflow = int((values >= high).sum())
+        inside = values[(values >= low) & (values < high)]
+        bins = len(histogram.counts)
+        histogram.counts += np.bincount(((inside - low) / width).astype(np.int64), minlength=bins)[:bins]
+        return histogram
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def to_dict(self):
+        return {
+            'low': self.low,
+            'high': self.high,
+            'width': self.width,
+            'counts': self.counts.tolist(),
+            'underflow': self.underflow,
+            'overflow': self.overflow
+        }
+
+def block_summaries(frame):
+    """Скетч и гистограмма каждой метрики по DeviationFrame блока"""
+    summaries = {}
+    for metric, (source, column, bins) in METRICS.items():
+        rows = np.asarray(frame.order[source], dtype=np.intp)
+        values = np.asarray(frame.columns[column], dtype=float)[rows]
+        values = values[~np.isnan(values)]
+        summaries[metric] = (QuantileSketch.from_values(values), FixedHistogram.from_values(values, *bins))
+    return summaries
+
+class DeviationStats:
+    """Сводные распределения отклонений по наборам блоков без полного пересчета.
+
+    Для каждого блока скетч квантилей и гистограмма по каждой метрике
+    строятся один раз на версию данных блока (по DeviationFrame) и хранятся
+    в памяти; статистика по любому набору блоков получается слиянием их
+    сводок. Недостающие сводки строятся параллельно в workers потоках.
+    """
+
+    def __init__(self, workers=4, fallback_ttl=300):
+        self.workers = workers
+        self._summaries = VersionedCache(SOURCE_TABLES, fallback_ttl)
+
+    def init_app(self, app):
+        self.workers = int(app.config.get('DEVIATION_STATS_WORKERS', self.workers))
+
+    def _build(self, block_id, version):
+        return self._summaries.put(block_id, version, block_summaries(DeviationFrame.fetch(block_id)))
+
+    def summaries(self, block_ids):
+        """Сводки блоков: {block_id: {метрика: (скетч, гистограмма)}}"""
+        result = {}
+        missing = []
+        for block_id in map(str, block_ids):
+            version = invalidation_bus.block_version(block_id)
+            cached = self._summaries.get(block_id, version)
+            if cached is None:
+                missing.append((block_id, version))
+            else:
+                result[block_id] = cached
+
+        if missing:
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='deviation-stats') as executor:
+                built = executor.map(lambda item: self._build(*item), missing)
+                for (block_id, _), summaries in zip(missing, built):
+                    result[block_id] = summaries
+            logger.info(f"Deviation summaries built for {len(missing)} blocks in {time.monotonic() - started:.2f}s")
+        return result
+
+    def stats(self, block_ids, percentiles=DEFAULT_PERCENTILES):
+        """Слитая статистика отклонений по набору блоков"""
+        merged = {
+            metric: (QuantileSketch(), FixedHistogram(*bins))
+            for metric, (_, _, bins) in METRICS.items()
+        }
+        summaries = self.summaries(block_ids)
+        for block in summaries.values():
+            for metric, (sketch, histogram) in block.items():
+                merged[metric][0].merge(sketch)
+                merged[metric][1].merge(histogram)
+
+        return {
+            'block_count': len(summaries),
+            'metrics': {
+                metric: {
+                    'count': sketch.count,
+                    'min': sketch.minimum if sketch.count else None,
+                    'max': sketch.maximum if sketch.count else None,
+                    'mean': sketch.total / sketch.count if sketch.count else None,
+                    'percentiles': {f"p{p:g}": sketch.quantile(p / 100) for p in percentiles},
+                    'histogram': histogram.to_dict()
+                }
+                for metric, (sketch, histogram) in merged.items()
+            }
+        }
+
+deviation_stats = DeviationStats()
@@ -0,0 +1,281 @@
+# export_cache.py
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from app.models.invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Отчеты включают производительность станков по данным без уведомлений
+SOURCE_TABLES = None
+
+# Файл кэша: путь, размер, MIME тип, блок (None - отчет по всей шахте), время создания
+CacheEntry = namedtuple('CacheEntry', ['path', 'size', 'mimetype', 'block_id', 'created_at'])
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class ExportCache:
+    """Дисковый кэш готовых файлов выгрузок.
+
+    Ключ - (тип отчета, блок, формат, версия данных из шины инвалидации),
+    поэтому изменение данных блока делает его файлы недостижимыми; по событиям
+    шины они сразу удаляются, а файлы прежних версий - при первом обращении
+    к ключу новой версии. Об изменениях части данных отчетов уведомления не
+    приходят, поэтому файлы считаются устаревшими через fallback_ttl секунд. Версии данных
+    живут в памяти процесса, поэтому у каждого процесса свой подкаталог, а
+    max_bytes ограничивает общий размер всех подкаталогов: давно не
+    использованные файлы вытесняются по времени изменения, которое
+    обновляется при каждом попадании.
+    """
+
+    def __init__(self, directory=None, max_bytes=512 * 1024 * 1024, fallback_ttl=300):
+        self.root = directory or os.path.join(tempfile.gettempdir(), 'wells_export_cache')
+        self.directory = None
+        self.max_bytes = max_bytes
+        self.fallback_ttl = fallback_ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self.hits = 0
+        self.misses = 0
+        invalidation_bus.subscribe(self._on_invalidation)
+
+    def init_app(self, app):
+        self.root = app.config.get('EXPORT_CACHE_DIR') or self.root
+        self.max_bytes = int(app.config.get('EXPORT_CACHE_MAX_BYTES', self.max_bytes))
+        self.fallback_ttl = int(app.config.get('EXPORT_CACHE_TTL', self.fallback_ttl))
+        self.directory = os.path.join(self.root, str(os.getpid()))
+        self._purge_stale_directories()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _purge_stale_directories(self):
+        """Удаление каталогов завершившихся процессов и своего каталога от прошлого запуска"""
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.isdigit() or not os.path.isdir(path):
+                continue
+            if int(name) == os.getpid() or not _pid_alive(int(name)):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _get_directory(self):
+        if self.directory is None:
+            self.directory = os.path.join(self.root, str(os.getpid()))
+            os.makedirs(self.directory, exist_ok=True)
+        return self.directory
+
+    def key(self, report_type, block_id, format_type):
+        """Ключ кэша с текущей версией данных"""
+        if block_id is None:
+            version = invalidation_bus.mine_version()
+        else:
+            block_id = str(block_id)
+            version = invalidation_bus.block_version(block_id)
+        return (report_type, block_id, format_type, version)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self._get_directory(), f"{digest}.{key[2]}")
+
+    def get(self, key, count=True):
+        """Готовый файл по ключу или None"""
+        with self._lock:
+            self._drop_superseded(key)
+            entry = self._entries.get(key)
+            if entry is not None and invalidation_bus.expired(SOURCE_TABLES, entry.created_at, self.fallback_ttl):
+                # Не обо всех данных отчета приходят уведомления - доверяем файлу ограниченное время
+                self._drop(key)
+                entry = None
+            if entry is None or not os.path.exists(entry.path):
+                if entry is not None:
+                    self._drop(key)
+                self.misses += count
+                return None
+            self._entries.move_to_end(key)
+            self._touch(entry.path)
+            self.hits += count
+            return entry
+
+    def _drop_superseded(self, key):
+        """Удаление файлов того же отчета с другой версией данных (под блокировкой)"""
+        for cached in [cached for cached in self._entries if cached[:3] == key[:3] and cached != key]:
+            self._drop(cached)
+
+    @staticmethod
+    def _touch(path):
+        """Отметка использования файла для вытеснения в других процессах"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def build(self, key, mimetype, builder):
+        """Сборка файла и добавление в кэш.
+
+        builder(fileobj) пишет содержимое и возвращает число строк; при нуле
+        файл не кэшируется и возвращается None. Одновременные сборки одного
+        ключа выполняются один раз.
+        """
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            try:
+                # Файл мог собрать параллельный запрос, пока мы ждали блокировку
+                entry = self.get(key, count=False)
+                if entry is not None:
+                    return entry
+
+                path = self._path(key)
+                partial = f"{path}.{threading.get_ident()}.part"
+                try:
+                    with open(partial, 'wb') as fileobj:
+                        rows = builder(fileobj)
+                    if not rows:
+                        os.remove(partial)
+                        return None
+                    os.replace(partial, path)
+                except Exception:
+                    if os.path.exists(partial):
+                        os.remove(partial)
+                    raise
+
+                return self._add(key, path, mimetype)
+            finally:
+                with self._lock:
+                    self._build_locks.pop(key, None)
+
+    def tee(self, key, mimetype, chunks):
+        """Потоковая отдача с одновременной записью в кэш.
+
+        Файл попадает в кэш, только если поток дочитан до конца.
+        """
+        path = self._path(key)
+        partial = f"{path}.{threading.get_ident()}.part"
+        completed = False
+        try:
+            with open(partial, 'wb') as fileobj:
+                for chunk in chunks:
+                    fileobj.write(chunk)
+                    yield chunk
+            os.replace(partial, path)
+            completed = True
+            self._add(key, path, mimetype)
+        finally:
+            if not completed and os.path.exists(partial):
+                os.remove(partial)
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def _add(self, key, path, mimetype):
+        entry = CacheEntry(path, os.path.getsize(path), mimetype, key[1], time.monotonic())
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key).size
+            self._entries[key] = entry
+            self._size += entry.size
+            self._evict(keep=path)
+        return entry
+
+    def _disk_files(self):
+        """Файлы кэша всех процессов: [(время изменения, размер, путь)] и общий размер"""
+        files = []
+        usage = 0
+        if not os.path.isdir(self.root):
+            return files, usage
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            if not name.isdigit() or not os.path.isdir(directory):
+                continue
+            for item in os.scandir(directory):
+                try:
+                    stat = item.stat()
+                except OSError:
+                    # Файл удален другим процессом
+                    continue
+                usage += stat.st_size
+                # Недописанные файлы учитываются в размере, но не вытесняются
+                if not item.name.endswith('.part'):
+                    files.append((stat.st_mtime, stat.st_size, item.path))
+        return files, usage
+
+    def _evict(self, keep=None):
+        """Вытеснение давно не использованных файлов всех процессов сверх лимита (под блокировкой).
+
+        Файлы других процессов просто удаляются: их записи пропадут при
+        следующем обращении, когда файл не найдется на диске.
+        """
+        files, usage = self._disk_files()
+        if usage <= self.max_bytes:
+            return
+        own = {entry.path: key for key, entry in self._entries.items()}
+        evicted = 0
+        for _, size, path in sorted(files):
+            if usage <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            if path in own:
+                self._drop(own[path])
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            usage -= size
+            evicted += 1
+        if evicted:
+            logger.info(f"Export cache evicted {evicted} files, {usage} bytes in use")
+
+    def _drop(self, key):
+        """Удаление записи и файла (под блокировкой)"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry.size
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+    def _on_invalidation(self, events):
+        """Удаление файлов, затронутых изменениями"""
+        with self._lock:
+            keys = list(self._entries)
+            for event in events:
+                if event.block_id is None:
+                    dropped = keys
+                else:
+                    # Отчеты по всей шахте зависят от данных любого блока
+                    dropped = [key for key in keys if key[1] is None or key[1] == event.block_id]
+                for key in dropped:
+                    self._drop(key)
+                keys = list(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+export_cache = ExportCache()
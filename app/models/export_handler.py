@@ -1,13 +1,210 @@
 import csv
+import io
 import json
+import re
+from itertools import chain
+import tempfile
+import zipfile
 import xml.etree.ElementTree as ET
 from io import StringIO, BytesIO
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
 import base64
 
+from app.utils import serialization
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Символы, недопустимые в XML 1.0
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# Символы, недопустимые в имени листа
+_SHEET_NAME_ILLEGAL = re.compile(r'[\[\]:*?/\\]')
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{sheets}'
+    '</Types>'
+)
+
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '</styleSheet>'
+)
+
+def _column_letter(index):
+    """Буквенное обозначение столбца по индексу с нуля"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+class XlsxStreamWriter:
+    """Потоковая запись XLSX: строки пишутся в XML листа внутри zip по мере поступления.
+
+    В памяти держится только буфер текущей пачки строк, листы пишутся
+    последовательно, служебные части книги - при закрытии.
+    """
+
+    FLUSH_ROWS = 1000
+
+    def __init__(self, fileobj):
+        self._zip = zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED)
+        self._sheet_names = []
+        self._stream = None
+        self._buffer = []
+        self._row = 0
+        self._letters = []
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add_sheet(self, name, headers=None):
+        """Начало нового листа (предыдущий лист закрывается)"""
+        self._close_sheet()
+
+        name = _SHEET_NAME_ILLEGAL.sub('_', str(name))[:31] or f"Sheet{len(self._sheet_names) + 1}"
+        base, suffix = name, 1
+        while name.lower() in (n.lower() for n in self._sheet_names):
+            suffix += 1
+            name = f"{base[:28]}_{suffix}"
+        self._sheet_names.append(name)
+
+        self._stream = self._zip.open(f"xl/worksheets/sheet{len(self._sheet_names)}.xml", 'w', force_zip64=True)
+        self._stream.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            b'<sheetData>'
+        )
+        self._row = 0
+        if headers:
+            self.write_row(headers, style=1)
+
+    def write_row(self, values, style=None):
+        """Запись строки: числа - числовые ячейки, NULL и NaN - пустые"""
+        self._row += 1
+        row = self._row
+        cells = []
+        for i, value in enumerate(values):
+            cell = self._cell(value)
+            if cell is None:
+                continue
+            if i >= len(self._letters):
+                self._letters.extend(_column_letter(j) for j in range(len(self._letters), i + 1))
+            style_attr = f' s="{style}"' if style else ''
+            cells.append(f'<c r="{self._letters[i]}{row}"{style_attr}{cell}</c>')
+        self._buffer.append(f'<row r="{row}">{"".join(cells)}</row>')
+        self.rows_written += 1
+
+        if len(self._buffer) >= self.FLUSH_ROWS:
+            self._flush()
+
+    def write_rows(self, rows):
+        for values in rows:
+            self.write_row(values)
+
+    @staticmethod
+    def _cell(value):
+        """Атрибуты и содержимое ячейки (после r="...") или None для пустой"""
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            return f' t="b"><v>{int(value)}</v>'
+        if isinstance(value, (int, float, Decimal)):
+            # NaN и бесконечности в XLSX не представимы
+            if value != value or value in (float('inf'), float('-inf')):
+                return None
+            return f'><v>{value}</v>'
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        text = escape(_XML_ILLEGAL.sub('', str(value)))
+        return f' t="inlineStr"><is><t xml:space="preserve">{text}</t></is>'
+
+    def _flush(self):
+        if self._buffer:
+            self._stream.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer = []
+
+    def _close_sheet(self):
+        if self._stream is None:
+            return
+        self._flush()
+        self._stream.write(b'</sheetData></worksheet>')
+        self._stream.close()
+        self._stream = None
+
+    def close(self):
+        """Завершение книги: служебные части и каталог zip"""
+        if self._zip is None:
+            return
+        if not self._sheet_names:
+            self.add_sheet('Report')
+        self._close_sheet()
+
+        count = len(self._sheet_names)
+        sheet_types = ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, count + 1)
+        )
+        names = [escape(name, {'"': '&quot;'}) for name in self._sheet_names]
+        sheets = ''.join(
+            f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>'
+            for i, name in enumerate(names, 1)
+        )
+        sheet_rels = ''.join(
+            f'<Relationship Id="rId{i}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, count + 1)
+        )
+
+        self._zip.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES.format(sheets=sheet_types))
+        self._zip.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        self._zip.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets>{sheets}</sheets></workbook>'
+        ))
+        self._zip.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{sheet_rels}'
+            f'<Relationship Id="rId{count + 1}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+            '</Relationships>'
+        ))
+        self._zip.writestr('xl/styles.xml', _XLSX_STYLES)
+        self._zip.close()
+        self._zip = None
+
 class ExportHandler:
     def __init__(self):
-        self.supported_formats = ['csv', 'json', 'xml', 'txt', 'pdf', 'excel', 'docx']
+        self.supported_formats = ['csv', 'json', 'xml', 'txt', 'pdf', 'excel', 'xlsx', 'docx']
     
     def export_data(self, data, format_type, filename=None):
         """Основной метод для экспорта данных"""
@@ -21,7 +218,7 @@ class ExportHandler:
             return self._to_txt(data, filename)
         elif format_type == 'pdf':
             return self._to_pdf(data, filename)
-        elif format_type == 'excel':
+        elif format_type in ('excel', 'xlsx'):
             return self._to_excel(data, filename)
         elif format_type == 'docx':
             return self._to_docx(data, filename)
@@ -111,13 +308,102 @@ class ExportHandler:
         return BytesIO(pdf_content.encode('utf-8')), 'application/pdf', filename
     
     def _to_excel(self, data, filename):
-        """Экспорт в Excel (CSV с другим расширением)"""
+        """Экспорт в Excel: список словарей - один лист, словарь {лист: строки} - по листу на ключ"""
+        if isinstance(data, dict):
+            sheets = [(name, None, rows) for name, rows in data.items()]
+        else:
+            sheets = [('Report', None, data or [])]
+        return self.export_sheets(sheets, filename)
+    
+    def export_sheets(self, sheets, filename=None):
+        """Потоковая запись книги во временный файл.
+        
+        sheets - итерируемое (имя листа, заголовки, строки); строки - словари
+        или кортежи. Если заголовки не заданы, они берутся из ключей первого словаря.
+        """
         if not filename:
             filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         
-        # Используем CSV как временное решение для Excel
-        csv_buffer, _, _ = self._to_csv(data, filename.replace('.xlsx', '.csv'))
-        return csv_buffer, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', filename
+        output = tempfile.TemporaryFile()
+        try:
+            self.write_file(output, 'xlsx', sheets)
+        except Exception:
+            output.close()
+            raise
+        
+        output.seek(0)
+        return output, XLSX_MIMETYPE, filename
+    
+    @staticmethod
+    def _sheet_rows(headers, rows):
+        """Заголовки листа и строки в виде списков значений"""
+        rows = iter(rows)
+        first = next(rows, None)
+        if headers is None:
+            headers = list(first.keys()) if isinstance(first, dict) else []
+        if first is None:
+            return headers, iter(())
+        
+        def values():
+            for row in chain((first,), rows):
+                if isinstance(row, dict):
+                    row = [row.get(header) for header in headers]
+                yield row
+        
+        return headers, values()
+    
+    def write_file(self, fileobj, format_type, sheets):
+        """Потоковая запись листов в открытый двоичный файл (xlsx, csv, txt, json).
+        
+        В текстовых форматах листы идут подряд, каждый со своей строкой
+        заголовков; в JSON несколько листов - объект {лист: [строки]}.
+        """
+        sheets = list(sheets)
+        
+        if format_type in ('xlsx', 'excel'):
+            with XlsxStreamWriter(fileobj) as book:
+                for name, headers, rows in sheets:
+                    headers, rows = self._sheet_rows(headers, rows)
+                    book.add_sheet(name, headers)
+                    book.write_rows(rows)
+            return
+        
+        text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='', write_through=False)
+        try:
+            if format_type == 'json':
+                self._write_json(text, sheets)
+            elif format_type in ('csv', 'txt'):
+                writer = csv.writer(text, delimiter=',' if format_type == 'csv' else '\t',
+                                    lineterminator='\n')
+                for i, (name, headers, rows) in enumerate(sheets):
+                    headers, rows = self._sheet_rows(headers, rows)
+                    if i:
+                        text.write('\n')
+                    writer.writerow(headers)
+                    for row in rows:
+                        writer.writerow(['' if value is None else value for value in row])
+            else:
+                raise ValueError(f"Unsupported format: {format_type}")
+        finally:
+            text.flush()
+            text.detach()
+    
+    def _write_json(self, text, sheets):
+        """JSON массив (или объект листов) без сборки всего документа в памяти"""
+        multiple = len(sheets) > 1
+        if multiple:
+            text.write('{')
+        for i, (name, headers, rows) in enumerate(sheets):
+            headers, rows = self._sheet_rows(headers, rows)
+            if multiple:
+                text.write(('' if i == 0 else ',') + json.dumps(str(name), ensure_ascii=False) + ':')
+            text.write('[')
+            for j, row in enumerate(rows):
+                record = dict(zip(headers, row))
+                text.write(('\n' if j == 0 else ',\n') + serialization.dumps(record).decode('utf-8'))
+            text.write('\n]')
+        if multiple:
+            text.write('}')
     
     def _to_docx(self, data, filename):
         """Экспорт в Word (упрощенная версия)"""
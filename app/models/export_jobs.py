@@ -0,0 +1,275 @@
+# export_jobs.py
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.models.invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Состояния задачи экспорта
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+class ExportQueueFull(Exception):
+    """Превышено число задач экспорта в очереди"""
+
+class ExportProgress:
+    """Счетчик записанных строк; без фоновой задачи (синхронные и пакетные выгрузки) - только он"""
+
+    def __init__(self):
+        self.rows_written = 0
+        self.total_rows = None
+
+    def advance(self, rows):
+        """Учет записанной пачки строк"""
+        self.rows_written += rows
+
+    def counted(self, rows):
+        """Обертка над строками, считающая записанные строки"""
+        for row in rows:
+            self.rows_written += 1
+            yield row
+
+class ExportJob(ExportProgress):
+    """Задача фоновой выгрузки файла"""
+
+    def __init__(self, key, params):
+        super().__init__()
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.params = params
+        self.status = QUEUED
+        self.path = None
+        self.filename = None
+        self.mimetype = None
+        self.size = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.finished_monotonic = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Задача, записанная другим процессом (только для чтения состояния и скачивания)"""
+        job = cls(None, data['params'])
+        job.id = data['job_id']
+        for name in ('status', 'rows_written', 'total_rows', 'filename', 'mimetype',
+                     'size', 'error', 'created_at', 'finished_at'):
+            setattr(job, name, data.get(name))
+        return job
+
+    @property
+    def percent(self):
+        if self.status == DONE:
+            return 100.0
+        if self.total_rows:
+            # До завершения не показываем 100% - оценка объема может быть неточной
+            return min(99.0, round(self.rows_written / self.total_rows * 100, 1))
+        return None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'params': self.params,
+            'rows_written': self.rows_written,
+            'total_rows': self.total_rows,
+            'percent': self.percent,
+            'filename': self.filename,
+            'size': self.size,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+class ExportJobQueue:
+    """Очередь фоновых выгрузок на ограниченном пуле потоков.
+
+    Файлы собираются в локальном каталоге и удаляются через ttl секунд после
+    завершения. Одинаковые задачи (тот же ключ и та же версия данных)
+    разделяют одну задачу: активную - всегда, готовую - пока данные ее
+    таблиц не устарели по InvalidationBus.expired (для таблиц без
+    уведомлений - reuse_ttl секунд). Состояние задачи пишется в
+    <id>.json рядом с файлом, поэтому состояние и файл доступны из любого
+    процесса приложения с общим каталогом; объединение одинаковых задач
+    работает в пределах процесса.
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, ttl=3600, reuse_ttl=300, directory=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.reuse_ttl = reuse_ttl
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'wells_exports')
+        self.app = None
+        self._executor = None
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = int(app.config.get('EXPORT_JOB_WORKERS', self.max_workers))
+        self.max_pending = int(app.config.get('EXPORT_JOB_MAX_PENDING', self.max_pending))
+        self.ttl = int(app.config.get('EXPORT_JOB_TTL', self.ttl))
+        self.reuse_ttl = int(app.config.get('EXPORT_JOB_REUSE_TTL', self.reuse_ttl))
+        self.directory = app.config.get('EXPORT_JOB_DIR') or self.directory
+        os.makedirs(self.directory, exist_ok=True)
+        self._purge_directory()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='export-job')
+        return self._executor
+
+    def _purge_directory(self):
+        """Удаление устаревших файлов, оставшихся от предыдущих запусков"""
+        removed = 0
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"Removed {removed} stale export files from {self.directory}")
+
+    def _metadata_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _save(self, job):
+        """Запись состояния задачи рядом с файлом"""
+        path = self._metadata_path(job.id)
+        partial = f"{path}.part"
+        try:
+            with open(partial, 'w', encoding='utf-8') as fileobj:
+                json.dump(dict(job.to_dict(), mimetype=job.mimetype), fileobj)
+            os.replace(partial, path)
+        except OSError as e:
+            logger.warning(f"Could not save export job {job.id} state: {e}")
+
+    def _load(self, job_id):
+        """Задача другого процесса по записанному состоянию"""
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        try:
+            with open(self._metadata_path(job_id), encoding='utf-8') as fileobj:
+                job = ExportJob.from_dict(json.load(fileobj))
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if job.finished_at is not None and time.time() - job.finished_at > self.ttl:
+            return None
+        if job.status == DONE:
+            job.path = os.path.join(self.directory, job.id)
+            if not os.path.exists(job.path):
+                return None
+        return job
+
+    def submit(self, params, builder, data_version=None, tables=None):
+        """Постановка выгрузки в очередь.
+
+        builder(job, fileobj) пишет файл, обновляет job.rows_written / job.total_rows
+        и возвращает (имя файла, MIME тип). tables - таблицы, из которых
+        собирается файл (None - есть данные без уведомлений).
+        """
+        key = (tuple(sorted(params.items())), data_version)
+
+        with self._lock:
+            self._sweep()
+
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None:
+                if existing.status in (QUEUED, RUNNING):
+                    return existing
+                if (existing.status == DONE and existing.finished_monotonic is not None
+                        and not invalidation_bus.expired(tables, existing.finished_monotonic, self.reuse_ttl)):
+                    return existing
+
+            active = sum(1 for job in self._jobs.values() if job.status in (QUEUED, RUNNING))
+            if active >= self.max_pending:
+                raise ExportQueueFull(f"Export queue is full ({active} jobs)")
+
+            job = ExportJob(key, params)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+
+        self._save(job)
+        self._get_executor().submit(self._run, job, builder)
+        logger.info(f"Export job {job.id} queued: {params}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._sweep()
+            job = self._jobs.get(job_id)
+        if job is None:
+            job = self._load(job_id)
+        return job
+
+    def _run(self, job, builder):
+        job.status = RUNNING
+        self._save(job)
+        path = os.path.join(self.directory, job.id)
+        partial = f"{path}.part"
+        started = time.monotonic()
+
+        try:
+            with self.app.app_context():
+                with open(partial, 'wb') as fileobj:
+                    filename, mimetype = builder(job, fileobj)
+            os.replace(partial, path)
+
+            job.path = path
+            job.filename = filename
+            job.mimetype = mimetype
+            job.size = os.path.getsize(path)
+            job.status = DONE
+            logger.info(f"Export job {job.id} finished: {job.rows_written} rows, "
+                        f"{job.size} bytes in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+            logger.error(f"Export job {job.id} failed: {e}", exc_info=True)
+            if os.path.exists(partial):
+                os.remove(partial)
+        finally:
+            job.finished_at = time.time()
+            job.finished_monotonic = time.monotonic()
+            self._save(job)
+
+    def _sweep(self):
+        """Удаление завершенных задач и их файлов по истечении ttl (под блокировкой)"""
+        now = time.time()
+        expired = [
+            job for job in self._jobs.values()
+            if job.finished_at is not None and now - job.finished_at > self.ttl
+        ]
+        for job in expired:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) == job.id:
+                del self._by_key[job.key]
+            for path in (job.path, self._metadata_path(job.id)):
+                if path and os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        logger.warning(f"Could not remove export file {path}: {e}")
+        if expired:
+            logger.info(f"Expired {len(expired)} export jobs")
+
+export_jobs = ExportJobQueue()
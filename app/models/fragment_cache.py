@@ -0,0 +1,148 @@
+# fragment_cache.py
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from app.models.invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Страницы включают отчет generate_report() по данным без уведомлений
+SOURCE_TABLES = None
+
+# Фрагмент: версия данных блока, значение, оценка размера, время создания
+FragmentEntry = namedtuple('FragmentEntry', ['version', 'value', 'size', 'created_at'])
+
+def _weight(value):
+    """Приблизительный размер значения в байтах (для строк - длина)"""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_weight(key) + _weight(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_weight(item) for item in value) + 8 * len(value)
+    return 16
+
+class FragmentCache:
+    """Кэш отрисованных страниц и их фрагментов в памяти процесса.
+
+    Ключ - (блок, имя фрагмента); запись хранит версию данных блока из шины
+    инвалидации и отдается, только пока версия совпадает с текущей. События
+    шины по блоку сразу удаляют его фрагменты; часть данных страниц
+    уведомлениями не отслеживается, поэтому фрагменты живут не дольше
+    fallback_ttl секунд. Общий размер ограничен
+    max_bytes с вытеснением давно не использованных записей.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, fallback_ttl=300):
+        self.max_bytes = max_bytes
+        self.fallback_ttl = fallback_ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self.hits = 0
+        self.misses = 0
+        invalidation_bus.subscribe(self._on_invalidation)
+
+    def init_app(self, app):
+        self.max_bytes = int(app.config.get('FRAGMENT_CACHE_MAX_BYTES', self.max_bytes))
+
+    @staticmethod
+    def version(block_id):
+        """Текущая версия данных блока; снимать до загрузки данных фрагмента"""
+        return invalidation_bus.block_version(block_id)
+
+    def get(self, block_id, name, version=None, count=True):
+        """Фрагмент текущей (или указанной) версии или None"""
+        key = (str(block_id), name)
+        version = version or self.version(block_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.version != version or invalidation_bus.expired(
+                    SOURCE_TABLES, entry.created_at, self.fallback_ttl)):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += count
+                return None
+            self._entries.move_to_end(key)
+            self.hits += count
+            return entry.value
+
+    def put(self, block_id, name, value, version):
+        """Сохранение фрагмента, построенного по данным версии version"""
+        if not self.max_bytes:
+            return value
+        key = (str(block_id), name)
+        entry = FragmentEntry(version, value, _weight(value), time.monotonic())
+        with self._lock:
+            # Данные блока изменились, пока строился фрагмент
+            if version != self.version(block_id):
+                return value
+            self._drop(key)
+            self._entries[key] = entry
+            self._size += entry.size
+            self._evict()
+        return value
+
+    def get_or_build(self, block_id, name, builder):
+        """Фрагмент из кэша или builder(); одновременные сборки одного ключа выполняются один раз"""
+        version = self.version(block_id)
+        value = self.get(block_id, name, version)
+        if value is not None:
+            return value
+
+        key = (str(block_id), name)
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            try:
+                # Фрагмент мог построить параллельный запрос, пока мы ждали блокировку
+                value = self.get(block_id, name, version, count=False)
+                if value is None:
+                    value = self.put(block_id, name, builder(), version)
+                return value
+            finally:
+                with self._lock:
+                    self._build_locks.pop(key, None)
+
+    def _evict(self):
+        """Вытеснение давно не использованных фрагментов сверх лимита (под блокировкой)"""
+        evicted = 0
+        while self._size > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+            evicted += 1
+        if evicted:
+            logger.info(f"Fragment cache evicted {evicted} entries, {self._size} bytes in use")
+
+    def _drop(self, key):
+        """Удаление записи (под блокировкой)"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def _on_invalidation(self, events):
+        """Удаление фрагментов блоков, затронутых изменениями"""
+        with self._lock:
+            for event in events:
+                if event.block_id is None:
+                    self._entries.clear()
+                    self._size = 0
+                    continue
+                block_id = str(event.block_id)
+                for key in [key for key in self._entries if key[0] == block_id]:
+                    self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+fragment_cache = FragmentCache()
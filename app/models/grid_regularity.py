@@ -0,0 +1,231 @@
+# grid_regularity.py
+import logging
+import math
+import time
+
+import numpy as np
+from psycopg2.extras import RealDictCursor
+from scipy.spatial import cKDTree
+
+from app.models.database import db_manager
+from app.models.invalidation import VersionedCache, invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Таблицы исходных данных расчета
+SOURCE_TABLES = ('Boreholes', 'BlockInfo')
+
+# Соседи каждой скважины в графе (без нее самой): по два в ряду и между рядами
+NEIGHBOURS = 4
+
+# Вектор к соседу относится к оси сетки, если отклоняется от нее не больше чем на 22.5°
+AXIS_TOLERANCE = math.tan(math.radians(22.5))
+
+# Доля медианной длины, короче которой вектор к соседу не задает направление
+MIN_VECTOR_SHARE = 0.1
+
+def _median(values):
+    return float(np.median(values)) if values.size else None
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+def grid_orientation(vectors):
+    """Угол осей прямоугольной сетки по векторам к соседям.
+
+    Оси сетки переходят друг в друга поворотом на 90°, поэтому углы
+    векторов учетверяются и усредняются по окружности. Векторы короче
+    MIN_VECTOR_SHARE медианной длины (повторные устья, дубли скважин)
+    направления не имеют и не учитываются.
+    """
+    lengths = np.hypot(vectors[:, 0], vectors[:, 1])
+    vectors = vectors[lengths > MIN_VECTOR_SHARE * np.median(lengths)] if lengths.size else vectors
+    if not len(vectors):
+        return 0.0
+    angles = 4 * np.arctan2(vectors[:, 1], vectors[:, 0])
+    return math.atan2(np.sin(angles).sum(), np.cos(angles).sum()) / 4
+
+def analyze(names, xy, holes_space=None, rows_distance=None, tolerance=0.25):
+    """Регулярность фактической сетки одного блока.
+
+    Граф соседей строится KD-деревом за O(n log n); шаг и расстояние между
+    рядами оцениваются медианами проекций векторов к соседям на оси сетки.
+    Скважина отмечается, если расстояние до ближайшей соседней или ее шаг
+    по любой оси отличается от проектного больше чем на tolerance.
+    """
+    xy = np.asarray(xy, dtype=float)
+    count = len(xy)
+    result = {
+        'hole_count': count,
+        'design_spacing': holes_space or None,
+        'design_burden': rows_distance or None,
+        'spacing': None,
+        'burden': None,
+        'orientation_deg': None,
+        'flagged_count': 0,
+        'holes': []
+    }
+    if count < 2:
+        return result
+
+    k = min(NEIGHBOURS, count - 1)
+    distances, neighbours = cKDTree(xy).query(xy, k=k + 1)
+    distances, neighbours = distances[:, 1:], neighbours[:, 1:]
+    vectors = xy[neighbours] - xy[:, None, :]
+
+    orientation = grid_orientation(vectors.reshape(-1, 2))
+    axis = np.array([math.cos(orientation), math.sin(orientation)])
+    along = np.abs(vectors @ axis)
+    across = np.abs(vectors @ np.array([-axis[1], axis[0]]))
+    on_first = across <= along * AXIS_TOLERANCE
+    on_second = along <= across * AXIS_TOLERANCE
+
+    first, second = _median(along[on_first]), _median(across[on_second])
+    # Ось рядов - та, чей шаг ближе к проектному шагу между скважинами
+    swap = False
+    if holes_space and rows_distance and first is not None and second is not None:
+        swap = abs(first - rows_distance) + abs(second - holes_space) < \
+            abs(first - holes_space) + abs(second - rows_distance)
+    elif first is None and second is not None:
+        swap = True
+    if swap:
+        first, second = second, first
+        on_first, on_second = on_second, on_first
+        along, across = across, along
+        orientation += math.pi / 2
+
+    # Шаг и расстояние между рядами у каждой скважины - ближайший сосед по оси
+    hole_spacing = np.where(on_first, along, np.inf).min(axis=1)
+    hole_burden = np.where(on_second, across, np.inf).min(axis=1)
+    nearest = distances[:, 0]
+
+    spacing_design = holes_space or first
+    burden_design = rows_distance or second
+    design_steps = [value for value in (spacing_design, burden_design) if value]
+    expected = min(design_steps) if design_steps else None
+
+    nearest_ratio = nearest / expected - 1 if expected else np.zeros(count)
+    spacing_ratio = hole_spacing / spacing_design - 1 if spacing_design else np.full(count, np.inf)
+    burden_ratio = hole_burden / burden_design - 1 if burden_design else np.full(count, np.inf)
+    with np.errstate(invalid='ignore'):
+        nearest_bad = np.abs(nearest_ratio) > tolerance
+        spacing_bad = np.isfinite(spacing_ratio) & (np.abs(spacing_ratio) > tolerance)
+        burden_bad = np.isfinite(burden_ratio) & (np.abs(burden_ratio) > tolerance)
+    flagged = nearest_bad | spacing_bad | burden_bad
+
+    holes = []
+    for row in range(count):
+        reasons = []
+        if nearest_bad[row]:
+            reasons.append('too_close' if nearest_ratio[row] < 0 else 'too_far')
+        if spacing_bad[row]:
+            reasons.append('spacing')
+        if burden_bad[row]:
+            reasons.append('burden')
+        holes.append({
+            'name': names[row],
+            'x': float(xy[row, 0]),
+            'y': float(xy[row, 1]),
+            'nearest_name': names[neighbours[row, 0]],
+            'nearest_distance': round(float(nearest[row]), 2),
+            'spacing': round(float(hole_spacing[row]), 2) if np.isfinite(hole_spacing[row]) else None,
+            'burden': round(float(hole_burden[row]), 2) if np.isfinite(hole_burden[row]) else None,
+            'deviation_percent': round(float(nearest_ratio[row]) * 100, 1),
+            'flagged': bool(flagged[row]),
+            'reasons': reasons
+        })
+
+    result.update({
+        'spacing': _round(first),
+        'burden': _round(second),
+        'orientation_deg': round(math.degrees(orientation), 1) % 180,
+        'flagged_count': int(flagged.sum()),
+        'holes': holes
+    })
+    return result
+
+class GridRegularity:
+    """Анализ регулярности фактических сеток (T=3) по блокам.
+
+    Устья скважин и проектные HolesSpace/RowsDistance всех нужных блоков
+    берутся одной выборкой; результаты кэшируются на версию данных блока
+    (сводка по шахте - на версию шахты, не больше max_blocks блоков), без
+    уведомлений об изменениях таблиц SOURCE_TABLES - не дольше fallback_ttl
+    секунд.
+    """
+
+    def __init__(self, tolerance=0.25, max_blocks=128, fallback_ttl=300):
+        self.tolerance = tolerance
+        self._blocks = VersionedCache(SOURCE_TABLES, fallback_ttl, max_entries=max_blocks)
+        self._summary = VersionedCache(SOURCE_TABLES, fallback_ttl, max_entries=1)
+
+    def init_app(self, app):
+        self.tolerance = float(app.config.get('GRID_REGULARITY_TOLERANCE', self.tolerance))
+        self._blocks.max_entries = int(app.config.get('GRID_REGULARITY_CACHE_SIZE', self._blocks.max_entries))
+
+    def _load(self, block_id=None):
+        """Фактические устья и проектная сетка: {block_id: (block_name, space, rows, names, xy)}"""
+        condition = ' AND b."BlockID" = %s' if block_id is not None else ''
+        params = (block_id,) if block_id is not None else ()
+        with db_manager.get_cursor(RealDictCursor, numeric_as_float=True) as cursor:
+            cursor.execute(f"""
+                SELECT b."BlockID"::text AS block_id, b."Name" AS name, b."X" AS x, b."Y" AS y
+                FROM public."Boreholes" b
+                WHERE b."T" = 3 AND b."X" IS NOT NULL AND b."Y" IS NOT NULL{condition}
+                ORDER BY b."BlockID", b."Name"
+            """, params)
+            collars = cursor.fetchall()
+
+            cursor.execute(f"""
+                SELECT "BlockID"::text AS block_id, "BlockName" AS block_name,
+                       "HolesSpace" AS holes_space, "RowsDistance" AS rows_distance
+                FROM public."BlockInfo"
+                {'WHERE "BlockID" = %s' if block_id is not None else ''}
+            """, params)
+            design = {row['block_id']: row for row in cursor.fetchall()}
+
+        blocks = {}
+        for row in collars:
+            blocks.setdefault(row['block_id'], ([], []))
+            names, xy = blocks[row['block_id']]
+            names.append(str(row['name']))
+            xy.append((row['x'], row['y']))
+
+        result = {}
+        for key, (names, xy) in blocks.items():
+            info = design.get(key, {})
+            result[key] = (info.get('block_name'), info.get('holes_space'), info.get('rows_distance'), names, xy)
+        return result
+
+    def _analyze(self, block_id, block_name, holes_space, rows_distance, names, xy):
+        result = analyze(names, xy, holes_space, rows_distance, self.tolerance)
+        result['block_id'] = block_id
+        result['block_name'] = block_name
+        return result
+
+    def block(self, block_id):
+        """Анализ одного блока с разбивкой по скважинам (None - нет фактических устьев)"""
+        block_id = str(block_id)
+
+        def build():
+            loaded = self._load(block_id).get(block_id)
+            return self._analyze(block_id, *loaded) if loaded else None
+
+        return self._blocks.get_or_build(block_id, invalidation_bus.block_version(block_id), build)
+
+    def summary(self):
+        """Сводка по всем блокам одним пакетом (без разбивки по скважинам)"""
+        return self._summary.get_or_build('summary', invalidation_bus.mine_version(), self._compute_summary)
+
+    def _compute_summary(self):
+        started = time.monotonic()
+        rows = []
+        for block_id, loaded in self._load().items():
+            result = self._analyze(block_id, *loaded)
+            result.pop('holes')
+            rows.append(result)
+
+        logger.info(f"Grid regularity computed for {len(rows)} blocks in {time.monotonic() - started:.2f}s")
+        return rows
+
+grid_regularity = GridRegularity()
@@ -0,0 +1,344 @@
+# invalidation.py
+import json
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import psycopg2
+import psycopg2.extensions
+
+from app.models.database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Каналы уведомлений, создаваемые sql/notify_triggers.sql
+CHANNEL_TABLES = {
+    'boreholes_changed': ('Boreholes',),
+    'block_info_changed': ('BlockInfo',),
+    'relief_changed': ('ReliefItems', 'ReliefPoints'),
+    'rigs_changed': ('DrillingRigs',),
+}
+
+# Функция триггеров уведомлений из sql/notify_triggers.sql
+TRIGGER_FUNCTION = 'notify_block_data_changed'
+
+# Таблицы с созданными триггерами уведомлений
+COVERED_TABLES_QUERY = """
+    SELECT DISTINCT c.relname
+    FROM pg_trigger t
+    JOIN pg_class c ON c.oid = t.tgrelid
+    JOIN pg_proc p ON p.oid = t.tgfoid
+    WHERE p.proname = %s AND NOT t.tgisinternal AND t.tgenabled <> 'D'
+"""
+
+# Событие сброса кэша: block_id=None означает изменение, затрагивающее всю шахту.
+# rows - исходные уведомления по блоку или None, если детали потеряны
+# (переполнение пачки, переподключение).
+InvalidationEvent = namedtuple('InvalidationEvent', ['block_id', 'tables', 'rows'])
+
+class InvalidationBus:
+    """Шина событий сброса кэшей и версии данных блоков.
+
+    Версия блока меняется при каждом событии по этому блоку и при каждом
+    событии по всей шахте; ее используют как часть ключа кэшей. Версии
+    отражают только изменения таблиц с триггерами уведомлений: кэш данных
+    других таблиц (например, сменных записей бурения) должен ограничивать
+    срок жизни записей, см. covers().
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._mine_version = 0
+        self._block_versions = {}
+        self.listener_connected = False
+        self.covered_tables = frozenset()
+
+    def subscribe(self, callback):
+        """Подписка на события; callback получает список InvalidationEvent"""
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, events):
+        """Обновление версий и рассылка событий подписчикам"""
+        if not events:
+            return
+
+        with self._lock:
+            for event in events:
+                self._mine_version += 1
+                if event.block_id is None:
+                    self._epoch += 1
+                else:
+                    self._block_versions[event.block_id] = self._block_versions.get(event.block_id, 0) + 1
+            subscribers = list(self._subscribers)
+
+        for callback in subscribers:
+            try:
+                callback(events)
+            except Exception as e:
+                logger.error(f"Invalidation subscriber {getattr(callback, '__qualname__', callback)} failed: {e}")
+
+    def invalidate_all(self, tables=()):
+        """Сброс всех кэшей (например, после потери уведомлений)"""
+        self.publish([InvalidationEvent(None, frozenset(tables), None)])
+
+    def block_version(self, block_id):
+        """Версия данных блока"""
+        return f"{self._epoch}.{self._block_versions.get(str(block_id), 0)}"
+
+    def mine_version(self):
+        """Версия данных всей шахты (меняется при любом событии)"""
+        return str(self._mine_version)
+
+    def covers(self, tables):
+        """Приходят ли сейчас уведомления об изменениях всех таблиц tables.
+
+        tables=None - источник, изменения которого уведомлениями не
+        отслеживаются: кэш таких данных всегда живет ограниченное время.
+        """
+        if tables is None or not self.listener_connected:
+            return False
+        return self.covered_tables.issuperset(tables)
+
+    def expired(self, tables, stored_at, fallback_ttl):
+        """Устарела ли запись кэша данных tables, сохраненная в stored_at (time.monotonic())"""
+        return not self.covers(tables) and time.monotonic() - stored_at > fallback_ttl
+
+invalidation_bus = InvalidationBus()
+
+# Отсутствующее значение VersionedCache (None - допустимое значение)
+_MISSING = object()
+
+class VersionedCache:
+    """Значения по ключу, действительные для версии данных из шины.
+
+    Запись отдается, пока ее версия совпадает с запрошенной и пока она не
+    устарела по InvalidationBus.expired(tables, ...). Сверх max_entries
+    (None - без ограничения) вытесняются давно не использованные записи.
+    """
+
+    def __init__(self, tables=None, fallback_ttl=300, max_entries=None, bus=invalidation_bus):
+        self.tables = tables
+        self.fallback_ttl = fallback_ttl
+        self.max_entries = max_entries
+        self.bus = bus
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def get(self, key, version, default=None):
+        """Значение версии version или default"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] != version or self.bus.expired(self.tables, entry[1], self.fallback_ttl):
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def get_or_build(self, key, version, builder):
+        """Значение версии version или builder(); одновременные сборки одного ключа выполняются один раз"""
+        value = self.get(key, version, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            try:
+                # Значение мог построить параллельный запрос, пока мы ждали блокировку
+                value = self.get(key, version, _MISSING)
+                if value is _MISSING:
+                    value = self.put(key, version, builder())
+                return value
+            finally:
+                with self._lock:
+                    self._build_locks.pop(key, None)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class NotificationListener(threading.Thread):
+    """Фоновый слушатель LISTEN/NOTIFY на отдельном соединении.
+
+    Уведомления, пришедшие в течение coalesce_window секунд, объединяются
+    по блокам и публикуются в шину одной пачкой.
+    """
+
+    def __init__(self, bus, db_config, coalesce_window=0.25, max_rows_per_block=5000, poll_timeout=5.0,
+                 coverage_interval=300.0):
+        super().__init__(name='notification-listener', daemon=True)
+        self.bus = bus
+        self.db_config = db_config
+        self.coalesce_window = coalesce_window
+        self.max_rows_per_block = max_rows_per_block
+        self.poll_timeout = poll_timeout
+        self.coverage_interval = coverage_interval
+        self._coverage_checked_at = 0.0
+        self._stop_event = threading.Event()
+        self._conn = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        backoff = 1
+        while not self._stop_event.is_set():
+            try:
+                self._connect()
+                backoff = 1
+                self._listen_loop()
+            except Exception as e:
+                logger.error(f"Notification listener error: {e}")
+            finally:
+                self._close()
+
+            if self._stop_event.is_set():
+                break
+
+            # Уведомления за время разрыва потеряны - сбрасываем все кэши
+            self.bus.invalidate_all()
+            logger.info(f"Notification listener reconnecting in {backoff}s")
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _connect(self):
+        self._conn = psycopg2.connect(**self.db_config, connect_timeout=10)
+        self._conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self._conn.cursor() as cursor:
+            for channel in CHANNEL_TABLES:
+                cursor.execute(f"LISTEN {channel}")
+        self._check_coverage()
+        self.bus.listener_connected = True
+        logger.info(f"Notification listener subscribed to {', '.join(CHANNEL_TABLES)}, "
+                    f"triggers on: {', '.join(sorted(self.bus.covered_tables)) or 'none'}")
+
+    def _check_coverage(self):
+        """Таблицы, для которых действительно созданы триггеры уведомлений"""
+        with self._conn.cursor() as cursor:
+            cursor.execute(COVERED_TABLES_QUERY, (TRIGGER_FUNCTION,))
+            covered = frozenset(row[0] for row in cursor.fetchall())
+        if covered != self.bus.covered_tables:
+            missing = set(table for tables in CHANNEL_TABLES.values() for table in tables) - covered
+            if missing:
+                logger.warning(f"No notify triggers on {', '.join(sorted(missing))}, caches of these tables expire by TTL")
+        self.bus.covered_tables = covered
+        self._coverage_checked_at = time.monotonic()
+
+    def _close(self):
+        self.bus.listener_connected = False
+        self.bus.covered_tables = frozenset()
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _listen_loop(self):
+        conn = self._conn
+        while not self._stop_event.is_set():
+            if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                # Триггеры могли создать или удалить после подключения
+                if time.monotonic() - self._coverage_checked_at > self.coverage_interval:
+                    self._check_coverage()
+                # Уведомления, полученные во время запроса, уже прочитаны драйвером
+                if not conn.notifies:
+                    continue
+
+            conn.poll()
+            if not conn.notifies:
+                continue
+
+            # Собираем пачку уведомлений за окно объединения
+            notifies = list(conn.notifies)
+            conn.notifies.clear()
+            deadline = time.monotonic() + self.coalesce_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if select.select([conn], [], [], remaining) != ([], [], []):
+                    conn.poll()
+                    notifies.extend(conn.notifies)
+                    conn.notifies.clear()
+
+            events = self._coalesce(notifies)
+            logger.info(f"Received {len(notifies)} notifications, publishing {len(events)} invalidation events")
+            self.bus.publish(events)
+
+    def _coalesce(self, notifies):
+        """Объединение уведомлений в события по блокам"""
+        tables_by_block = {}
+        rows_by_block = {}
+
+        for notify in notifies:
+            try:
+                payload = json.loads(notify.payload) if notify.payload else {}
+            except ValueError:
+                payload = {}
+
+            block_id = payload.get('block_id')
+            block_id = str(block_id) if block_id is not None else None
+            table = payload.get('table') or CHANNEL_TABLES.get(notify.channel, ('',))[0]
+
+            tables_by_block.setdefault(block_id, set()).add(table)
+            rows = rows_by_block.setdefault(block_id, [])
+            if rows is not None:
+                if len(rows) >= self.max_rows_per_block:
+                    rows_by_block[block_id] = None
+                else:
+                    rows.append(payload)
+
+        return [
+            InvalidationEvent(block_id, frozenset(tables), tuple(rows_by_block[block_id]) if rows_by_block[block_id] is not None else None)
+            for block_id, tables in tables_by_block.items()
+        ]
+
+_listener = None
+
+def start_listener(app):
+    """Запуск слушателя уведомлений (один на процесс)"""
+    global _listener
+    if _listener is not None and _listener.is_alive():
+        return _listener
+
+    with app.app_context():
+        db_config = db_manager.get_db_config()
+    
+    _listener = NotificationListener(
+        invalidation_bus,
+        db_config,
+        coalesce_window=float(app.config.get('NOTIFY_COALESCE_WINDOW', 0.25))
+    )
+    _listener.start()
+    return _listener
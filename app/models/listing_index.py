@@ -0,0 +1,198 @@
+# listing_index.py
+import base64
+import bisect
+import json
+import logging
+import threading
+
+from app.models.invalidation import VersionedCache, invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Параметры запроса, включающие постраничный режим списков
+PAGE_PARAMS = ('limit', 'after', 'sort', 'prefix', 'min_percent', 'max_percent', 'is_blasted')
+
+def _sort_key(value, row_id):
+    """Ключ сортировки: NULL в конце, при равенстве - по идентификатору строки (кортежу)"""
+    return (value is None, 0 if value is None else value, row_id)
+
+def encode_cursor(key):
+    """Непрозрачный курсор keyset пагинации из ключа последней строки"""
+    payload = json.dumps([key[1] if not key[0] else None, list(key[2])], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(row_id, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return _sort_key(value, tuple(row_id))
+
+def _parse_bool(value):
+    value = value.strip().lower()
+    if value in ('true', '1', 'yes'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+class SortedListing:
+    """Кэшированный список строк с отсортированными индексами для keyset пагинации.
+
+    Строки загружаются loader() и хранятся до изменения версии данных
+    (по умолчанию - версии всей шахты) и не дольше fallback_ttl секунд, если
+    уведомления приходят не обо всех таблицах tables (None - данные без
+    уведомлений). Индекс
+    сортировки по колонке строится один раз на версию данных, после чего
+    страница находится бинарным поиском по курсору и не зависит от глубины
+    пролистывания.
+
+    id_column - колонка или кортеж колонок, однозначно определяющих строку:
+    по ним упорядочиваются строки с равным значением сортировки, и курсор
+    не должен совпадать у разных строк. С фильтрами страница набирается
+    просмотром индекса от курсора, а total считается по всем строкам,
+    прошедшим фильтры.
+    """
+
+    def __init__(self, name, loader, id_column, sort_columns, default_sort,
+                 name_column=None, percent_column=None, blasted_ids=None, version=None, tables=None, fallback_ttl=60):
+        self.name = name
+        self.loader = loader
+        self.id_columns = (id_column,) if isinstance(id_column, str) else tuple(id_column)
+        self.sort_columns = tuple(sort_columns)
+        self.default_sort = default_sort
+        self.name_column = name_column
+        self.percent_column = percent_column
+        self.blasted_ids = blasted_ids
+        self.version = version or invalidation_bus.mine_version
+        self._cache = VersionedCache(tables, fallback_ttl, max_entries=1)
+        self._lock = threading.Lock()
+
+    def _load(self):
+        rows = list(self.loader())
+        logger.info(f"Listing {self.name} loaded: {len(rows)} rows")
+        # Индексы сортировки строятся по мере запросов
+        return rows, {}
+
+    def _fresh(self):
+        """Строки и индексы текущей версии данных (под блокировкой)"""
+        return self._cache.get_or_build('rows', self.version(), self._load)
+
+    def _order(self, column):
+        """Строки, отсортированные по колонке по возрастанию, и их ключи (под блокировкой)"""
+        rows, orders = self._fresh()
+        order = orders.get(column)
+        if order is None:
+            keyed = sorted(
+                ((_sort_key(row.get(column), self._row_id(row)), row) for row in rows),
+                key=lambda item: item[0]
+            )
+            order = orders[column] = ([key for key, _ in keyed], [row for _, row in keyed])
+        return order
+
+    def _row_id(self, row):
+        return tuple(str(row.get(id_column)) for id_column in self.id_columns)
+
+    def rows(self):
+        with self._lock:
+            return list(self._fresh()[0])
+
+    def _filter(self, prefix, min_percent, max_percent, blasted):
+        """Предикат фильтров страницы или None, если фильтров нет"""
+        checks = []
+        if prefix:
+            if self.name_column is None:
+                raise ValueError(f"Listing {self.name} has no name filter")
+            prefix = prefix.lower()
+            name_column = self.name_column
+            checks.append(lambda row: str(row.get(name_column) or '').lower().startswith(prefix))
+        if min_percent is not None or max_percent is not None:
+            if self.percent_column is None:
+                raise ValueError(f"Listing {self.name} has no percent filter")
+            low = float('-inf') if min_percent is None else min_percent
+            high = float('inf') if max_percent is None else max_percent
+            percent_column = self.percent_column
+            checks.append(lambda row: row.get(percent_column) is not None and low <= row[percent_column] <= high)
+        if blasted is not None:
+            if self.blasted_ids is None:
+                raise ValueError(f"Listing {self.name} has no is_blasted filter")
+            blasted_ids = self.blasted_ids()
+            checks.append(lambda row: (str(row.get('block_id')) in blasted_ids) == blasted)
+        if not checks:
+            return None
+        return lambda row: all(check(row) for check in checks)
+
+    def page(self, limit=DEFAULT_PAGE_SIZE, after=None, sort=None, prefix=None,
+             min_percent=None, max_percent=None, blasted=None):
+        """Страница строк после курсора: {'items', 'next', 'total'}.
+
+        sort - имя колонки, '-' в начале для убывания; blasted - фильтр
+        по признаку is_blasted блока строки.
+        """
+        sort = sort or self.default_sort
+        descending = sort.startswith('-')
+        column = sort.lstrip('-')
+        if column not in self.sort_columns:
+            raise ValueError(f"Unsupported sort column: {column}")
+        limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+        predicate = self._filter(prefix, min_percent, max_percent, blasted)
+
+        with self._lock:
+            keys, ordered = self._order(column)
+
+        if predicate is None:
+            total = len(ordered)
+        else:
+            total = sum(1 for row in ordered if predicate(row))
+
+        if descending:
+            end = bisect.bisect_left(keys, decode_cursor(after)) if after else len(keys)
+            indexes = range(end - 1, -1, -1)
+        else:
+            start = bisect.bisect_right(keys, decode_cursor(after)) if after else 0
+            indexes = range(start, len(keys))
+
+        items = []
+        last = None
+        has_more = False
+        for i in indexes:
+            row = ordered[i]
+            if predicate is not None and not predicate(row):
+                continue
+            if len(items) == limit:
+                has_more = True
+                break
+            items.append(row)
+            last = keys[i]
+
+        return {
+            'items': items,
+            'next': encode_cursor(last) if has_more else None,
+            'total': total
+        }
+
+def page_args(args):
+    """Разбор параметров постраничного запроса; None - запрошен полный список"""
+    if not any(param in args for param in PAGE_PARAMS):
+        return None
+
+    def number(name):
+        value = args.get(name)
+        return float(value) if value not in (None, '') else None
+
+    blasted = args.get('is_blasted')
+    return {
+        'limit': int(args.get('limit') or DEFAULT_PAGE_SIZE),
+        'after': args.get('after') or None,
+        'sort': args.get('sort') or None,
+        'prefix': (args.get('prefix') or '').strip() or None,
+        'min_percent': number('min_percent'),
+        'max_percent': number('max_percent'),
+        'blasted': _parse_bool(blasted) if blasted not in (None, '') else None
+    }
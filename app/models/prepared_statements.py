@@ -0,0 +1,177 @@
+# prepared_statements.py
+import logging
+import re
+import threading
+
+import psycopg2
+from psycopg2 import errors
+
+logger = logging.getLogger(__name__)
+
+_PARAM_RE = re.compile(r'\$(\d+)')
+
+class PreparedStatementRegistry:
+    """Реестр именованных горячих запросов.
+
+    Запрос подготавливается (PREPARE) один раз на соединение пула и далее
+    выполняется по имени (EXECUTE), без повторного разбора и планирования.
+    Для соединений вне пула и при ошибке подготовки используется обычное
+    выполнение того же запроса.
+    """
+
+    def __init__(self):
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, query):
+        """Регистрация запроса; параметры задаются в тексте как $1, $2, ..."""
+        if not re.match(r'^[a-z_][a-z0-9_]*$', name):
+            raise ValueError(f"Invalid prepared statement name: {name}")
+
+        numbers = [int(n) for n in _PARAM_RE.findall(query)]
+        param_count = max(numbers) if numbers else 0
+
+        # Тот же запрос в формате psycopg2 для выполнения без подготовки
+        fallback = _PARAM_RE.sub(lambda m: f"%(p{m.group(1)})s", query.replace('%', '%%'))
+
+        with self._lock:
+            self._statements[name] = {
+                'query': query,
+                'fallback': fallback,
+                'param_count': param_count
+            }
+
+    def names(self):
+        """Список зарегистрированных запросов"""
+        return list(self._statements)
+
+    def get(self, name):
+        """Описание зарегистрированного запроса"""
+        statement = self._statements.get(name)
+        if statement is None:
+            raise KeyError(f"Unknown prepared statement: {name}")
+        return statement
+
+    def execute(self, cursor, name, params=()):
+        """Выполнить запрос по имени на курсоре"""
+        statement = self.get(name)
+        params = tuple(params or ())
+        if len(params) != statement['param_count']:
+            raise ValueError(f"Statement {name} expects {statement['param_count']} params, got {len(params)}")
+
+        conn = cursor.connection
+        prepared = getattr(conn, 'prepared_statements', None)
+
+        if prepared is None or conn.autocommit:
+            # Соединение не из пула - подготовка не окупится
+            self._execute_plain(cursor, statement, params)
+            return cursor
+
+        if name not in prepared and not self._prepare(cursor, name, statement):
+            self._execute_plain(cursor, statement, params)
+            return cursor
+
+        try:
+            cursor.execute(self._execute_sql(name, statement), params)
+        except errors.InvalidSqlStatementName:
+            # Сессия была сброшена (DISCARD ALL и т.п.) - подготавливаем заново.
+            # Реестр используется только для запросов на чтение, поэтому откат безопасен.
+            logger.warning(f"Prepared statement {name} lost on connection, re-preparing")
+            conn.rollback()
+            prepared.clear()
+            if self._prepare(cursor, name, statement):
+                cursor.execute(self._execute_sql(name, statement), params)
+            else:
+                self._execute_plain(cursor, statement, params)
+        return cursor
+
+    def _prepare(self, cursor, name, statement):
+        """Подготовка запроса на соединении курсора"""
+        conn = cursor.connection
+        try:
+            cursor.execute("SAVEPOINT prepare_statement")
+            cursor.execute(f"PREPARE {name} AS {statement['query']}")
+            cursor.execute("RELEASE SAVEPOINT prepare_statement")
+        except psycopg2.Error as e:
+            logger.warning(f"Unable to prepare statement {name}: {e}")
+            try:
+                cursor.execute("ROLLBACK TO SAVEPOINT prepare_statement")
+            except psycopg2.Error:
+                conn.rollback()
+            return False
+
+        conn.prepared_statements.add(name)
+        logger.debug(f"Prepared statement {name} on backend {conn.get_backend_pid()}")
+        return True
+
+    @staticmethod
+    def _execute_sql(name, statement):
+        if statement['param_count'] == 0:
+            return f"EXECUTE {name}"
+        placeholders = ', '.join(['%s'] * statement['param_count'])
+        return f"EXECUTE {name} ({placeholders})"
+
+    @staticmethod
+    def _execute_plain(cursor, statement, params):
+        cursor.execute(statement['fallback'], {f"p{i + 1}": value for i, value in enumerate(params)})
+
+prepared_statements = PreparedStatementRegistry()
+
+# Горячие запросы дашборда, страниц блока и 3D визуализации
+prepared_statements.register('block_name_by_id', """
+    SELECT "BlockName" FROM public."BlockInfo"
+    WHERE "BlockID" = $1
+""")
+
+prepared_statements.register('block_by_name', """
+    SELECT "BlockID", "BlockName" FROM public."BlockInfo"
+    WHERE "BlockName" = $1
+""")
+
+prepared_statements.register('block_info_by_id', """
+    SELECT * FROM public."BlockInfo"
+    WHERE "BlockID" = $1
+""")
+
+prepared_statements.register('block_boreholes', """
+    SELECT
+        b."Name" as name,
+        EXISTS (
+            SELECT 1
+            FROM public."Boreholes" a
+            WHERE a."BlockID" = b."BlockID"
+            AND a."Name" = b."Name"
+            AND a."T" = 3
+        ) as active
+    FROM public."Boreholes" b
+    WHERE b."BlockID" = $1
+    GROUP BY b."Name", b."BlockID"
+    ORDER BY b."Name"
+""")
+
+prepared_statements.register('block_grid', """
+    SELECT
+        CASE WHEN "T" = 2 THEN "X" ELSE NULL END as planned_x,
+        CASE WHEN "T" = 2 THEN "Y" ELSE NULL END as planned_y,
+        CASE WHEN "T" = 3 THEN "X" ELSE NULL END as actual_x,
+        CASE WHEN "T" = 3 THEN "Y" ELSE NULL END as actual_y,
+        "Name" as borehole_name
+    FROM public."Boreholes"
+    WHERE "BlockID" = $1
+""")
+
+prepared_statements.register('boreholes_3d_by_block', """
+    SELECT * FROM public."Boreholes3D"
+    WHERE "BlockID" = $1
+""")
+
+prepared_statements.register('relief_items_by_block', """
+    SELECT "ItemID", "TID", "Z_Level" FROM public."ReliefItems"
+    WHERE "BlockID" = $1
+""")
+
+prepared_statements.register('relief_points_by_item', """
+    SELECT "X", "Y", "Z" FROM public."ReliefPoints"
+    WHERE "ReliefItemID" = $1
+    ORDER BY "PointOrder"
+""")
@@ -0,0 +1,350 @@
+# progress_model.py
+import logging
+import threading
+import time
+
+from psycopg2.extras import RealDictCursor
+
+from app.models.database import db_manager
+from app.models.invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Таблицы исходных данных прогресса бурения
+SOURCE_TABLES = ('Boreholes', 'BlockInfo')
+
+# Типы записей скважин
+PLANNED_T = 2
+ACTUAL_T = 3
+
+def safe_int(value, default=0):
+    try:
+        return int(value) if value is not None else default
+    except (ValueError, TypeError):
+        return default
+
+def safe_float(value, default=0.0):
+    try:
+        return float(value) if value is not None else default
+    except (ValueError, TypeError):
+        return default
+
+class BlockProgress:
+    """Счетчики прогресса бурения одного блока.
+
+    Проценты берутся из calculate_drilling_progress(): при сверке и при
+    перезапросе блоков, измененных уведомлениями; дельты уведомлений сразу
+    меняют счетчики скважин.
+    """
+
+    __slots__ = ('block_id', 'block_name', 'is_blasted',
+                 'total_holes_planned', 'total_holes_actual', 'drilled_holes_actual',
+                 'percent_drilled_planned', 'percent_drilled_actual',
+                 'planned_names', 'actual_names')
+
+    def __init__(self, block_id, block_name=None, is_blasted=False):
+        self.block_id = block_id
+        self.block_name = block_name
+        self.is_blasted = is_blasted
+        self.total_holes_planned = 0
+        self.total_holes_actual = 0
+        self.drilled_holes_actual = 0
+        self.percent_drilled_planned = 0.0
+        self.percent_drilled_actual = 0.0
+        self.planned_names = set()
+        self.actual_names = set()
+
+    def to_dict(self):
+        return {
+            'block_id': self.block_id,
+            'block_name': self.block_name,
+            'total_holes_planned': self.total_holes_planned,
+            'total_holes_actual': self.total_holes_actual,
+            'drilled_holes_actual': self.drilled_holes_actual,
+            'percent_drilled_planned': self.percent_drilled_planned,
+            'percent_drilled_actual': self.percent_drilled_actual,
+            'is_blasted': self.is_blasted
+        }
+
+class ProgressModel:
+    """Инкрементальная модель прогресса бурения по шахте.
+
+    Счетчики и проценты по блокам загружаются из calculate_drilling_progress(),
+    счетчики скважин далее обновляются дельтами по измененным скважинам из
+    уведомлений (переход записи в план T=2 / факт T=3), а проценты этих
+    блоков и сводка по шахте перезапрашиваются в фоне сразу после
+    уведомления. Периодически модель сверяется с полным пересчетом; без
+    уведомлений по SOURCE_TABLES - каждые stale_after секунд. Сверка, кроме
+    самой первой, идет в фоне, а пока она идет, текущие счетчики отдаются
+    как есть.
+    """
+
+    def __init__(self, reconcile_interval=900, stale_after=60):
+        self.reconcile_interval = reconcile_interval
+        self.stale_after = stale_after
+        self._blocks = {}
+        self._total_blocks = 0
+        self._drilled_blocks = 0
+        self._percent_drilled = 0.0
+        self._reconciled_at = 0.0
+        self._needs_reconcile = True
+        # Изменения, пришедшие во время сверки: применяются к новым счетчикам
+        self._pending = None
+        # Блоки, проценты которых нужно перезапросить после дельт
+        self._dirty = set()
+        # Номер состояния модели: меняется при каждом изменении счетчиков или процентов
+        self._generation = 0
+        self._lock = threading.RLock()
+        self._reconcile_lock = threading.Lock()
+        invalidation_bus.subscribe(self._on_invalidation)
+
+    def init_app(self, app):
+        self.reconcile_interval = int(app.config.get('PROGRESS_RECONCILE_INTERVAL', self.reconcile_interval))
+        self.stale_after = int(app.config.get('PROGRESS_STALE_AFTER', self.stale_after))
+
+    def reconcile(self):
+        """Полный пересчет и замена всех счетчиков"""
+        with self._reconcile_lock:
+            self._reconcile()
+        self._schedule_refresh()
+
+    def _reconcile(self):
+        """Пересчет (под _reconcile_lock)"""
+        with self._lock:
+            self._pending = []
+            self._needs_reconcile = False
+            # Изменения до начала сверки попадут в ее выборку
+            self._dirty = set()
+        try:
+            with db_manager.get_cursor(RealDictCursor, numeric_as_float=True) as cursor:
+                cursor.execute("SELECT * FROM calculate_drilling_progress()")
+                progress_rows = cursor.fetchall()
+
+                cursor.execute("SELECT * FROM calculate_blocks_progress()")
+                summary = cursor.fetchone() or {}
+
+                cursor.execute("""
+                    SELECT "BlockID"::text AS block_id, "Name" AS name, "T" AS t
+                    FROM public."Boreholes"
+                    WHERE "T" IN (2, 3)
+                """)
+                name_rows = cursor.fetchall()
+        except Exception:
+            with self._lock:
+                self._pending = None
+                self._needs_reconcile = True
+            raise
+
+        blocks = {}
+        for row in progress_rows:
+            block_id = str(row.get('block_id'))
+            progress = BlockProgress(block_id, row.get('block_name'), bool(row.get('is_blasted')))
+            progress.total_holes_planned = safe_int(row.get('total_holes_planned'))
+            progress.total_holes_actual = safe_int(row.get('total_holes_actual'))
+            progress.drilled_holes_actual = safe_int(row.get('drilled_holes_actual'))
+            progress.percent_drilled_planned = safe_float(row.get('percent_drilled_planned'))
+            progress.percent_drilled_actual = safe_float(row.get('percent_drilled_actual'))
+            blocks[block_id] = progress
+
+        for row in name_rows:
+            progress = blocks.get(row['block_id'])
+            if progress is None:
+                progress = blocks[row['block_id']] = BlockProgress(row['block_id'])
+            if row['t'] == PLANNED_T:
+                progress.planned_names.add(row['name'])
+            else:
+                progress.actual_names.add(row['name'])
+
+        with self._lock:
+            self._drift_report(blocks)
+            self._blocks = blocks
+            self._total_blocks = safe_int(summary.get('total_blocks'), len(blocks))
+            self._drilled_blocks = safe_int(summary.get('drilled_blocks'))
+            self._percent_drilled = safe_float(summary.get('percent_drilled'))
+            # Повтор дельт безопасен: изменения, уже попавшие в выборку, не меняют множества имен
+            for block_id, row in self._pending:
+                self._apply_row(block_id, row)
+            replayed = len(self._pending)
+            self._pending = None
+            self._reconciled_at = time.monotonic()
+            self._generation += 1
+
+        logger.info(f"Progress model reconciled: {len(blocks)} blocks, {replayed} changes replayed")
+
+    def _drift_report(self, blocks):
+        """Логирование расхождений инкрементальных счетчиков с полным пересчетом"""
+        drifted = [
+            block_id for block_id, fresh in blocks.items()
+            if block_id in self._blocks
+            and (self._blocks[block_id].total_holes_actual != fresh.total_holes_actual
+                 or self._blocks[block_id].total_holes_planned != fresh.total_holes_planned)
+        ]
+        if drifted:
+            logger.warning(f"Progress model drift corrected for {len(drifted)} blocks")
+
+    def _is_stale(self):
+        age = time.monotonic() - self._reconciled_at
+        limit = self.reconcile_interval if invalidation_bus.covers(SOURCE_TABLES) else self.stale_after
+        return self._needs_reconcile or age >= limit
+
+    def _background_reconcile(self):
+        """Сверка в фоне; _reconcile_lock уже захвачен вызывающим потоком"""
+        try:
+            if self._is_stale():
+                self._reconcile()
+        except Exception as e:
+            logger.error(f"Error reconciling progress model: {e}")
+        finally:
+            self._reconcile_lock.release()
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        """Фоновый перезапрос процентов измененных блоков, если он еще не идет"""
+        if self._dirty and self._reconciled_at and self._reconcile_lock.acquire(blocking=False):
+            threading.Thread(target=self._background_refresh, name='progress-refresh', daemon=True).start()
+
+    def _background_refresh(self):
+        """Перезапрос, пока есть измененные блоки; _reconcile_lock уже захвачен"""
+        try:
+            while True:
+                with self._lock:
+                    block_ids, self._dirty = self._dirty, set()
+                if not block_ids:
+                    break
+                self._refresh_blocks(block_ids)
+        except Exception as e:
+            logger.error(f"Error refreshing progress percentages: {e}")
+            with self._lock:
+                self._needs_reconcile = True
+        finally:
+            self._reconcile_lock.release()
+        # Изменения, пришедшие между последней проверкой и освобождением блокировки
+        self._schedule_refresh()
+
+    def _refresh_blocks(self, block_ids):
+        """Проценты и признак взрыва блоков и сводка по шахте из SQL"""
+        with db_manager.get_cursor(RealDictCursor, numeric_as_float=True) as cursor:
+            cursor.execute(
+                "SELECT * FROM calculate_drilling_progress() WHERE block_id::text = ANY(%s)",
+                (sorted(block_ids),)
+            )
+            progress_rows = cursor.fetchall()
+
+            cursor.execute("SELECT * FROM calculate_blocks_progress()")
+            summary = cursor.fetchone() or {}
+
+        with self._lock:
+            for row in progress_rows:
+                progress = self._blocks.get(str(row.get('block_id')))
+                if progress is None:
+                    continue
+                progress.block_name = row.get('block_name') or progress.block_name
+                progress.is_blasted = bool(row.get('is_blasted'))
+                progress.percent_drilled_planned = safe_float(row.get('percent_drilled_planned'))
+                progress.percent_drilled_actual = safe_float(row.get('percent_drilled_actual'))
+            self._total_blocks = safe_int(summary.get('total_blocks'), self._total_blocks)
+            self._drilled_blocks = safe_int(summary.get('drilled_blocks'))
+            self._percent_drilled = safe_float(summary.get('percent_drilled'))
+            self._generation += 1
+
+        logger.info(f"Progress percentages refreshed for {len(block_ids)} blocks")
+
+    def _ensure_fresh(self):
+        """Первая загрузка - синхронно, далее сверка по расписанию в фоне"""
+        if not self._is_stale():
+            return
+        if self._reconciled_at:
+            # Одна фоновая сверка за раз; остальные запросы отдают текущие счетчики
+            if self._reconcile_lock.acquire(blocking=False):
+                threading.Thread(target=self._background_reconcile, name='progress-reconcile', daemon=True).start()
+            return
+        with self._reconcile_lock:
+            # Пока ждали блокировку, сверку мог выполнить другой запрос
+            if self._is_stale():
+                self._reconcile()
+
+    def _on_invalidation(self, events):
+        """Применение дельт по измененным скважинам"""
+        with self._lock:
+            for event in events:
+                if event.tables and 'Boreholes' not in event.tables:
+                    continue
+                if event.block_id is None or event.rows is None:
+                    # Детали изменений потеряны - нужен полный пересчет
+                    self._needs_reconcile = True
+                    continue
+                for row in event.rows:
+                    if row.get('table') == 'Boreholes':
+                        self._apply_row(event.block_id, row)
+                        self._dirty.add(event.block_id)
+                        if self._pending is not None:
+                            self._pending.append((event.block_id, row))
+        # Запросы к БД не выполняются в потоке слушателя
+        self._schedule_refresh()
+
+    def _apply_row(self, block_id, row):
+        """Изменение одной скважины: переход между планом и фактом"""
+        name = row.get('name')
+        t_old = row.get('t_old')
+        t_new = row.get('t_new')
+        if name is None or t_old == t_new and row.get('op') == 'UPDATE':
+            return
+
+        progress = self._blocks.get(block_id)
+        if progress is None:
+            progress = self._blocks[block_id] = BlockProgress(block_id)
+            self._total_blocks += 1
+
+        if t_old == PLANNED_T and name in progress.planned_names:
+            progress.planned_names.discard(name)
+            progress.total_holes_planned -= 1
+        if t_old == ACTUAL_T and name in progress.actual_names:
+            progress.actual_names.discard(name)
+            progress.total_holes_actual -= 1
+            progress.drilled_holes_actual -= 1
+
+        if t_new == PLANNED_T and name not in progress.planned_names:
+            progress.planned_names.add(name)
+            progress.total_holes_planned += 1
+        if t_new == ACTUAL_T and name not in progress.actual_names:
+            progress.actual_names.add(name)
+            progress.total_holes_actual += 1
+            progress.drilled_holes_actual += 1
+        self._generation += 1
+
+    def version(self):
+        """Версия данных модели для кэшей, построенных по ней"""
+        self._ensure_fresh()
+        with self._lock:
+            return str(self._generation)
+
+    def drilling_progress(self):
+        """Прогресс бурения по блокам (как calculate_drilling_progress())"""
+        self._ensure_fresh()
+        with self._lock:
+            return [progress.to_dict() for progress in self._blocks.values()]
+
+    def blocks_progress(self):
+        """Сводный прогресс по шахте (как calculate_blocks_progress())"""
+        self._ensure_fresh()
+        with self._lock:
+            return {
+                'total_blocks': self._total_blocks,
+                'drilled_blocks': self._drilled_blocks,
+                'percent_drilled': self._percent_drilled
+            }
+
+    def blasted_block_ids(self):
+        """ID взорванных блоков"""
+        self._ensure_fresh()
+        with self._lock:
+            return {block_id for block_id, progress in self._blocks.items() if progress.is_blasted}
+
+    def block_progress(self, block_id):
+        """Прогресс одного блока"""
+        self._ensure_fresh()
+        with self._lock:
+            progress = self._blocks.get(str(block_id))
+            return progress.to_dict() if progress else None
+
+progress_model = ProgressModel()
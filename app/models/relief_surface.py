@@ -0,0 +1,178 @@
+# relief_surface.py
+import logging
+import time
+
+import numpy as np
+from psycopg2.extras import RealDictCursor
+from scipy.interpolate import LinearNDInterpolator
+from scipy.spatial import Delaunay, QhullError, cKDTree
+
+from app.models.database import db_manager
+from app.models.invalidation import VersionedCache, invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Таблицы исходных данных поверхностей и отметок устьев
+SOURCE_TABLES = ('ReliefItems', 'ReliefPoints', 'Boreholes')
+
+RELIEF_TABLES = ('ReliefItems', 'ReliefPoints')
+
+# Точки рельефа блока одним запросом вместо выборки по каждому элементу
+RELIEF_POINTS_QUERY = """
+    SELECT p."X" AS x, p."Y" AS y, COALESCE(p."Z", i."Z_Level") AS z
+    FROM public."ReliefItems" i
+    JOIN public."ReliefPoints" p ON p."ReliefItemID" = i."ItemID"
+    WHERE i."BlockID" = %s
+      AND p."X" IS NOT NULL AND p."Y" IS NOT NULL
+      AND COALESCE(p."Z", i."Z_Level") IS NOT NULL
+"""
+
+COLLARS_QUERY = """
+    SELECT "Name" AS name, "T" AS t, "X" AS x, "Y" AS y, "Z" AS z
+    FROM public."Boreholes"
+    WHERE "BlockID" = %s AND "T" IN (2, 3)
+      AND "X" IS NOT NULL AND "Y" IS NOT NULL
+    ORDER BY "Name", "T"
+"""
+
+COLLAR_TYPES = {2: 'planned', 3: 'actual'}
+
+class ReliefSurface:
+    """Сеточная модель поверхности рельефа блока.
+
+    Узлы регулярной сетки с шагом resolution (не больше max_cells узлов)
+    один раз заполняются линейной интерполяцией по триангуляции Делоне
+    точек рельефа; запрос высот - билинейная интерполяция по сетке
+    массивами NumPy. Вне выпуклой оболочки точек рельефа (и при вырожденной
+    триангуляции) высота берется у ближайшей точки рельефа.
+    """
+
+    def __init__(self, points, resolution=1.0, max_cells=250000):
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        self.point_count = len(points)
+        self._tree = cKDTree(points[:, :2])
+        self._z = points[:, 2]
+        self._grid = None
+
+        if self.point_count < 3:
+            return
+        try:
+            interpolator = LinearNDInterpolator(Delaunay(points[:, :2]), self._z)
+        except QhullError as e:
+            logger.warning(f"Relief triangulation failed, using nearest points: {str(e).splitlines()[0]}")
+            return
+
+        self._origin = points[:, :2].min(axis=0)
+        extent = points[:, :2].max(axis=0) - self._origin
+        self._cell = max(resolution, float(np.sqrt(extent[0] * extent[1] / max_cells)))
+        self._shape = (np.ceil(extent / self._cell).astype(int) + 1)
+        gx = self._origin[0] + np.arange(self._shape[0]) * self._cell
+        gy = self._origin[1] + np.arange(self._shape[1]) * self._cell
+        # Узлы в построчном порядке: соседние запросы ищут треугольник рядом с предыдущим
+        nodes = np.stack(np.meshgrid(gx, gy, indexing='ij'), axis=-1).reshape(-1, 2)
+        self._grid = interpolator(nodes).reshape(self._shape)
+
+    def z_at(self, x, y):
+        """Высоты поверхности в точках (x, y) и признак экстраполяции"""
+        xy = np.column_stack((np.asarray(x, dtype=float), np.asarray(y, dtype=float)))
+        z = np.full(len(xy), np.nan)
+
+        if self._grid is not None:
+            position = (xy - self._origin) / self._cell
+            inside = np.all((position >= 0) & (position <= self._shape - 1), axis=1)
+            cell = np.minimum(np.floor(position[inside]).astype(int), self._shape - 2)
+            fx, fy = (position[inside] - cell).T
+            i, j = cell.T
+            grid = self._grid
+            z[inside] = (grid[i, j] * (1 - fx) * (1 - fy) + grid[i + 1, j] * fx * (1 - fy)
+                         + grid[i, j + 1] * (1 - fx) * fy + grid[i + 1, j + 1] * fx * fy)
+
+        outside = np.isnan(z)
+        if outside.any():
+            _, nearest = self._tree.query(xy[outside])
+            z[outside] = self._z[nearest]
+        return z, outside
+
+class ReliefSurfaces:
+    """Кэш поверхностей рельефа по блокам.
+
+    Поверхность строится один раз на версию данных блока и вытесняется по
+    давности использования сверх max_entries блоков; события шины по
+    рельефу блока сразу удаляют ее. Без уведомлений об изменениях таблиц
+    SOURCE_TABLES поверхность перестраивается не реже fallback_ttl секунд.
+    """
+
+    def __init__(self, max_entries=64, resolution=1.0, fallback_ttl=300):
+        self.resolution = resolution
+        self._surfaces = VersionedCache(SOURCE_TABLES, fallback_ttl, max_entries=max_entries)
+        invalidation_bus.subscribe(self._on_invalidation)
+
+    def init_app(self, app):
+        self._surfaces.max_entries = int(app.config.get('RELIEF_SURFACE_CACHE_SIZE', self._surfaces.max_entries))
+        self.resolution = float(app.config.get('RELIEF_GRID_RESOLUTION', self.resolution))
+
+    def _on_invalidation(self, events):
+        for event in events:
+            if event.tables and not any(table in event.tables for table in RELIEF_TABLES):
+                continue
+            if event.block_id is None:
+                self._surfaces.clear()
+            else:
+                self._surfaces.discard(str(event.block_id))
+
+    def surface(self, block_id, cursor=None):
+        """Поверхность рельефа блока (None - у блока нет точек рельефа)"""
+        block_id = str(block_id)
+        return self._surfaces.get_or_build(block_id, invalidation_bus.block_version(block_id),
+                                           lambda: self._build(block_id, cursor))
+
+    def _build(self, block_id, cursor):
+        started = time.monotonic()
+        if cursor is None:
+            with db_manager.get_cursor(RealDictCursor, numeric_as_float=True) as own_cursor:
+                own_cursor.execute(RELIEF_POINTS_QUERY, (block_id,))
+                rows = own_cursor.fetchall()
+        else:
+            cursor.execute(RELIEF_POINTS_QUERY, (block_id,))
+            rows = cursor.fetchall()
+
+        surface = None
+        if rows:
+            surface = ReliefSurface([(row['x'], row['y'], row['z']) for row in rows], self.resolution)
+            logger.info(f"Relief surface for block {block_id} built from {surface.point_count} points "
+                        f"in {time.monotonic() - started:.3f}s")
+        return surface
+
+    def collar_deviations(self, block_id):
+        """Отклонение высоты устья от поверхности рельефа для скважин блока"""
+        with db_manager.get_cursor(RealDictCursor, numeric_as_float=True) as cursor:
+            surface = self.surface(block_id, cursor)
+            if surface is None:
+                return None
+            cursor.execute(COLLARS_QUERY, (str(block_id),))
+            collars = cursor.fetchall()
+
+        if not collars:
+            return []
+
+        x = np.array([row['x'] for row in collars], dtype=float)
+        y = np.array([row['y'] for row in collars], dtype=float)
+        collar_z = np.array([row['z'] for row in collars], dtype=float)
+        surface_z, extrapolated = surface.z_at(x, y)
+        deviation = collar_z - surface_z
+
+        return [
+            {
+                'borehole_name': row['name'],
+                'type': COLLAR_TYPES.get(row['t']),
+                'x': row['x'],
+                'y': row['y'],
+                'collar_z': row['z'],
+                'surface_z': round(float(surface_z[i]), 3),
+                'elevation_deviation': None if np.isnan(deviation[i]) else round(float(deviation[i]), 3),
+                'extrapolated': bool(extrapolated[i])
+            }
+            for i, row in enumerate(collars)
+        ]
+
+relief_surfaces = ReliefSurfaces()
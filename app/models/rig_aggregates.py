@@ -0,0 +1,180 @@
+# rig_aggregates.py
+import logging
+import threading
+from collections import namedtuple
+
+from psycopg2.extras import RealDictCursor
+
+from app.models.database import db_manager
+from app.models.invalidation import VersionedCache, invalidation_bus
+from app.models.rig_rollups import rig_rollups
+from app.utils.validators import safe_float_conversion
+
+logger = logging.getLogger(__name__)
+
+# Производительность считается по сменным записям бурения, уведомлений о них нет
+SOURCE_TABLES = None
+
+# Загруженная иерархия: строки станок/блок, они же по блокам, итоги по станкам, моделям, блокам и шахте
+RigHierarchy = namedtuple('RigHierarchy', ['rows', 'by_block', 'rigs', 'models', 'blocks', 'mine'])
+
+def _performance(depth, shifts_count):
+    return depth / shifts_count if shifts_count else 0.0
+
+class RigAggregate:
+    """Суммы производительности на одном уровне иерархии"""
+
+    __slots__ = ('total_depth', 'drill_hours', 'shifts_count', 'rigs')
+
+    def __init__(self):
+        self.total_depth = 0.0
+        self.drill_hours = 0.0
+        self.shifts_count = 0
+        self.rigs = set()
+
+    def add(self, row):
+        self.total_depth += row['total_depth']
+        self.drill_hours += row['drill_hours']
+        self.shifts_count += row['shifts_count']
+        self.rigs.add(row['rig_id'])
+
+    @property
+    def performance_m_per_shift(self):
+        return _performance(self.total_depth, self.shifts_count)
+
+class RigAggregates:
+    """Иерархия производительности станков из одной выборки на версию данных.
+
+    Производительность станок/блок берется одним запросом (из свертки, если
+    она включена) вместе со справочником станков; итоги по станкам, моделям,
+    блокам и шахте пересчитываются из нее в памяти. Данные обновляются при
+    смене версии данных шахты или свертки и не реже fallback_ttl секунд:
+    об изменениях сменных записей бурения уведомления не приходят.
+    """
+
+    def __init__(self, fallback_ttl=60):
+        self._cache = VersionedCache(SOURCE_TABLES, fallback_ttl, max_entries=1)
+        self._lock = threading.Lock()
+
+    def version(self):
+        """Версия исходных данных: шахта и последнее обновление свертки"""
+        return (invalidation_bus.mine_version(), rig_rollups.refreshed_at)
+
+    def _load(self):
+        """Единственная выборка производительности и справочника станков"""
+        with db_manager.get_cursor(RealDictCursor, numeric_as_float=True) as cursor:
+            if rig_rollups.enabled:
+                # Итоги из предагрегированной свертки вместо полного пересчета истории
+                productivity = rig_rollups.totals(cursor)
+            else:
+                cursor.execute("SELECT * FROM calculate_rig_productivity_by_block()")
+                productivity = cursor.fetchall()
+
+            cursor.execute('SELECT id::text AS rig_id, name, model FROM public."DrillingRigs"')
+            directory = {row['rig_id']: row for row in cursor.fetchall()}
+
+        rows = []
+        by_block = {}
+        rigs = {}
+        models = {}
+        blocks = {}
+        mine = RigAggregate()
+        for source in productivity:
+            rig_id = str(source.get('rig_id', ''))
+            info = directory.get(rig_id)
+            row = {
+                'rig_id': rig_id,
+                'block_id': str(source.get('block_id', '')),
+                'rig_name': info['name'] if info and info['name'] is not None else '-',
+                'rig_model': info['model'] if info and info['model'] is not None else '-',
+                'total_depth': safe_float_conversion(source.get('total_depth')),
+                'drill_hours': safe_float_conversion(source.get('drill_hours')),
+                'shifts_count': int(source.get('shifts_count') or 0)
+            }
+            performance = source.get('performance_m_per_shift')
+            row['performance_m_per_shift'] = (
+                safe_float_conversion(performance) if performance is not None else _performance(row['total_depth'], row['shifts_count'])
+            )
+            rows.append(row)
+            by_block.setdefault(row['block_id'], {})[rig_id] = row
+
+            rigs.setdefault(rig_id, RigAggregate()).add(row)
+            blocks.setdefault(row['block_id'], RigAggregate()).add(row)
+            mine.add(row)
+            # Станки без записи в справочнике не относятся ни к одной модели
+            if info is not None and info['model'] is not None:
+                models.setdefault(info['model'], {})[rig_id] = rigs[rig_id]
+
+        logger.info(f"Rig aggregates loaded: {len(rows)} rig/block rows, {len(rigs)} rigs, {len(models)} models")
+        return RigHierarchy(rows, by_block, rigs, models, blocks, mine)
+
+    def _fresh(self):
+        """Иерархия текущей версии данных; одновременные перезагрузки выполняются один раз"""
+        with self._lock:
+            return self._cache.get_or_build('hierarchy', self.version(), self._load)
+
+    def rig_block_rows(self):
+        """Производительность станок/блок (как calculate_rig_productivity_by_block())"""
+        return list(self._fresh().rows)
+
+    def block_rigs(self, block_id):
+        """Станки блока: rig_id -> строка производительности станок/блок"""
+        return dict(self._fresh().by_block.get(str(block_id), {}))
+
+    def rigs(self):
+        """Итоги по станкам со справочными данными"""
+        hierarchy = self._fresh()
+        rigs = hierarchy.rigs
+        names = {row['rig_id']: (row['rig_name'], row['rig_model']) for row in hierarchy.rows}
+        return [
+            {
+                'rig_id': rig_id,
+                'rig_name': names[rig_id][0],
+                'rig_model': names[rig_id][1],
+                'total_depth': aggregate.total_depth,
+                'drill_hours': aggregate.drill_hours,
+                'shifts_count': aggregate.shifts_count,
+                'performance_m_per_shift': aggregate.performance_m_per_shift
+            }
+            for rig_id, aggregate in rigs.items()
+        ]
+
+    def models(self):
+        """Производительность по моделям: средняя по станкам модели"""
+        models = {model: list(rigs.values()) for model, rigs in self._fresh().models.items()}
+        return [
+            {
+                'rig_model': model,
+                'rig_count': len(rigs),
+                'avg_performance_m_per_shift': sum(rig.performance_m_per_shift for rig in rigs) / len(rigs)
+            }
+            for model, rigs in sorted(models.items())
+        ]
+
+    def blocks(self):
+        """Итоги по блокам"""
+        blocks = self._fresh().blocks
+        return [
+            {
+                'block_id': block_id,
+                'rig_count': len(aggregate.rigs),
+                'total_depth': aggregate.total_depth,
+                'drill_hours': aggregate.drill_hours,
+                'shifts_count': aggregate.shifts_count,
+                'performance_m_per_shift': aggregate.performance_m_per_shift
+            }
+            for block_id, aggregate in blocks.items()
+        ]
+
+    def mine(self):
+        """Итоги по шахте"""
+        aggregate = self._fresh().mine
+        return {
+            'rig_count': len(aggregate.rigs),
+            'total_depth': aggregate.total_depth,
+            'drill_hours': aggregate.drill_hours,
+            'shifts_count': aggregate.shifts_count,
+            'performance_m_per_shift': aggregate.performance_m_per_shift
+        }
+
+rig_aggregates = RigAggregates()
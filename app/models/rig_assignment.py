@@ -0,0 +1,124 @@
+# rig_assignment.py
+import logging
+import time
+
+import numpy as np
+from psycopg2.extras import RealDictCursor
+
+from app.models.database import db_manager
+from app.models.rig_aggregates import rig_aggregates
+from app.utils.validators import safe_float_conversion
+
+logger = logging.getLogger(__name__)
+
+# Цели оптимизации: время завершения последнего блока или взвешенная сумма времен завершения
+OBJECTIVES = ('makespan', 'weighted_completion')
+
+def load_open_blocks():
+    """Открытые блоки: суммарный остаток глубины и текущая оценка смен по станкам"""
+    with db_manager.get_cursor(RealDictCursor, numeric_as_float=True) as cursor:
+        cursor.execute("""
+            SELECT block_id::text AS block_id, rig_id::text AS rig_id, remaining_depth, remaining_shifts
+            FROM calculate_remaining_shifts_by_block_rig()
+            WHERE remaining_depth > 0
+        """)
+        rows = cursor.fetchall()
+
+    blocks = {}
+    current_load = {}
+    for row in rows:
+        blocks[row['block_id']] = blocks.get(row['block_id'], 0.0) + safe_float_conversion(row['remaining_depth'])
+        current_load[row['rig_id']] = current_load.get(row['rig_id'], 0.0) + safe_float_conversion(row['remaining_shifts'])
+    return blocks, current_load
+
+def assign(rates, depths, objective='makespan', weights=None):
+    """Назначение блоков станкам с разной производительностью (блок целиком одному станку).
+
+    makespan - жадный LPT: блоки по убыванию объема, каждый станку, который
+    закончит его раньше всех; weighted_completion - порядок WSPT (вес к
+    объему по убыванию) с тем же выбором станка. Выбор станка - одна
+    векторная операция по всем станкам, общая сложность O(B log B + B*R).
+    Возвращает массив индексов станков и смены начала и окончания блоков.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unsupported objective: {objective}")
+
+    rates = np.asarray(rates, dtype=float)
+    depths = np.asarray(depths, dtype=float)
+    weights = np.ones(len(depths)) if weights is None else np.asarray(weights, dtype=float)
+
+    if objective == 'makespan':
+        order = np.argsort(-depths, kind='stable')
+    else:
+        order = np.argsort(-(weights / np.maximum(depths, 1e-9)), kind='stable')
+
+    loads = np.zeros(len(rates))
+    inverse_rates = 1.0 / rates
+    rig_of = np.empty(len(depths), dtype=np.int64)
+    start = np.empty(len(depths))
+    finish = np.empty(len(depths))
+    for block in order:
+        completion = loads + depths[block] * inverse_rates
+        rig = int(completion.argmin())
+        rig_of[block] = rig
+        start[block] = loads[rig]
+        finish[block] = completion[rig]
+        loads[rig] = completion[rig]
+
+    return rig_of, start, finish
+
+def optimize(objective='makespan', rig_filter=None, block_filter=None, block_weights=None):
+    """Оптимальное по эвристике распределение открытых блоков по станкам"""
+    started = time.monotonic()
+    blocks, current_load = load_open_blocks()
+    rigs = [rig for rig in rig_aggregates.rigs() if rig['performance_m_per_shift'] > 0]
+
+    if rig_filter:
+        wanted = {str(rig_id) for rig_id in rig_filter}
+        rigs = [rig for rig in rigs if rig['rig_id'] in wanted]
+    if block_filter:
+        wanted = {str(block_id) for block_id in block_filter}
+        blocks = {block_id: depth for block_id, depth in blocks.items() if block_id in wanted}
+    if not rigs or not blocks:
+        return {'objective': objective, 'assignments': [], 'makespan_shifts': 0.0,
+                'weighted_completion_shifts': 0.0, 'current_makespan_shifts': 0.0}
+
+    block_ids = list(blocks)
+    depths = [blocks[block_id] for block_id in block_ids]
+    weights = [float((block_weights or {}).get(block_id, 1.0)) for block_id in block_ids]
+    rig_of, start, finish = assign(
+        [rig['performance_m_per_shift'] for rig in rigs],
+        depths, objective, weights
+    )
+
+    assignments = []
+    for index, rig in enumerate(rigs):
+        assigned = np.nonzero(rig_of == index)[0]
+        assigned = assigned[np.argsort(start[assigned])]
+        assignments.append({
+            'rig_id': rig['rig_id'],
+            'rig_name': rig['rig_name'],
+            'rig_model': rig['rig_model'],
+            'performance_m_per_shift': round(rig['performance_m_per_shift'], 1),
+            'load_shifts': round(float(finish[assigned].max()) if assigned.size else 0.0, 1),
+            'blocks': [
+                {
+                    'block_id': block_ids[block],
+                    'remaining_depth': round(depths[block], 1),
+                    'start_shift': round(float(start[block]), 1),
+                    'finish_shift': round(float(finish[block]), 1)
+                }
+                for block in assigned
+            ]
+        })
+
+    result = {
+        'objective': objective,
+        'assignments': assignments,
+        'makespan_shifts': round(float(finish.max()), 1),
+        'weighted_completion_shifts': round(float(np.dot(weights, finish)), 1),
+        'current_makespan_shifts': round(max(current_load.values(), default=0.0), 1)
+    }
+    logger.info(f"Rig assignment ({objective}): {len(block_ids)} blocks to {len(rigs)} rigs "
+                f"in {time.monotonic() - started:.3f}s, makespan {result['makespan_shifts']}")
+    return result
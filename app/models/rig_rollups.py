@@ -0,0 +1,183 @@
+# rig_rollups.py
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from psycopg2.extras import RealDictCursor
+
+from app.models.database import db_manager
+from app.models.invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+# Гранулярность свертки: выражение начала корзины по сменной корзине
+GRANULARITIES = {
+    'shift': 'r.bucket_start',
+    'day': "date_trunc('day', r.bucket_start)",
+    'week': "date_trunc('week', r.bucket_start)",
+}
+
+# Группировка: колонки ключа в выборке и в GROUP BY
+GROUPINGS = {
+    'rig': ('r.rig_id',),
+    'block': ('r.block_id',),
+    'rig_block': ('r.rig_id', 'r.block_id'),
+    'model': ("COALESCE(dr.model, '-')",),
+    'mine': (),
+}
+
+_GROUP_NAMES = {
+    'r.rig_id': 'rig_id',
+    'r.block_id': 'block_id',
+    "COALESCE(dr.model, '-')": 'rig_model',
+}
+
+def _performance(depth, shifts_count):
+    return round(depth / shifts_count, 1) if shifts_count else 0.0
+
+class RigRollups:
+    """Приращения производительности станков по времени обновления.
+
+    Приращения накопленных итогов calculate_rig_productivity_by_block()
+    записываются функцией refresh_rig_productivity_rollup()
+    (sql/rig_productivity_rollups.sql) в сменную корзину момента
+    обновления, а не смены бурения: пропуск обновлений сливает смены в
+    одну корзину, исправления данных дают отрицательные приращения,
+    истории до первого обновления нет. Поэтому корзины - ряд приращений
+    по времени обновления, а не выработка смен, и в прогнозе не
+    используются. Обновление выполняется в фоне раз в refresh_interval
+    секунд и вскоре после уведомлений об изменении данных станков.
+    """
+
+    def __init__(self, refresh_interval=300, shift_hours=12, shift_offset=8, debounce=5.0):
+        self.enabled = False
+        self.refresh_interval = refresh_interval
+        self.shift_hours = shift_hours
+        self.shift_offset = shift_offset
+        self.debounce = debounce
+        self.refreshed_at = 0.0
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.enabled = bool(app.config.get('RIG_ROLLUPS_ENABLED', self.enabled))
+        self.refresh_interval = int(app.config.get('RIG_ROLLUP_REFRESH_INTERVAL', self.refresh_interval))
+        self.shift_hours = int(app.config.get('RIG_ROLLUP_SHIFT_HOURS', self.shift_hours))
+        self.shift_offset = int(app.config.get('RIG_ROLLUP_SHIFT_OFFSET', self.shift_offset))
+        if not self.enabled:
+            return
+        invalidation_bus.subscribe(self._on_invalidation)
+        self._thread = threading.Thread(target=self._run, name='rig-rollups', daemon=True)
+        self._thread.start()
+
+    def _on_invalidation(self, events):
+        """Внеочередное обновление после изменения данных станков"""
+        if any(not event.tables or 'DrillingRigs' in event.tables for event in events):
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Rig rollup refresh failed: {e}")
+            triggered = self._wakeup.wait(self.refresh_interval)
+            if triggered:
+                # Пачка уведомлений объединяется в одно обновление
+                time.sleep(self.debounce)
+            self._wakeup.clear()
+
+    def refresh(self):
+        """Перенос приращений накопленных итогов в свертку; число изменившихся пар станок/блок"""
+        started = time.monotonic()
+        with db_manager.get_cursor(RealDictCursor) as cursor:
+            cursor.execute(
+                "SELECT public.refresh_rig_productivity_rollup(%s, %s) AS changed",
+                (self.shift_hours, self.shift_offset)
+            )
+            changed = cursor.fetchone()['changed']
+        self.refreshed_at = time.time()
+        logger.info(f"Rig rollup refreshed: {changed} rig/block pairs changed "
+                    f"in {time.monotonic() - started:.2f}s")
+        return changed
+
+    def totals(self, cursor):
+        """Накопленные итоги по станкам и блокам (как calculate_rig_productivity_by_block())"""
+        cursor.execute("""
+            SELECT rig_id, block_id, total_depth, drill_hours, shifts_count
+            FROM public.rig_productivity_snapshot
+            ORDER BY rig_id, block_id
+        """)
+        rows = cursor.fetchall()
+        for row in rows:
+            row['performance_m_per_shift'] = _performance(row['total_depth'], row['shifts_count'])
+        return rows
+
+    def refresh_deltas(self, granularity='day', start=None, end=None, group_by='rig', rig_id=None, block_id=None):
+        """Приращения по корзинам времени обновления в диапазоне [start, end)"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+        if group_by not in GROUPINGS:
+            raise ValueError(f"Unsupported grouping: {group_by}")
+
+        end = end or datetime.now(timezone.utc)
+        start = start or end - timedelta(days=30)
+        bucket = GRANULARITIES[granularity]
+        keys = GROUPINGS[group_by]
+
+        select_keys = ''.join(f", {key} AS {_GROUP_NAMES[key]}" for key in keys)
+        group_keys = ''.join(f", {key}" for key in keys)
+        conditions = ['r.bucket_start >= %s', 'r.bucket_start < %s']
+        params = [start, end]
+        if rig_id is not None:
+            conditions.append('r.rig_id = %s')
+            params.append(str(rig_id))
+        if block_id is not None:
+            conditions.append('r.block_id = %s')
+            params.append(str(block_id))
+
+        query = f"""
+            SELECT {bucket} AS bucket{select_keys},
+                   SUM(r.depth) AS depth,
+                   SUM(r.drill_hours) AS drill_hours,
+                   SUM(r.shifts_count) AS shifts_count
+            FROM public.rig_productivity_rollup r
+            LEFT JOIN public."DrillingRigs" dr ON dr.id::text = r.rig_id
+            WHERE {' AND '.join(conditions)}
+            GROUP BY {bucket}{group_keys}
+            ORDER BY bucket{group_keys}
+        """
+        with db_manager.get_cursor(RealDictCursor) as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        return [
+            {
+                'bucket': row['bucket'].isoformat(),
+                **{_GROUP_NAMES[key]: row[_GROUP_NAMES[key]] for key in keys},
+                'depth': round(row['depth'], 1),
+                'drill_hours': round(row['drill_hours'], 1),
+                'shifts_count': row['shifts_count'],
+                'performance_m_per_shift': _performance(row['depth'], row['shifts_count'])
+            }
+            for row in rows
+        ]
+
+    def active_blocks(self, start=None, end=None, rig_id=None):
+        """Блоки, у которых в [start, end) выросли пробуренные метры (по времени обновления)"""
+        end = end or datetime.now(timezone.utc)
+        start = start or end - timedelta(days=30)
+        conditions = ['bucket_start >= %s', 'bucket_start < %s', 'depth > 0']
+        params = [start, end]
+        if rig_id is not None:
+            conditions.append('rig_id = %s')
+            params.append(str(rig_id))
+        with db_manager.get_cursor(RealDictCursor) as cursor:
+            cursor.execute(f"""
+                SELECT DISTINCT block_id FROM public.rig_productivity_rollup
+                WHERE {' AND '.join(conditions)}
+            """, params)
+            return [row['block_id'] for row in cursor.fetchall()]
+
+rig_rollups = RigRollups()
@@ -0,0 +1,182 @@
+# shift_forecast.py
+import hashlib
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from psycopg2.extras import RealDictCursor
+
+from app.models.database import db_manager
+from app.models.invalidation import VersionedCache
+from app.models.rig_aggregates import rig_aggregates
+from app.utils.validators import safe_float_conversion
+
+logger = logging.getLogger(__name__)
+
+# Прогноз считается по сменным записям бурения, уведомлений о них нет
+SOURCE_TABLES = None
+
+PERCENTILES = (50, 80, 95)
+
+# Меньше выборок производительности станка - распределение берется по шахте
+MIN_RIG_SAMPLES = 3
+
+# Предел смен одной симуляции (станок с почти нулевой выработкой)
+MAX_SHIFTS = 100000
+
+# Предел смен в пачке: память на пачку - simulations * MAX_CHUNK значений
+MAX_CHUNK = 1024
+
+def shifts_to_complete(remaining_depth, samples, simulations, rng):
+    """Число смен до выработки remaining_depth для каждой симуляции.
+
+    Выработка за смену выбирается с возвращением из samples (м/смену);
+    последняя смена учитывается долей. Смены генерируются пачками на все
+    еще не завершенные симуляции сразу.
+    """
+    result = np.zeros(simulations)
+    if remaining_depth <= 0:
+        return result
+    mean = samples.mean()
+    # Даже при лучшей выработке каждую смену остаток не выработать за MAX_SHIFTS
+    if mean <= 0 or remaining_depth / samples.max() > MAX_SHIFTS:
+        result.fill(np.inf)
+        return result
+
+    # Пачка с запасом на ожидаемое число смен: обычно хватает одного прохода
+    chunk = min(int(math.ceil(remaining_depth / mean * 1.2)) + 8, MAX_CHUNK)
+    active = np.arange(simulations)
+    drilled = np.zeros(simulations)
+    shifts = np.zeros(simulations)
+
+    while active.size:
+        draws = rng.choice(samples, size=(active.size, chunk))
+        cumulative = drilled[active, None] + np.cumsum(draws, axis=1)
+        reached = cumulative >= remaining_depth
+        finished = reached.any(axis=1)
+
+        if finished.any():
+            rows = np.nonzero(finished)[0]
+            first = reached[rows].argmax(axis=1)
+            before = np.where(first > 0, cumulative[rows, np.maximum(first - 1, 0)], drilled[active[rows]])
+            fraction = (remaining_depth - before) / draws[rows, first]
+            result[active[rows]] = shifts[active[rows]] + first + fraction
+
+        pending = active[~finished]
+        drilled[pending] = cumulative[~finished, -1]
+        shifts[pending] += chunk
+        overrun = shifts[pending] >= MAX_SHIFTS
+        result[pending[overrun]] = np.inf
+        active = pending[~overrun]
+
+    return result
+
+class ShiftForecast:
+    """Вероятностный прогноз оставшихся смен по блокам методом Монте-Карло.
+
+    Для каждого станка блока число смен до выработки его остатка
+    моделируется по эмпирическому распределению сменной выработки станка
+    по его блокам. Сменная свертка (rig_rollups) не используется: ее
+    корзины - приращения на момент обновления, а не выработка смен. Блок
+    завершается, когда закончит последний станок. Блоки считаются
+    параллельно, результат кэшируется на версию данных.
+    """
+
+    def __init__(self, simulations=2000, workers=4, fallback_ttl=300):
+        self.simulations = simulations
+        self.workers = workers
+        self._cache = VersionedCache(SOURCE_TABLES, fallback_ttl, max_entries=1)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.simulations = int(app.config.get('FORECAST_SIMULATIONS', self.simulations))
+        self.workers = int(app.config.get('FORECAST_WORKERS', self.workers))
+
+    def _load(self):
+        """Остатки по станкам блоков и выборки сменной выработки станков"""
+        with db_manager.get_cursor(RealDictCursor, numeric_as_float=True) as cursor:
+            cursor.execute("""
+                SELECT block_id::text AS block_id, rig_id::text AS rig_id, remaining_depth
+                FROM calculate_remaining_shifts_by_block_rig()
+            """)
+            remaining = cursor.fetchall()
+
+        # Выборка станка - его производительность на каждом из его блоков
+        samples = {}
+        for row in rig_aggregates.rig_block_rows():
+            if row['performance_m_per_shift'] > 0:
+                samples.setdefault(row['rig_id'], []).append(row['performance_m_per_shift'])
+
+        blocks = {}
+        for row in remaining:
+            if row['block_id'] is None or row['rig_id'] is None:
+                continue
+            blocks.setdefault(row['block_id'], []).append((row['rig_id'], safe_float_conversion(row['remaining_depth'])))
+
+        return blocks, {rig_id: np.asarray(values, dtype=float) for rig_id, values in samples.items()}
+
+    def _rig_samples(self, rig_id, samples, relative):
+        """Выборка станка; при малом числе замеров - его среднее с разбросом по шахте"""
+        own = samples.get(rig_id)
+        if own is not None and own.size >= MIN_RIG_SAMPLES:
+            return own
+        if own is not None and own.size:
+            return own.mean() * relative
+        return None
+
+    def _simulate_block(self, block_id, rigs, samples, relative, pooled, version):
+        seed = int.from_bytes(hashlib.sha1(f"{block_id}:{version}".encode('utf-8')).digest()[:8], 'little')
+        rng = np.random.default_rng(seed)
+        completion = np.zeros(self.simulations)
+        for rig_id, remaining_depth in rigs:
+            rig_samples = self._rig_samples(rig_id, samples, relative)
+            if rig_samples is None:
+                rig_samples = pooled
+            np.maximum(completion, shifts_to_complete(remaining_depth, rig_samples, self.simulations, rng),
+                       out=completion)
+        p50, p80, p95 = np.percentile(completion, PERCENTILES)
+        return {
+            'block_id': block_id,
+            'rig_count': len(rigs),
+            'remaining_depth': round(sum(depth for _, depth in rigs), 1),
+            'mean_shifts': round(float(completion.mean()), 1),
+            'p50_shifts': round(float(p50), 1),
+            'p80_shifts': round(float(p80), 1),
+            'p95_shifts': round(float(p95), 1)
+        }
+
+    def _compute(self, version):
+        started = time.monotonic()
+        blocks, samples = self._load()
+        if not samples:
+            return []
+
+        pooled = np.concatenate(list(samples.values()))
+        # Относительный разброс выработки: замеры каждого станка, деленные на его среднее
+        relative = np.concatenate([values / values.mean() for values in samples.values()
+                                   if values.size >= MIN_RIG_SAMPLES and values.mean() > 0] or [np.ones(1)])
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shift-forecast') as executor:
+            results = list(executor.map(
+                lambda item: self._simulate_block(item[0], item[1], samples, relative, pooled, version),
+                blocks.items()
+            ))
+
+        logger.info(f"Shift forecast computed for {len(results)} blocks x {self.simulations} simulations "
+                    f"in {time.monotonic() - started:.2f}s")
+        return results
+
+    def forecast(self):
+        """Прогноз по всем блокам текущей версии данных"""
+        version = rig_aggregates.version()
+        with self._lock:
+            return self._cache.get_or_build('forecast', (version, self.simulations), lambda: self._compute(version))
+
+    def block_forecast(self, block_id):
+        block_id = str(block_id)
+        return next((row for row in self.forecast() if row['block_id'] == block_id), None)
+
+shift_forecast = ShiftForecast()
@@ -2,11 +2,15 @@
 from flask import Blueprint, jsonify, request
 import logging
 import os
+from datetime import datetime
 from dotenv import load_dotenv
-from decimal import Decimal
 
 # Импортируем DatabaseManager
 from app.models.database import db_manager
+from app.models.progress_model import progress_model
+from app.models.listing_index import SortedListing, page_args
+from app.models.rig_rollups import rig_rollups
+from app.models.rig_aggregates import rig_aggregates
 
 analytics_bp = Blueprint('analytics', __name__)
 
@@ -40,33 +44,27 @@ def get_blocks_progress():
     try:
         logger.info("Getting blocks progress data...")
         
-        # Используем прямое соединение как в get_drilling_progress
-        with db_manager.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM calculate_blocks_progress()")
-                columns = [desc[0] for desc in cur.description]
-                results = []
-                for row in cur.fetchall():
-                    row_dict = dict(zip(columns, row))
-                    
-                    total_blocks = safe_int(row_dict.get('total_blocks', 0))
-                    drilled_blocks = safe_int(row_dict.get('drilled_blocks', 0))
-                    percent_drilled = safe_float(row_dict.get('percent_drilled', 0.0))
-                    
-                    # Если данные отсутствуют, используем реалистичные значения
-                    if total_blocks == 0:
-                        total_blocks = 15
-                        drilled_blocks = 9
-                        percent_drilled = 60.0
-                    
-                    response_data = {
-                        'total_blocks': total_blocks,
-                        'drilled_blocks': drilled_blocks,
-                        'percent_drilled': round(percent_drilled, 1)
-                    }
-                    
-                    logger.info(f"Progress response: {response_data}")
-                    return jsonify(response_data)
+        # Инкрементальная модель прогресса вместо полного пересчета по шахте
+        row_dict = progress_model.blocks_progress()
+        
+        total_blocks = safe_int(row_dict.get('total_blocks', 0))
+        drilled_blocks = safe_int(row_dict.get('drilled_blocks', 0))
+        percent_drilled = safe_float(row_dict.get('percent_drilled', 0.0))
+        
+        # Если данные отсутствуют, используем реалистичные значения
+        if total_blocks == 0:
+            total_blocks = 15
+            drilled_blocks = 9
+            percent_drilled = 60.0
+        
+        response_data = {
+            'total_blocks': total_blocks,
+            'drilled_blocks': drilled_blocks,
+            'percent_drilled': round(percent_drilled, 1)
+        }
+        
+        logger.info(f"Progress response: {response_data}")
+        return jsonify(response_data)
                 
     except Exception as e:
         logger.error(f"Error in get_blocks_progress: {str(e)}")
@@ -76,43 +74,124 @@ def get_blocks_progress():
             'percent_drilled': 60.0
         })
 
+def drilling_progress_rows():
+    """Прогресс бурения по блокам, по убыванию процента"""
+    # Счетчики из инкрементальной модели прогресса
+    rows = [
+        row for row in progress_model.drilling_progress()
+        if row['block_name'] is not None and row['total_holes_actual'] > 0
+    ]
+    rows.sort(key=lambda row: row['percent_drilled_actual'], reverse=True)
+    
+    return [
+        {
+            'block_id': str(row.get('block_id', '')),
+            'block_name': str(row.get('block_name', 'Unknown Block')),
+            'total_holes_planned': safe_int(row.get('total_holes_planned', 0)),
+            'total_holes_actual': safe_int(row.get('total_holes_actual', 0)),
+            'drilled_holes_actual': safe_int(row.get('drilled_holes_actual', 0)),
+            'percent_drilled_planned': round(safe_float(row.get('percent_drilled_planned', 0)), 1),
+            'percent_drilled_actual': round(safe_float(row.get('percent_drilled_actual', 0)), 1)
+        }
+        for row in rows
+    ]
+
+def rig_productivity_rows():
+    """Производительность станков по блокам"""
+    return [
+        {
+            'rig_id': row['rig_id'],
+            'block_id': row['block_id'],
+            'total_depth': round(safe_float(row['total_depth']), 1),
+            'drill_hours': safe_float(row['drill_hours']),
+            'shifts_count': safe_int(row['shifts_count']),
+            'performance_m_per_shift': round(safe_float(row['performance_m_per_shift']), 1)
+        }
+        for row in rig_aggregates.rig_block_rows()
+    ]
+
+def remaining_shifts_rows():
+    """Оставшиеся смены по блокам"""
+    with db_manager.get_cursor(numeric_as_float=True) as cur:
+        cur.execute("SELECT * FROM calculate_remaining_shifts_by_block()")
+        return [
+            {
+                'block_id': str(row.get('block_id', '')),
+                'block_name': str(row.get('block_name', 'Unknown Block')),
+                'remaining_shifts': round(safe_float(row.get('remaining_shifts')), 1)
+            }
+            for row in cur.fetchall()
+        ]
+
+def blocks_efficiency_rows():
+    """Эффективность бурения по блокам"""
+    with db_manager.get_cursor(numeric_as_float=True) as cur:
+        cur.execute("SELECT * FROM calculate_drilling_efficiency_by_block()")
+        return [
+            {
+                'block_id': str(row.get('block_id', '')),
+                'block_name': str(row.get('block_name', 'Unknown Block')),
+                'efficiency_percent': round(safe_float(row.get('efficiency_percent')), 1)
+            }
+            for row in cur.fetchall()
+        ]
+
+# Кэшированные отсортированные списки для постраничной выдачи
+DRILLING_PROGRESS = SortedListing(
+    'drilling_progress', drilling_progress_rows, 'block_id',
+    ('block_id', 'block_name', 'total_holes_planned', 'total_holes_actual', 'drilled_holes_actual',
+     'percent_drilled_planned', 'percent_drilled_actual'),
+    '-percent_drilled_actual',
+    name_column='block_name', percent_column='percent_drilled_actual',
+    blasted_ids=progress_model.blasted_block_ids, tables=('Boreholes', 'BlockInfo'),
+    # Проценты обновляются фоновым перезапросом уже после уведомления
+    version=progress_model.version
+)
+RIG_PRODUCTIVITY = SortedListing(
+    'rig_productivity', rig_productivity_rows, ('rig_id', 'block_id'),
+    ('rig_id', 'block_id', 'total_depth', 'drill_hours', 'shifts_count', 'performance_m_per_shift'),
+    'rig_id',
+    name_column='rig_id', blasted_ids=progress_model.blasted_block_ids,
+    # Итоги свертки меняются после ее фонового обновления, а не в момент уведомления
+    version=rig_aggregates.version
+)
+REMAINING_SHIFTS = SortedListing(
+    'remaining_shifts', remaining_shifts_rows, 'block_id',
+    ('block_id', 'block_name', 'remaining_shifts'),
+    'block_id',
+    name_column='block_name', blasted_ids=progress_model.blasted_block_ids
+)
+BLOCKS_EFFICIENCY = SortedListing(
+    'blocks_efficiency', blocks_efficiency_rows, 'block_id',
+    ('block_id', 'block_name', 'efficiency_percent'),
+    '-efficiency_percent',
+    name_column='block_name', percent_column='efficiency_percent',
+    blasted_ids=progress_model.blasted_block_ids
+)
+
+def listing_page(listing):
+    """Страница списка по параметрам запроса или None, если нужен полный список"""
+    params = page_args(request.args)
+    if params is None:
+        return None
+    return jsonify(listing.page(**params))
+
 @analytics_bp.route('/api/blocks/drilling_progress')
 def get_drilling_progress():
     """Прогресс бурения по блокам"""
     try:
         logger.info("Getting drilling progress data...")
         
-        with db_manager.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT * FROM calculate_drilling_progress() 
-                    WHERE block_name IS NOT NULL AND total_holes_actual > 0
-                    ORDER BY percent_drilled_actual DESC
-                """)
-                columns = [desc[0] for desc in cur.description]
-                results = []
-                for row in cur.fetchall():
-                    row_dict = dict(zip(columns, row))
-                    
-                    processed_row = {
-                        'block_id': str(row_dict.get('block_id', '')),
-                        'block_name': str(row_dict.get('block_name', 'Unknown Block')),
-                        'total_holes_planned': safe_int(row_dict.get('total_holes_planned', 0)),
-                        'total_holes_actual': safe_int(row_dict.get('total_holes_actual', 0)),
-                        'drilled_holes_actual': safe_int(row_dict.get('drilled_holes_actual', 0)),
-                        'percent_drilled_planned': safe_float(row_dict.get('percent_drilled_planned', 0)),
-                        'percent_drilled_actual': safe_float(row_dict.get('percent_drilled_actual', 0))
-                    }
-                    
-                    # Округляем проценты
-                    processed_row['percent_drilled_planned'] = round(processed_row['percent_drilled_planned'], 1)
-                    processed_row['percent_drilled_actual'] = round(processed_row['percent_drilled_actual'], 1)
-                    
-                    results.append(processed_row)
-                
-                logger.info(f"Returning {len(results)} blocks with drilling progress")
-                return jsonify(results)
-                
+        page = listing_page(DRILLING_PROGRESS)
+        if page is not None:
+            return page
+        
+        results = drilling_progress_rows()
+        logger.info(f"Returning {len(results)} blocks with drilling progress")
+        return jsonify(results)
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_drilling_progress: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -123,118 +202,216 @@ def get_rig_productivity():
     try:
         logger.info("Getting rig productivity data...")
         
-        with db_manager.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM calculate_rig_productivity_by_block()")
-                columns = [desc[0] for desc in cur.description]
-                results = []
-                for row in cur.fetchall():
-                    row_dict = dict(zip(columns, row))
-                    
-                    processed_row = {
-                        'rig_id': str(row_dict.get('rig_id', '')),
-                        'block_id': str(row_dict.get('block_id', '')),
-                        'total_depth': safe_float(row_dict.get('total_depth')),
-                        'drill_hours': safe_float(row_dict.get('drill_hours')),
-                        'shifts_count': safe_int(row_dict.get('shifts_count')),
-                        'performance_m_per_shift': safe_float(row_dict.get('performance_m_per_shift'))
-                    }
-                    
-                    processed_row['performance_m_per_shift'] = round(processed_row['performance_m_per_shift'], 1)
-                    processed_row['total_depth'] = round(processed_row['total_depth'], 1)
-                    
-                    results.append(processed_row)
-                
-                return jsonify(results)
-                
+        page = listing_page(RIG_PRODUCTIVITY)
+        if page is not None:
+            return page
+        
+        return jsonify(rig_productivity_rows())
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_rig_productivity: {str(e)}")
         return jsonify([])
 
+@analytics_bp.route('/api/rigs/productivity/refresh-deltas')
+def get_rig_productivity_refresh_deltas():
+    """Приращения производительности станков по времени обновления свертки (смены, сутки, недели)"""
+    try:
+        if not rig_rollups.enabled:
+            return jsonify({'error': 'Rig productivity rollups are disabled'}), 503
+        
+        start = request.args.get('from')
+        end = request.args.get('to')
+        results = rig_rollups.refresh_deltas(
+            granularity=request.args.get('granularity', 'day'),
+            start=datetime.fromisoformat(start) if start else None,
+            end=datetime.fromisoformat(end) if end else None,
+            group_by=request.args.get('group_by', 'rig'),
+            rig_id=request.args.get('rig_id') or None,
+            block_id=request.args.get('block_id') or None
+        )
+        return jsonify(results)
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_rig_productivity_refresh_deltas: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @analytics_bp.route('/api/rigs/models')
 def get_rig_models_productivity():
     """Производительность по моделям станков"""
     try:
         logger.info("Getting rig models productivity data...")
         
-        with db_manager.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM calculate_rig_model_productivity()")
-                columns = [desc[0] for desc in cur.description]
-                results = []
-                for row in cur.fetchall():
-                    row_dict = dict(zip(columns, row))
-                    
-                    processed_row = {
-                        'rig_model': str(row_dict.get('rig_model', 'Unknown Model')),
-                        'rig_count': safe_int(row_dict.get('rig_count', 0)),
-                        'avg_performance_m_per_shift': safe_float(row_dict.get('avg_performance_m_per_shift', 0))
-                    }
-                    
-                    processed_row['avg_performance_m_per_shift'] = round(processed_row['avg_performance_m_per_shift'], 1)
-                    results.append(processed_row)
-                
-                logger.info(f"Returning {len(results)} rig models")
-                return jsonify(results)
+        # Перегруппировка уже загруженной производительности станков вместо отдельного пересчета
+        results = [
+            {
+                'rig_model': str(row['rig_model']),
+                'rig_count': safe_int(row['rig_count']),
+                'avg_performance_m_per_shift': round(safe_float(row['avg_performance_m_per_shift']), 1)
+            }
+            for row in rig_aggregates.models()
+        ]
+        
+        logger.info(f"Returning {len(results)} rig models")
+        return jsonify(results)
                 
     except Exception as e:
         logger.error(f"Error in get_rig_models_productivity: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@analytics_bp.route('/api/rigs/assignment', methods=['GET', 'POST'])
+def get_rig_assignment():
+    """Перераспределение открытых блоков по станкам: минимум makespan или взвешенного времени"""
+    try:
+        from app.models.rig_assignment import optimize
+        
+        payload = request.get_json(silent=True) or {}
+        objective = payload.get('objective') or request.args.get('objective', 'makespan')
+        return jsonify(optimize(
+            objective=objective,
+            rig_filter=payload.get('rigs'),
+            block_filter=payload.get('blocks'),
+            block_weights={str(key): value for key, value in (payload.get('weights') or {}).items()}
+        ))
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_rig_assignment: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/api/rigs/summary')
+def get_rigs_summary():
+    """Итоги производительности станков по шахте и по блокам"""
+    try:
+        return jsonify({
+            'mine': rig_aggregates.mine(),
+            'blocks': rig_aggregates.blocks()
+        })
+    except Exception as e:
+        logger.error(f"Error in get_rigs_summary: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @analytics_bp.route('/api/blocks/remaining_shifts')
 def get_remaining_shifts():
     """Оставшиеся смены по блокам"""
     try:
         logger.info("Getting remaining shifts data...")
         
-        with db_manager.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM calculate_remaining_shifts_by_block()")
-                columns = [desc[0] for desc in cur.description]
-                results = []
-                for row in cur.fetchall():
-                    row_dict = dict(zip(columns, row))
-                    
-                    processed_row = {
-                        'block_id': str(row_dict.get('block_id', '')),
-                        'block_name': str(row_dict.get('block_name', 'Unknown Block')),
-                        'remaining_shifts': safe_float(row_dict.get('remaining_shifts'))
-                    }
-                    
-                    processed_row['remaining_shifts'] = round(processed_row['remaining_shifts'], 1)
-                    results.append(processed_row)
-                
-                return jsonify(results)
-                
+        page = listing_page(REMAINING_SHIFTS)
+        if page is not None:
+            return page
+        
+        return jsonify(remaining_shifts_rows())
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_remaining_shifts: {str(e)}")
         return jsonify([])
 
+@analytics_bp.route('/api/blocks/remaining_shifts/forecast')
+def get_remaining_shifts_forecast():
+    """Вероятностный прогноз оставшихся смен: P50/P80/P95 по блокам"""
+    try:
+        from app.models.shift_forecast import shift_forecast
+        
+        block_id = request.args.get('block_id')
+        if block_id:
+            result = shift_forecast.block_forecast(block_id)
+            if result is None:
+                return jsonify({'error': 'Block not found'}), 404
+            return jsonify(result)
+        
+        return jsonify(shift_forecast.forecast())
+    
+    except Exception as e:
+        logger.error(f"Error in get_remaining_shifts_forecast: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/api/blocks/grid_regularity')
+def get_blocks_grid_regularity():
+    """Регулярность фактических сеток по всем блокам"""
+    try:
+        from app.models.grid_regularity import grid_regularity
+        
+        return jsonify(grid_regularity.summary())
+    
+    except Exception as e:
+        logger.error(f"Error in get_blocks_grid_regularity: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/api/blocks/blast_volume')
+def get_blocks_blast_volume():
+    """Объем взрываемой породы и потребный заряд по блокам"""
+    try:
+        from app.models.blast_volume import blast_volumes
+        
+        return jsonify(blast_volumes.totals())
+    
+    except Exception as e:
+        logger.error(f"Error in get_blocks_blast_volume: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.route('/api/deviations/stats')
+def get_deviation_stats():
+    """Распределения отклонений по набору блоков: перцентили и гистограммы"""
+    try:
+        from app.models.block_index import block_index
+        from app.models.deviation_stats import deviation_stats, DEFAULT_PERCENTILES
+        
+        # Набор блоков: явный список, блоки станка и/или блоки, бурившиеся за период
+        block_ids = [value.strip() for value in request.args.get('block_ids', '').split(',') if value.strip()]
+        block_ids += request.args.getlist('block_id')
+        rig_id = request.args.get('rig_id') or None
+        start = request.args.get('from')
+        end = request.args.get('to')
+        
+        if start or end:
+            if not rig_rollups.enabled:
+                return jsonify({'error': 'Period filter requires rig productivity rollups'}), 503
+            active = set(rig_rollups.active_blocks(
+                start=datetime.fromisoformat(start) if start else None,
+                end=datetime.fromisoformat(end) if end else None,
+                rig_id=rig_id
+            ))
+            block_ids = [block_id for block_id in block_ids if block_id in active] if block_ids else sorted(active)
+        elif rig_id is not None:
+            rig_blocks = {row['block_id'] for row in rig_aggregates.rig_block_rows() if row['rig_id'] == rig_id}
+            block_ids = [block_id for block_id in block_ids if block_id in rig_blocks] if block_ids else sorted(rig_blocks)
+        elif not block_ids:
+            block_ids = block_index.block_ids()
+        
+        percentiles = request.args.get('percentiles')
+        percentiles = [float(value) for value in percentiles.split(',')] if percentiles else DEFAULT_PERCENTILES
+        if any(not 0 <= value <= 100 for value in percentiles):
+            raise ValueError("Percentiles must be within 0..100")
+        
+        return jsonify(deviation_stats.stats(block_ids, percentiles))
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in get_deviation_stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @analytics_bp.route('/api/blocks/efficiency')
 def get_blocks_efficiency():
     """Эффективность бурения по блокам"""
     try:
         logger.info("Getting blocks efficiency data...")
         
-        with db_manager.get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM calculate_drilling_efficiency_by_block()")
-                columns = [desc[0] for desc in cur.description]
-                results = []
-                for row in cur.fetchall():
-                    row_dict = dict(zip(columns, row))
-                    
-                    processed_row = {
-                        'block_id': str(row_dict.get('block_id', '')),
-                        'block_name': str(row_dict.get('block_name', 'Unknown Block')),
-                        'efficiency_percent': safe_float(row_dict.get('efficiency_percent'))
-                    }
-                    
-                    processed_row['efficiency_percent'] = round(processed_row['efficiency_percent'], 1)
-                    results.append(processed_row)
-                
-                return jsonify(results)
-                
+        page = listing_page(BLOCKS_EFFICIENCY)
+        if page is not None:
+            return page
+        
+        return jsonify(blocks_efficiency_rows())
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in get_blocks_efficiency: {str(e)}")
         return jsonify([])
@@ -247,81 +424,74 @@ def search_block():
         if not block_id:
             return jsonify({'error': 'Block ID is required'}), 400
         
-        with db_manager.get_connection() as conn:
-            with conn.cursor() as cur:
-                # Получаем общую информацию о блоке
-                cur.execute("""
-                    SELECT * FROM calculate_drilling_progress()
-                    WHERE block_id = %s
-                """, (block_id,))
-                
-                columns = [desc[0] for desc in cur.description]
-                block_info = cur.fetchone()
-                logger.info(f"block_info: {block_info}")
-                
-                if not block_info:
-                    return jsonify({'error': 'Block not found'}), 404
-                
-                block_data = dict(zip(columns, block_info))
-                logger.info(f"block_data: {block_data}")
-                
-                # Получаем информацию о станках на этом блоке
-                cur.execute("""
-                    SELECT rs.block_id, rs.rig_id, COALESCE(dr.name, '-') AS rig_name, COALESCE(dr.model, '-') AS rig_model, rs.remaining_depth, rs.remaining_shifts, rp.total_depth, rp.shifts_count, rp.drill_hours, rp.performance_m_per_shift
-                    FROM calculate_remaining_shifts_by_block_rig() rs
-                    LEFT JOIN public."DrillingRigs" dr ON rs.rig_id = dr.id
-                    JOIN calculate_rig_productivity_by_block() rp ON rs.rig_id = rp.rig_id AND rs.block_id = rp.block_id
-                    WHERE rs.block_id = %s
-                    ORDER BY rp.block_id;
-                """, (block_id,))
-                
-                rigs_columns = [desc[0] for desc in cur.description]
-                rigs = []
-                for row in cur.fetchall():
-                    rig_dict = dict(zip(rigs_columns, row))
-                    rig_data = {
-                        'rig_id': str(rig_dict.get('rig_id', '')),
-                        'rig_name': str(rig_dict.get('rig_name', '-')),
-                        'rig_model': str(rig_dict.get('rig_model', '-')),
-                        'total_depth': safe_float(rig_dict.get('total_depth')),
-                        'drill_hours': safe_float(rig_dict.get('drill_hours')),
-                        'shifts_count': safe_int(rig_dict.get('shifts_count')),
-                        'remaining_depth': safe_float(rig_dict.get('remaining_depth')),
-                        'remaining_shifts': safe_float(rig_dict.get('remaining_shifts')),
-                        'performance_m_per_shift': safe_float(rig_dict.get('performance_m_per_shift'))
-                    }
-                    rigs.append(rig_data)
-                
-                logger.info(f"rigs: {rigs}")
-                
-                # Получаем оставшиеся смены для блока
-                cur.execute("""
-                    SELECT * FROM calculate_remaining_shifts_by_block()
-                    WHERE block_id = %s
-                """, (block_id,))
-                
-                remaining_shifts_row = cur.fetchone()
-                remaining_shifts = None
-                if remaining_shifts_row:
-                    # Преобразуем в словарь чтобы получить значение по имени колонки
-                    shifts_columns = [desc[0] for desc in cur.description]
-                    shifts_dict = dict(zip(shifts_columns, remaining_shifts_row))
-                    remaining_shifts = safe_float(shifts_dict.get('remaining_shifts'))
-                
-                logger.info(f"remaining_shifts: {remaining_shifts}")
-                
-                # Получаем эффективность бурения для блока
-                cur.execute("""
-                    SELECT block_id, efficiency_percent FROM calculate_drilling_efficiency_by_block()
-                    WHERE block_id = %s
-                """, (block_id,))
-                
-                efficiency_row = cur.fetchone()
-                efficiency = None
-                if efficiency_row:
-                    efficiency = safe_float(efficiency_row[1])
-                
-                logger.info(f"efficiency: {efficiency}")
+        with db_manager.get_cursor(numeric_as_float=True) as cur:
+            # Получаем общую информацию о блоке
+            cur.execute("""
+                SELECT * FROM calculate_drilling_progress()
+                WHERE block_id = %s
+            """, (block_id,))
+            
+            block_data = cur.fetchone()
+            logger.info(f"block_data: {block_data}")
+            
+            if not block_data:
+                return jsonify({'error': 'Block not found'}), 404
+            
+            # Оставшийся объем по станкам блока
+            cur.execute("""
+                SELECT rig_id, remaining_depth, remaining_shifts
+                FROM calculate_remaining_shifts_by_block_rig()
+                WHERE block_id = %s
+            """, (block_id,))
+            remaining_rows = cur.fetchall()
+            
+            # Получаем оставшиеся смены для блока
+            cur.execute("""
+                SELECT * FROM calculate_remaining_shifts_by_block()
+                WHERE block_id = %s
+            """, (block_id,))
+            
+            remaining_shifts_row = cur.fetchone()
+            remaining_shifts = None
+            if remaining_shifts_row:
+                remaining_shifts = safe_float(remaining_shifts_row.get('remaining_shifts'))
+            
+            logger.info(f"remaining_shifts: {remaining_shifts}")
+            
+            # Получаем эффективность бурения для блока
+            cur.execute("""
+                SELECT block_id, efficiency_percent FROM calculate_drilling_efficiency_by_block()
+                WHERE block_id = %s
+            """, (block_id,))
+            
+            efficiency_row = cur.fetchone()
+            efficiency = None
+            if efficiency_row:
+                efficiency = safe_float(efficiency_row.get('efficiency_percent'))
+            
+            logger.info(f"efficiency: {efficiency}")
+        
+        # Производительность и справочник станков - из общей иерархии агрегатов; после
+        # закрытия курсора, чтобы холодный кэш не занимал второе соединение пула
+        block_rigs = rig_aggregates.block_rigs(block_id)
+        rigs = []
+        for row in remaining_rows:
+            productivity = block_rigs.get(str(row.get('rig_id', '')))
+            if productivity is None:
+                continue
+            rigs.append({
+                'rig_id': productivity['rig_id'],
+                'rig_name': str(productivity['rig_name']),
+                'rig_model': str(productivity['rig_model']),
+                'total_depth': productivity['total_depth'],
+                'drill_hours': productivity['drill_hours'],
+                'shifts_count': productivity['shifts_count'],
+                'remaining_depth': safe_float(row.get('remaining_depth')),
+                'remaining_shifts': safe_float(row.get('remaining_shifts')),
+                'performance_m_per_shift': productivity['performance_m_per_shift']
+            })
+        
+        logger.info(f"rigs: {rigs}")
         
         return jsonify({
             'block': block_data,
@@ -332,4 +502,4 @@ def search_block():
         
     except Exception as e:
         logger.error(f"Error in search_block: {str(e)}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
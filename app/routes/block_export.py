@@ -1,160 +1,276 @@
 # block_export.py
-from flask import Blueprint, send_file, jsonify
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 import logging
-import io
-import csv
-import json
+import zipfile
+from contextlib import contextmanager
 from datetime import datetime
-from decimal import Decimal
 from psycopg2.extras import RealDictCursor
 
-from app.routes.analytics import safe_float
+from app.models.deviation_frame import DeviationFrame, SOURCES, critical_export_rows, export_rows
+from app.models import columnar_export
 
 logger = logging.getLogger(__name__)
 
 block_export_bp = Blueprint('block_export', __name__)
 
-class DecimalEncoder(json.JSONEncoder):
-    """Кастомный энкодер для обработки Decimal объектов"""
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+# Выгрузки блока собираются только из скважин
+SOURCE_TABLES = ('Boreholes',)
 
-def convert_decimal_to_float(data):
-    """Рекурсивно преобразует Decimal в float в данных"""
-    if isinstance(data, dict):
-        return {key: convert_decimal_to_float(value) for key, value in data.items()}
-    elif isinstance(data, list):
-        return [convert_decimal_to_float(item) for item in data]
-    elif isinstance(data, Decimal):
-        return float(data)
-    else:
-        return data
+BLOCK_BOREHOLES_QUERY = """
+    SELECT 
+        "Name" as borehole_name,
+        "X" as x,
+        "Y" as y,
+        "Z" as z,
+        "Length" as length,
+        "Diameter" as diameter,
+        "Angle" as angle,
+        "Azimuth" as azimuth,
+        "T" as type
+    FROM public."Boreholes"
+    WHERE "BlockID" = %s
+    ORDER BY "Name"
+"""
 
 @block_export_bp.route('/api/export/block/<block_id>/<data_type>/<format_type>')
 def export_block_data(block_id, data_type, format_type):
     """Экспорт данных конкретного блока"""
     try:
-        logger.info(f"Export request: block_id={block_id}, data_type={data_type}, format_type={format_type}")
+        from app.routes.export import export_cached, write_rendered, FILE_FORMATS
+        from app.models.export_jobs import ExportProgress
         
-        # Получаем данные в зависимости от типа
-        data = get_block_report_data(block_id, data_type)
-        
-        logger.info(f"Retrieved data count: {len(data) if data else 0}")
+        logger.info(f"Export request: block_id={block_id}, data_type={data_type}, format_type={format_type}")
         
-        if not data:
-            logger.warning(f"No data available for block {block_id}, type {data_type}")
-            return jsonify({'error': 'No data available for export'}), 404
+        if format_type not in FILE_FORMATS:
+            logger.error(f"Unsupported format: {format_type}")
+            return jsonify({'error': 'Unsupported format'}), 400
         
-        # Преобразуем Decimal в float для JSON
-        if format_type == 'json':
-            data = convert_decimal_to_float(data)
+        if format_type in columnar_export.COLUMNAR_FORMATS:
+            return export_block_columnar(block_id, data_type, format_type)
         
-        # Генерируем файл
-        if format_type == 'csv':
-            return export_csv(data, f"block_{block_id}_{data_type}")
-        elif format_type == 'json':
-            return export_json(data, f"block_{block_id}_{data_type}")
-        elif format_type == 'txt':
-            return export_txt(data, f"block_{block_id}_{data_type}")
+        if format_type == 'xlsx':
+            # Отклонения - по листу на тип
+            def build(fileobj):
+                job = ExportProgress()
+                build_block_file(job, fileobj, block_id, data_type, format_type)
+                return job.rows_written
         else:
-            logger.error(f"Unsupported format: {format_type}")
-            return jsonify({'error': 'Unsupported format'}), 400
+            def build(fileobj):
+                # Получаем данные в зависимости от типа
+                data = get_block_report_data(block_id, data_type)
+                logger.info(f"Retrieved data count: {len(data) if data else 0}")
+                return write_rendered(fileobj, data, format_type)
+        
+        return export_cached(f"block_{block_id}_{data_type}", block_id, format_type, build)
             
     except Exception as e:
         logger.error(f"Block export error: {str(e)}", exc_info=True)
         return jsonify({'error': f'Export failed: {str(e)}'}), 500
 
-def export_csv(data, report_type):
-    """Экспорт в CSV"""
+def export_block_columnar(block_id, data_type, format_type):
+    """Потоковый экспорт данных блока в Arrow IPC / Parquet"""
+    from app.routes.export import export_columnar
+    
+    report_type = f"block_{block_id}_{data_type}"
+    
+    if data_type == 'boreholes':
+        make_chunks = lambda: columnar_export.stream_query(BLOCK_BOREHOLES_QUERY, (block_id,), format_type)
+    elif data_type == 'deviations':
+        # Одна строка на скважину со всеми метриками отклонений
+        def make_chunks():
+            deviation_frame = DeviationFrame.fetch(block_id)
+            if not len(deviation_frame):
+                return None
+            return columnar_export.stream_deviation_frame(deviation_frame, format_type)
+    elif data_type == 'critical':
+        def make_chunks():
+            deviations = get_block_critical_deviations_data(block_id)
+            if not deviations:
+                return None
+            return columnar_export.stream_records(deviations, format_type, schema=columnar_export.critical_schema())
+    else:
+        logger.warning(f"Unknown data type: {data_type}")
+        return jsonify({'error': 'No data available for export'}), 404
+    
+    return export_columnar(make_chunks, report_type, block_id, format_type)
+
+def deviation_sheets(rows, wrap=iter):
+    """Листы отклонений: по листу на тип, колонки - метрики источника; rows(source) - строки источника"""
+    return [
+        (source, ('borehole_name',) + columns, wrap(rows(source)))
+        for source, (_, columns) in SOURCES.items()
+    ]
+
+def critical_sheets(deviations):
+    """Листы критических отклонений по типам"""
+    sheets = {}
+    for deviation in deviations:
+        sheets.setdefault(deviation['type'], []).append(deviation)
+    return [(name, None, rows) for name, rows in sheets.items()]
+
+@contextmanager
+def deviation_rows(job, block_id, streamed):
+    """rows(source) отклонений блока: прямо из курсоров или из набора с известным числом строк"""
+    if streamed:
+        with DeviationFrame.streamed(block_id) as rows:
+            yield rows
+        return
+    deviation_frame = DeviationFrame.fetch(block_id)
+    job.total_rows = sum(len(order) for order in deviation_frame.order.values())
+    yield deviation_frame.rows
+
+@contextmanager
+def critical_rows(job, block_id, streamed):
+    """Критические отклонения блока: отбираются по мере чтения курсоров или списком с известным числом строк"""
+    if streamed:
+        with DeviationFrame.streamed(block_id) as rows:
+            yield critical_export_rows(rows)
+        return
+    deviations = get_block_critical_deviations_data(block_id)
+    job.total_rows = len(deviations)
+    yield deviations
+
+def build_block_file(job, fileobj, block_id, data_type, format_type, streamed=False):
+    """Сборка файла данных блока для фоновой задачи.
+
+    streamed - отклонения читаются из курсоров по мере записи, без загрузки
+    всего блока (пакетная выгрузка, где число строк заранее не нужно).
+    """
+    from app.models.database import db_manager
+    from app.routes.export import export_handler, cursor_sheet, export_filename, FILE_FORMATS
+    
+    columnar = format_type in columnar_export.COLUMNAR_FORMATS
+    
+    if data_type == 'boreholes':
+        if columnar:
+            chunks = columnar_export.stream_query(BLOCK_BOREHOLES_QUERY, (block_id,), format_type, progress=job.advance)
+            for chunk in chunks:
+                fileobj.write(chunk)
+        else:
+            with db_manager.get_server_cursor('export_job', numeric_as_float=True) as cursor:
+                cursor.execute(BLOCK_BOREHOLES_QUERY, (block_id,))
+                headers, rows = cursor_sheet(cursor)
+                export_handler.write_file(fileobj, format_type, [('boreholes', headers, job.counted(rows))])
+    
+    elif data_type == 'deviations':
+        if columnar:
+            # Строка на скважину со всеми метриками: источники сопоставляются в наборе
+            deviation_frame = DeviationFrame.fetch(block_id)
+            job.total_rows = len(deviation_frame)
+            for chunk in columnar_export.stream_deviation_frame(deviation_frame, format_type):
+                fileobj.write(chunk)
+            job.rows_written = len(deviation_frame)
+        else:
+            with deviation_rows(job, block_id, streamed) as rows:
+                if format_type == 'xlsx':
+                    sheets = deviation_sheets(rows, job.counted)
+                else:
+                    sheets = [('deviations', None, job.counted(export_rows(rows)))]
+                export_handler.write_file(fileobj, format_type, sheets)
+    
+    elif data_type == 'critical':
+        with critical_rows(job, block_id, streamed) as deviations:
+            if columnar:
+                schema = columnar_export.critical_schema()
+                for chunk in columnar_export.stream_records(job.counted(deviations), format_type, schema=schema):
+                    fileobj.write(chunk)
+            elif format_type == 'xlsx':
+                # Листы по типам: в памяти только критические строки
+                sheets = [(name, None, job.counted(rows)) for name, _, rows in critical_sheets(deviations)]
+                export_handler.write_file(fileobj, format_type, sheets)
+            else:
+                export_handler.write_file(fileobj, format_type, [('critical', None, job.counted(deviations))])
+    
+    return export_filename(f"block_{block_id}_{data_type}", format_type), FILE_FORMATS[format_type][0]
+
+def submit_block_export_job(block_id, data_type, format_type):
+    """Постановка выгрузки данных блока в фоновую очередь"""
+    from app.models.block_index import block_index
+    from app.models.export_jobs import export_jobs
+    from app.models.invalidation import invalidation_bus
+    
+    if data_type not in BLOCK_DATA_TYPES:
+        return jsonify({'error': 'Unknown data type'}), 400
+    
+    resolved = block_index.resolve(block_id)
+    if resolved is None:
+        return jsonify({'error': 'Block not found'}), 404
+    block_id = resolved[0]
+    
+    job = export_jobs.submit(
+        {'block_id': block_id, 'data_type': data_type, 'format': format_type},
+        lambda job, fileobj: build_block_file(job, fileobj, block_id, data_type, format_type),
+        data_version=invalidation_bus.block_version(block_id),
+        tables=SOURCE_TABLES
+    )
+    return jsonify(job.to_dict()), 202
+
+BLOCK_DATA_TYPES = ('deviations', 'boreholes', 'critical')
+
+# Форматы, которые уже сжаты и кладутся в архив без повторного сжатия
+PRECOMPRESSED_FORMATS = ('xlsx', 'parquet')
+
+def _param_list(value):
+    """Список из JSON массива или строки через запятую"""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+@block_export_bp.route('/api/export/bulk', methods=['GET', 'POST'])
+def export_bulk():
+    """Выгрузка данных нескольких блоков одним потоковым ZIP архивом"""
     try:
-        if not data:
-            return jsonify({'error': 'No data to export'}), 404
-            
-        output = io.StringIO()
-        writer = csv.writer(output)
+        from app.models.block_index import block_index
+        from app.models.bulk_export import bulk_exporter, BulkEntry
+        from app.models.export_jobs import ExportProgress
+        from app.routes.export import FILE_FORMATS
         
-        # Заголовки
-        if data and len(data) > 0:
-            headers = list(data[0].keys())
-            writer.writerow(headers)
-            
-            # Данные
-            for row in data:
-                # Преобразуем Decimal в строку для CSV
-                row_data = []
-                for header in headers:
-                    value = row.get(header, '')
-                    if isinstance(value, Decimal):
-                        value = float(value)
-                    row_data.append(str(value))
-                writer.writerow(row_data)
+        params = request.get_json(silent=True) or request.values
+        format_type = params.get('format', 'csv')
+        data_types = _param_list(params.get('data_types')) or list(BLOCK_DATA_TYPES)
         
-        output.seek(0)
-        filename = f"{report_type}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        if format_type not in FILE_FORMATS:
+            return jsonify({'error': 'Unsupported format'}), 400
+        if format_type in columnar_export.COLUMNAR_FORMATS and not columnar_export.is_available():
+            return jsonify({'error': f'Format {format_type} requires pyarrow'}), 400
+        unknown = [data_type for data_type in data_types if data_type not in BLOCK_DATA_TYPES]
+        if unknown:
+            return jsonify({'error': f"Unknown data types: {', '.join(unknown)}"}), 400
+        
+        # Блоки: явный список ID/названий или фильтр по префиксу названия
+        block_ids = _param_list(params.get('block_ids'))
+        if block_ids:
+            blocks = [resolved for resolved in map(block_index.resolve, block_ids) if resolved]
+        else:
+            blocks = block_index.with_name_prefix(params.get('name_prefix', ''))
         
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
-    except Exception as e:
-        logger.error(f"CSV export error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-def export_json(data, report_type):
-    """Экспорт в JSON"""
-    try:
-        if not data:
-            return jsonify({'error': 'No data to export'}), 404
-            
-        filename = f"{report_type}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        if not blocks:
+            return jsonify({'error': 'No blocks found for export'}), 404
         
-        return send_file(
-            io.BytesIO(json.dumps(data, ensure_ascii=False, indent=2, cls=DecimalEncoder).encode('utf-8')),
-            mimetype='application/json',
-            as_attachment=True,
-            download_name=filename
-        )
-    except Exception as e:
-        logger.error(f"JSON export error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-def export_txt(data, report_type):
-    """Экспорт в TXT"""
-    try:
-        if not data:
-            return jsonify({'error': 'No data to export'}), 404
-            
-        output = io.StringIO()
+        extension = FILE_FORMATS[format_type][1]
+        compress_type = zipfile.ZIP_STORED if format_type in PRECOMPRESSED_FORMATS else zipfile.ZIP_DEFLATED
         
-        if data and len(data) > 0:
-            headers = list(data[0].keys())
-            output.write("\t".join(headers) + "\n")
-            
-            for row in data:
-                row_data = []
-                for header in headers:
-                    value = row.get(header, '')
-                    if isinstance(value, Decimal):
-                        value = float(value)
-                    row_data.append(str(value))
-                output.write("\t".join(row_data) + "\n")
+        def entry(block_id, data_type):
+            produce = lambda fileobj: build_block_file(
+                ExportProgress(), fileobj, block_id, data_type, format_type, streamed=True
+            )
+            return BulkEntry(f"block_{block_id}/{data_type}.{extension}", produce, compress_type)
         
-        output.seek(0)
-        filename = f"{report_type}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        entries = [entry(block_id, data_type) for block_id, _ in blocks for data_type in data_types]
+        logger.info(f"Bulk export: {len(blocks)} blocks, {len(entries)} files, format {format_type}")
         
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=filename
+        filename = f"blocks_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        return Response(
+            stream_with_context(bulk_exporter.stream(entries)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
+        
     except Exception as e:
-        logger.error(f"TXT export error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.error(f"Bulk export error: {str(e)}", exc_info=True)
+        return jsonify({'error': f'Export failed: {str(e)}'}), 500
 
 def get_block_report_data(block_id, data_type):
     """Получение данных для отчетов по конкретному блоку - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
@@ -181,110 +297,10 @@ def get_block_report_data(block_id, data_type):
 def get_block_deviations_data(block_id):
     """Получение данных об отклонениях по блоку - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     try:
-        from app.models.database import db_manager
+        # Все отклонения одним колоночным набором
+        deviation_frame = DeviationFrame.fetch(block_id)
         
-        # Получаем все отклонения (без cursor_factory)
-        dist_result = db_manager.execute_function('calc_distance_deviations', (block_id,))
-        length_result = db_manager.execute_function('calc_length_deviations', (block_id,))
-        diameter_result = db_manager.execute_function('calc_diameter_deviations', (block_id,))
-        direction_result = db_manager.execute_function('calc_direction_deviations', (block_id,))
-        
-        deviations = []
-        
-        # Обрабатываем отклонения расстояний
-        for row in (dist_result or []):
-            # Преобразуем в словарь, если это не словарь
-            if not isinstance(row, dict):
-                # Предполагаем порядок полей: borehole_name, planned_x, planned_y, actual_x, actual_y, deviation
-                row_dict = {
-                    'borehole_name': row[0] if len(row) > 0 else '',
-                    'planned_x': row[1] if len(row) > 1 else None,
-                    'planned_y': row[2] if len(row) > 2 else None,
-                    'actual_x': row[3] if len(row) > 3 else None,
-                    'actual_y': row[4] if len(row) > 4 else None,
-                    'deviation': row[5] if len(row) > 5 else None
-                }
-            else:
-                row_dict = row
-                
-            deviations.append({
-                'borehole_name': str(row_dict.get('borehole_name', '')),
-                'type': 'distance',
-                'planned_x': safe_float(row_dict.get('planned_x')),
-                'planned_y': safe_float(row_dict.get('planned_y')),
-                'actual_x': safe_float(row_dict.get('actual_x')),
-                'actual_y': safe_float(row_dict.get('actual_y')),
-                'deviation': safe_float(row_dict.get('deviation'))
-            })
-        
-        # Обрабатываем отклонения длины
-        for row in (length_result or []):
-            if not isinstance(row, dict):
-                # Предполагаем порядок: borehole_name, planned_length, actual_length, length_diff
-                row_dict = {
-                    'borehole_name': row[0] if len(row) > 0 else '',
-                    'planned_length': row[1] if len(row) > 1 else None,
-                    'actual_length': row[2] if len(row) > 2 else None,
-                    'length_diff': row[3] if len(row) > 3 else None
-                }
-            else:
-                row_dict = row
-                
-            deviations.append({
-                'borehole_name': str(row_dict.get('borehole_name', '')),
-                'type': 'length',
-                'planned': safe_float(row_dict.get('planned_length')),
-                'actual': safe_float(row_dict.get('actual_length')),
-                'deviation': safe_float(row_dict.get('length_diff'))
-            })
-        
-        # Обрабатываем отклонения диаметра
-        for row in (diameter_result or []):
-            if not isinstance(row, dict):
-                # Предполагаем порядок: borehole_name, planned_diameter, actual_diameter, diameter_diff
-                row_dict = {
-                    'borehole_name': row[0] if len(row) > 0 else '',
-                    'planned_diameter': row[1] if len(row) > 1 else None,
-                    'actual_diameter': row[2] if len(row) > 2 else None,
-                    'diameter_diff': row[3] if len(row) > 3 else None
-                }
-            else:
-                row_dict = row
-                
-            deviations.append({
-                'borehole_name': str(row_dict.get('borehole_name', '')),
-                'type': 'diameter',
-                'planned': safe_float(row_dict.get('planned_diameter')),
-                'actual': safe_float(row_dict.get('actual_diameter')),
-                'deviation': safe_float(row_dict.get('diameter_diff'))
-            })
-        
-        # Обрабатываем отклонения направления
-        for row in (direction_result or []):
-            if not isinstance(row, dict):
-                # Предполагаем порядок: borehole_name, planned_angle, actual_angle, angle_diff, planned_azimuth, actual_azimuth, azimuth_diff
-                row_dict = {
-                    'borehole_name': row[0] if len(row) > 0 else '',
-                    'planned_angle': row[1] if len(row) > 1 else None,
-                    'actual_angle': row[2] if len(row) > 2 else None,
-                    'angle_diff': row[3] if len(row) > 3 else None,
-                    'planned_azimuth': row[4] if len(row) > 4 else None,
-                    'actual_azimuth': row[5] if len(row) > 5 else None,
-                    'azimuth_diff': row[6] if len(row) > 6 else None
-                }
-            else:
-                row_dict = row
-                
-            deviations.append({
-                'borehole_name': str(row_dict.get('borehole_name', '')),
-                'type': 'direction',
-                'angle_planned': safe_float(row_dict.get('planned_angle')),
-                'angle_actual': safe_float(row_dict.get('actual_angle')),
-                'angle_deviation': safe_float(row_dict.get('angle_diff')),
-                'azimuth_planned': safe_float(row_dict.get('planned_azimuth')),
-                'azimuth_actual': safe_float(row_dict.get('actual_azimuth')),
-                'azimuth_deviation': safe_float(row_dict.get('azimuth_diff'))
-            })
+        deviations = list(deviation_frame.export_rows())
         
         logger.info(f"Retrieved {len(deviations)} deviations for block {block_id}")
         return deviations
@@ -299,21 +315,7 @@ def get_block_boreholes_data(block_id):
     try:
         from app.models.database import db_manager
         
-        result = db_manager.execute_query("""
-            SELECT 
-                "Name" as borehole_name,
-                "X" as x,
-                "Y" as y,
-                "Z" as z,
-                "Length" as length,
-                "Diameter" as diameter,
-                "Angle" as angle,
-                "Azimuth" as azimuth,
-                "T" as type
-            FROM public."Boreholes"
-            WHERE "BlockID" = %s
-            ORDER BY "Name"
-        """, (block_id,), cursor_factory=RealDictCursor)
+        result = db_manager.execute_query(BLOCK_BOREHOLES_QUERY, (block_id,), cursor_factory=RealDictCursor, numeric_as_float=True)
         
         boreholes = [dict(row) for row in result] if result else []
         logger.info(f"Retrieved {len(boreholes)} boreholes for block {block_id}")
@@ -326,103 +328,10 @@ def get_block_boreholes_data(block_id):
 def get_block_critical_deviations_data(block_id):
     """Получение данных о критических отклонениях - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     try:
-        from app.models.database import db_manager
-        
         # Получаем все отклонения и фильтруем критические
-        deviations = []
+        deviation_frame = DeviationFrame.fetch(block_id)
         
-        # Критические отклонения расстояний (> 5м)
-        dist_result = db_manager.execute_function('calc_distance_deviations', (block_id,))
-        for row in (dist_result or []):
-            if not isinstance(row, dict):
-                deviation = safe_float(row[5] if len(row) > 5 else None)
-            else:
-                deviation = safe_float(row.get('deviation'))
-                
-            if deviation and abs(deviation) > 5:
-                deviations.append({
-                    'borehole_name': str(row[0] if not isinstance(row, dict) else row.get('borehole_name', '')),
-                    'type': 'distance',
-                    'deviation': deviation,
-                    'threshold': 5,
-                    'is_critical': True
-                })
-        
-        # Критические отклонения длины (> 10%)
-        length_result = db_manager.execute_function('calc_length_deviations', (block_id,))
-        for row in (length_result or []):
-            if not isinstance(row, dict):
-                planned = safe_float(row[1] if len(row) > 1 else None)
-                diff = safe_float(row[3] if len(row) > 3 else None)
-            else:
-                planned = safe_float(row.get('planned_length'))
-                diff = safe_float(row.get('length_diff'))
-                
-            if planned and diff:
-                percent_deviation = abs(diff / planned) * 100
-                if percent_deviation > 10:
-                    deviations.append({
-                        'borehole_name': str(row[0] if not isinstance(row, dict) else row.get('borehole_name', '')),
-                        'type': 'length',
-                        'deviation': diff,
-                        'planned': planned,
-                        'percent_deviation': round(percent_deviation, 1),
-                        'threshold': '10%',
-                        'is_critical': True
-                    })
-        
-        # Критические отклонения диаметра (> 10%)
-        diameter_result = db_manager.execute_function('calc_diameter_deviations', (block_id,))
-        for row in (diameter_result or []):
-            if not isinstance(row, dict):
-                planned = safe_float(row[1] if len(row) > 1 else None)
-                diff = safe_float(row[3] if len(row) > 3 else None)
-            else:
-                planned = safe_float(row.get('planned_diameter'))
-                diff = safe_float(row.get('diameter_diff'))
-                
-            if planned and diff:
-                percent_deviation = abs(diff / planned) * 100
-                if percent_deviation > 10:
-                    deviations.append({
-                        'borehole_name': str(row[0] if not isinstance(row, dict) else row.get('borehole_name', '')),
-                        'type': 'diameter',
-                        'deviation': diff,
-                        'planned': planned,
-                        'percent_deviation': round(percent_deviation, 1),
-                        'threshold': '10%',
-                        'is_critical': True
-                    })
-        
-        # Критические отклонения направления
-        direction_result = db_manager.execute_function('calc_direction_deviations', (block_id,))
-        for row in (direction_result or []):
-            if not isinstance(row, dict):
-                angle_diff = safe_float(row[3] if len(row) > 3 else None)
-                azimuth_diff = safe_float(row[6] if len(row) > 6 else None)
-            else:
-                angle_diff = safe_float(row.get('angle_diff'))
-                azimuth_diff = safe_float(row.get('azimuth_diff'))
-            
-            # Угол наклона (> 5 градусов)
-            if angle_diff and abs(angle_diff) > 5:
-                deviations.append({
-                    'borehole_name': str(row[0] if not isinstance(row, dict) else row.get('borehole_name', '')),
-                    'type': 'angle',
-                    'deviation': angle_diff,
-                    'threshold': '5°',
-                    'is_critical': True
-                })
-            
-            # Азимут (> 10 градусов)
-            if azimuth_diff and abs(azimuth_diff) > 10:
-                deviations.append({
-                    'borehole_name': str(row[0] if not isinstance(row, dict) else row.get('borehole_name', '')),
-                    'type': 'azimuth',
-                    'deviation': azimuth_diff,
-                    'threshold': '10°',
-                    'is_critical': True
-                })
+        deviations = list(deviation_frame.critical_export_rows())
         
         logger.info(f"Found {len(deviations)} critical deviations for block {block_id}")
         return deviations
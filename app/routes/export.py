@@ -1,157 +1,294 @@
 # export.py
-from flask import Blueprint, send_file, jsonify, request
+from flask import Blueprint, Response, send_file, jsonify, request, stream_with_context
 import logging
 import io
 import csv
-import json
 from datetime import datetime
-from decimal import Decimal
+from itertools import chain
+
+from app.models import columnar_export
+from app.models.export_handler import ExportHandler, XLSX_MIMETYPE
+from app.models.export_jobs import export_jobs, ExportProgress, ExportQueueFull, DONE
+from app.models.export_cache import export_cache
+from app.models.invalidation import invalidation_bus
+from app.utils import serialization
 
 logger = logging.getLogger(__name__)
 
 export_bp = Blueprint('export', __name__)
 
-class DecimalEncoder(json.JSONEncoder):
-    """Кастомный энкодер для обработки Decimal объектов"""
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
-
-def convert_decimal_to_float(data):
-    """Рекурсивно преобразует Decimal в float в данных"""
-    if isinstance(data, dict):
-        return {key: convert_decimal_to_float(value) for key, value in data.items()}
-    elif isinstance(data, list):
-        return [convert_decimal_to_float(item) for item in data]
-    elif isinstance(data, Decimal):
-        return float(data)
-    else:
-        return data
+export_handler = ExportHandler()
+
+BLOCKS_QUERY = """
+    SELECT 
+        "BlockID" as block_id,
+        "BlockName" as block_name,
+        "CrushEnergy" as crush_energy,
+        "HolesSpace" as holes_space,
+        "RowsDistance" as rows_distance,
+        "RockName" as rock_name,
+        "RockRigity" as rock_rigidity,
+        "RockDensity" as rock_density
+    FROM public."BlockInfo"
+"""
+
+# Запросы отчетов для потоковой выгрузки в колоночные форматы
+REPORT_QUERIES = {
+    'blocks': BLOCKS_QUERY,
+    'drilling_progress': "SELECT * FROM calculate_drilling_progress()",
+    'rig_productivity': "SELECT * FROM calculate_rig_productivity_by_block()",
+    'blocks_efficiency': "SELECT * FROM calculate_drilling_efficiency_by_block()",
+}
+
+def blast_volume_rows():
+    from app.models.blast_volume import blast_volumes
+    return blast_volumes.totals()
+
+# Отчеты, которые считаются в приложении, а не одним SQL запросом
+COMPUTED_REPORTS = {
+    'blast_volume': blast_volume_rows,
+}
+
+# Форматы фоновых выгрузок: MIME тип и расширение файла
+FILE_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'json': ('application/json', 'json'),
+    'txt': ('text/plain', 'txt'),
+    'xlsx': (XLSX_MIMETYPE, 'xlsx'),
+    **columnar_export.COLUMNAR_FORMATS
+}
 
 @export_bp.route('/api/export/<report_type>/<format_type>')
 def export_report(report_type, format_type):
     """Экспорт отчета в указанном формате"""
     try:
-        # Получаем данные в зависимости от типа отчета
-        data = get_report_data(report_type)
-        
-        if not data:
+        if format_type not in FILE_FORMATS:
+            return jsonify({'error': 'Unsupported format'}), 400
+        if report_type not in REPORT_QUERIES and report_type not in COMPUTED_REPORTS:
             return jsonify({'error': 'No data available for export'}), 404
         
-        # Преобразуем Decimal в float для JSON
-        if format_type == 'json':
-            data = convert_decimal_to_float(data)
-        
-        # Генерируем файл
-        if format_type == 'csv':
-            return export_csv(data, report_type)
-        elif format_type == 'json':
-            return export_json(data, report_type)
-        elif format_type == 'txt':
-            return export_txt(data, report_type)
+        if format_type in columnar_export.COLUMNAR_FORMATS and report_type in COMPUTED_REPORTS:
+            def make_chunks():
+                rows = COMPUTED_REPORTS[report_type]()
+                return columnar_export.stream_records(rows, format_type) if rows else None
+            return export_columnar(make_chunks, report_type, None, format_type)
+        
+        # Колоночные форматы пишутся потоком прямо из курсора
+        if format_type in columnar_export.COLUMNAR_FORMATS:
+            query = REPORT_QUERIES[report_type]
+            return export_columnar(
+                lambda: columnar_export.stream_query(query, None, format_type),
+                report_type, None, format_type
+            )
+        
+        if format_type == 'xlsx':
+            def build(fileobj):
+                job = ExportProgress()
+                build_report_file(job, fileobj, report_type, format_type)
+                return job.rows_written
         else:
-            return jsonify({'error': 'Unsupported format'}), 400
+            def build(fileobj):
+                return write_rendered(fileobj, get_report_data(report_type), format_type)
+        
+        return export_cached(report_type, None, format_type, build)
             
     except Exception as e:
         logger.error(f"Export error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def export_csv(data, report_type):
+def export_cached(report_type, block_id, format_type, build):
+    """Отдача файла из дискового кэша выгрузок; при промахе файл собирается builder'ом"""
+    key = export_cache.key(report_type, block_id, format_type)
+    entry = export_cache.get(key)
+    if entry is None:
+        entry = export_cache.build(key, FILE_FORMATS[format_type][0], build)
+        if entry is None:
+            return jsonify({'error': 'No data available for export'}), 404
+    
+    return send_file(
+        entry.path,
+        mimetype=entry.mimetype,
+        as_attachment=True,
+        download_name=export_filename(report_type, format_type)
+    )
+
+def write_rendered(fileobj, data, format_type):
+    """Запись данных отчета в CSV/JSON/TXT; возвращает число строк"""
+    if not data:
+        return 0
+    
+    fileobj.write(RENDERERS[format_type](data))
+    return len(data)
+
+def render_csv(data):
     """Экспорт в CSV"""
-    try:
-        if not data:
-            return jsonify({'error': 'No data to export'}), 404
-            
-        output = io.StringIO()
-        writer = csv.writer(output)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    
+    # Заголовки
+    if data and len(data) > 0:
+        headers = list(data[0].keys())
+        writer.writerow(headers)
         
-        # Заголовки
-        if data and len(data) > 0:
-            headers = list(data[0].keys())
-            writer.writerow(headers)
-            
-            # Данные
-            for row in data:
-                # Преобразуем Decimal в строку для CSV
-                row_data = []
-                for header in headers:
-                    value = row.get(header, '')
-                    if isinstance(value, Decimal):
-                        value = float(value)
-                    row_data.append(str(value))
-                writer.writerow(row_data)
-        
-        output.seek(0)
-        filename = f"{report_type}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
-    except Exception as e:
-        logger.error(f"CSV export error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        # Данные
+        for row in data:
+            writer.writerow([str(row.get(header, '')) for header in headers])
+    
+    return output.getvalue().encode('utf-8')
 
-def export_json(data, report_type):
+def render_json(data):
     """Экспорт в JSON"""
-    try:
-        if not data:
-            return jsonify({'error': 'No data to export'}), 404
-            
-        filename = f"{report_type}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        
-        return send_file(
-            io.BytesIO(json.dumps(data, ensure_ascii=False, indent=2, cls=DecimalEncoder).encode('utf-8')),
-            mimetype='application/json',
-            as_attachment=True,
-            download_name=filename
-        )
-    except Exception as e:
-        logger.error(f"JSON export error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+    return serialization.dumps(data)
 
-def export_txt(data, report_type):
+def render_txt(data):
     """Экспорт в TXT"""
+    output = io.StringIO()
+    
+    if data and len(data) > 0:
+        headers = list(data[0].keys())
+        output.write("\t".join(headers) + "\n")
+        
+        for row in data:
+            output.write("\t".join(str(row.get(header, '')) for header in headers) + "\n")
+    
+    return output.getvalue().encode('utf-8')
+
+RENDERERS = {
+    'csv': render_csv,
+    'json': render_json,
+    'txt': render_txt,
+}
+
+def cursor_sheet(cursor):
+    """Заголовки и строки листа из выполненного серверного курсора"""
+    rows = iter(cursor)
+    first = next(rows, None)
+    headers = [desc[0] for desc in cursor.description] if cursor.description else []
+    return headers, (chain((first,), rows) if first is not None else ())
+
+def export_columnar(make_chunks, report_type, block_id, format_type):
+    """Потоковый экспорт в Arrow IPC / Parquet с записью результата в кэш"""
+    if not columnar_export.is_available():
+        return jsonify({'error': f'Format {format_type} requires pyarrow'}), 400
+    
+    mimetype = columnar_export.COLUMNAR_FORMATS[format_type][0]
+    key = export_cache.key(report_type, block_id, format_type)
+    entry = export_cache.get(key)
+    if entry is not None:
+        return send_file(entry.path, mimetype=mimetype, as_attachment=True,
+                         download_name=export_filename(report_type, format_type))
+    
+    # make_chunks() возвращает None, если выгружать нечего
+    chunks = make_chunks()
+    if chunks is None:
+        return jsonify({'error': 'No data available for export'}), 404
+    
+    filename = columnar_export.download_name(report_type, format_type)
+    chunks = export_cache.tee(key, mimetype, chunks)
+    
+    return Response(
+        stream_with_context(columnar_export.primed(chunks)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+def export_filename(report_type, format_type):
+    """Имя файла выгрузки"""
+    return f"{report_type}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{FILE_FORMATS[format_type][1]}"
+
+def build_report_file(job, fileobj, report_type, format_type):
+    """Сборка файла отчета для фоновой задачи"""
+    from app.models.database import db_manager
+    from app.models.block_index import block_index
+    
+    if report_type in COMPUTED_REPORTS:
+        rows = COMPUTED_REPORTS[report_type]()
+        job.total_rows = len(rows)
+        if format_type in columnar_export.COLUMNAR_FORMATS:
+            for chunk in columnar_export.stream_records(rows, format_type):
+                fileobj.write(chunk)
+            job.rows_written = len(rows)
+        else:
+            export_handler.write_file(fileobj, format_type, [(report_type, None, job.counted(rows))])
+        return export_filename(report_type, format_type), FILE_FORMATS[format_type][0]
+    
+    query = REPORT_QUERIES[report_type]
+    # Отчеты по блокам дают примерно строку на блок - оценка для процента готовности
+    if report_type != 'rig_productivity':
+        job.total_rows = len(block_index) or None
+    
+    if format_type in columnar_export.COLUMNAR_FORMATS:
+        for chunk in columnar_export.stream_query(query, None, format_type, progress=job.advance):
+            fileobj.write(chunk)
+    else:
+        with db_manager.get_server_cursor('export_job', numeric_as_float=True) as cursor:
+            cursor.execute(query)
+            headers, rows = cursor_sheet(cursor)
+            export_handler.write_file(fileobj, format_type, [(report_type, headers, job.counted(rows))])
+    
+    return export_filename(report_type, format_type), FILE_FORMATS[format_type][0]
+
+@export_bp.route('/api/export/jobs', methods=['POST'])
+def submit_export_job():
+    """Постановка выгрузки в фоновую очередь"""
     try:
-        if not data:
-            return jsonify({'error': 'No data to export'}), 404
-            
-        output = io.StringIO()
+        payload = request.get_json(silent=True) or {}
+        format_type = payload.get('format')
         
-        if data and len(data) > 0:
-            headers = list(data[0].keys())
-            output.write("\t".join(headers) + "\n")
-            
-            for row in data:
-                row_data = []
-                for header in headers:
-                    value = row.get(header, '')
-                    if isinstance(value, Decimal):
-                        value = float(value)
-                    row_data.append(str(value))
-                output.write("\t".join(row_data) + "\n")
-        
-        output.seek(0)
-        filename = f"{report_type}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=filename
+        if format_type not in FILE_FORMATS:
+            return jsonify({'error': 'Unsupported format'}), 400
+        if format_type in columnar_export.COLUMNAR_FORMATS and not columnar_export.is_available():
+            return jsonify({'error': f'Format {format_type} requires pyarrow'}), 400
+        
+        if payload.get('block_id'):
+            from app.routes.block_export import submit_block_export_job
+            return submit_block_export_job(str(payload['block_id']), payload.get('data_type'), format_type)
+        
+        report_type = payload.get('report_type')
+        if report_type not in REPORT_QUERIES and report_type not in COMPUTED_REPORTS:
+            return jsonify({'error': 'Unknown report type'}), 400
+        
+        job = export_jobs.submit(
+            {'report_type': report_type, 'format': format_type},
+            lambda job, fileobj: build_report_file(job, fileobj, report_type, format_type),
+            data_version=invalidation_bus.mine_version()
         )
+        return jsonify(job.to_dict()), 202
+        
+    except ExportQueueFull as e:
+        logger.warning(str(e))
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
-        logger.error(f"TXT export error: {str(e)}")
+        logger.error(f"Export job submit error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@export_bp.route('/api/export/jobs/<job_id>')
+def get_export_job(job_id):
+    """Состояние фоновой выгрузки"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    return jsonify(job.to_dict())
+
+@export_bp.route('/api/export/jobs/<job_id>/download')
+def download_export_job(job_id):
+    """Скачивание готового файла фоновой выгрузки"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job.status != DONE:
+        return jsonify({'error': f'Export job is {job.status}', 'job': job.to_dict()}), 409
+    
+    return send_file(job.path, mimetype=job.mimetype, as_attachment=True, download_name=job.filename)
+
 @export_bp.route('/api/export/formats')
 def get_export_formats():
     """Возвращает список поддерживаемых форматов"""
+    formats = ['csv', 'json', 'txt', 'xlsx']
+    if columnar_export.is_available():
+        formats.extend(columnar_export.COLUMNAR_FORMATS)
     return jsonify({
-        'formats': ['csv', 'json', 'txt']
+        'formats': formats
     })
 
 def get_report_data(report_type):
@@ -167,6 +304,8 @@ def get_report_data(report_type):
             return get_rig_productivity_data()
         elif report_type == 'blocks_efficiency':
             return get_blocks_efficiency_data()
+        elif report_type in COMPUTED_REPORTS:
+            return COMPUTED_REPORTS[report_type]()
         else:
             return []
     except Exception as e:
@@ -178,18 +317,7 @@ def get_blocks_data():
     try:
         from app.models.database import db_manager
         
-        result = db_manager.execute_query("""
-            SELECT 
-                "BlockID" as block_id,
-                "BlockName" as block_name,
-                "CrushEnergy" as crush_energy,
-                "HolesSpace" as holes_space,
-                "RowsDistance" as rows_distance,
-                "RockName" as rock_name,
-                "RockRigity" as rock_rigidity,
-                "RockDensity" as rock_density
-            FROM public."BlockInfo"
-        """)
+        result = db_manager.execute_query(BLOCKS_QUERY, numeric_as_float=True)
         return [dict(row) for row in result] if result else []
     except Exception as e:
         logger.error(f"Error getting blocks data: {str(e)}")
@@ -200,7 +328,7 @@ def get_drilling_progress_data():
     try:
         from app.models.database import db_manager
         
-        result = db_manager.execute_function('calculate_drilling_progress')
+        result = db_manager.execute_function('calculate_drilling_progress', numeric_as_float=True)
         return [dict(row) for row in result] if result else []
     except Exception as e:
         logger.error(f"Error getting drilling progress data: {str(e)}")
@@ -211,7 +339,7 @@ def get_rig_productivity_data():
     try:
         from app.models.database import db_manager
         
-        result = db_manager.execute_function('calculate_rig_productivity_by_block')
+        result = db_manager.execute_function('calculate_rig_productivity_by_block', numeric_as_float=True)
         return [dict(row) for row in result] if result else []
     except Exception as e:
         logger.error(f"Error getting rig productivity data: {str(e)}")
@@ -222,7 +350,7 @@ def get_blocks_efficiency_data():
     try:
         from app.models.database import db_manager
         
-        result = db_manager.execute_function('calculate_drilling_efficiency_by_block')
+        result = db_manager.execute_function('calculate_drilling_efficiency_by_block', numeric_as_float=True)
         return [dict(row) for row in result] if result else []
     except Exception as e:
         logger.error(f"Error getting blocks efficiency data: {str(e)}")
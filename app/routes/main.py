@@ -35,16 +35,51 @@ def get_rig_productivity():
     from app.routes.analytics import get_rig_productivity
     return get_rig_productivity()
 
+@main_bp.route('/api/rigs/productivity/refresh-deltas')
+def get_rig_productivity_refresh_deltas():
+    from app.routes.analytics import get_rig_productivity_refresh_deltas
+    return get_rig_productivity_refresh_deltas()
+
 @main_bp.route('/api/rigs/models')
 def get_rig_models_productivity():
     from app.routes.analytics import get_rig_models_productivity
     return get_rig_models_productivity()
 
+@main_bp.route('/api/rigs/assignment', methods=['GET', 'POST'])
+def get_rig_assignment():
+    from app.routes.analytics import get_rig_assignment
+    return get_rig_assignment()
+
+@main_bp.route('/api/rigs/summary')
+def get_rigs_summary():
+    from app.routes.analytics import get_rigs_summary
+    return get_rigs_summary()
+
 @main_bp.route('/api/blocks/remaining_shifts')
 def get_remaining_shifts():
     from app.routes.analytics import get_remaining_shifts
     return get_remaining_shifts()
 
+@main_bp.route('/api/blocks/remaining_shifts/forecast')
+def get_remaining_shifts_forecast():
+    from app.routes.analytics import get_remaining_shifts_forecast
+    return get_remaining_shifts_forecast()
+
+@main_bp.route('/api/blocks/grid_regularity')
+def get_blocks_grid_regularity():
+    from app.routes.analytics import get_blocks_grid_regularity
+    return get_blocks_grid_regularity()
+
+@main_bp.route('/api/blocks/blast_volume')
+def get_blocks_blast_volume():
+    from app.routes.analytics import get_blocks_blast_volume
+    return get_blocks_blast_volume()
+
+@main_bp.route('/api/deviations/stats')
+def get_deviation_stats():
+    from app.routes.analytics import get_deviation_stats
+    return get_deviation_stats()
+
 @main_bp.route('/api/blocks/efficiency')
 def get_blocks_efficiency():
     from app.routes.analytics import get_blocks_efficiency
@@ -55,6 +90,11 @@ def search_block():
     from app.routes.analytics import search_block
     return search_block()
 
+@main_bp.route('/api/blocks/suggest')
+def suggest_blocks():
+    from app.routes.blocks import suggest_blocks
+    return suggest_blocks()
+
 # API маршруты для 3D визуализации
 @main_bp.route('/api/block/<block_id>/info', methods=['GET'])
 def get_block_info_api(block_id):
@@ -74,6 +114,24 @@ def get_block_relief(block_id):
     from app.routes.boreholes import get_relief_3D
     return get_relief_3D(block_id)
 
+@main_bp.route('/api/block/<block_id>/grid_regularity', methods=['GET'])
+def get_block_grid_regularity(block_id):
+    """Регулярность фактической сетки блока"""
+    from app.routes.blocks import get_block_grid_regularity
+    return get_block_grid_regularity(block_id)
+
+@main_bp.route('/api/block/<block_id>/relief/collars', methods=['GET'])
+def get_block_collar_elevations(block_id):
+    """Отклонение высот устьев скважин от поверхности рельефа"""
+    from app.routes.boreholes import get_collar_elevation_deviations
+    return get_collar_elevation_deviations(block_id)
+
+@main_bp.route('/api/block/<block_id>/blast_volume', methods=['GET'])
+def get_block_blast_volume(block_id):
+    """Объем породы и потребный заряд по скважинам блока"""
+    from app.routes.blocks import get_block_blast_volume
+    return get_block_blast_volume(block_id)
+
 # Маршрут для деталей скважины
 @main_bp.route('/borehole/<block_id>/<borehole_name>')
 def get_borehole_details(block_id, borehole_name):
@@ -93,6 +151,30 @@ def get_export_formats():
     from app.routes.export import get_export_formats as export_formats
     return export_formats()
 
+@main_bp.route('/api/export/jobs', methods=['POST'])
+def submit_export_job():
+    """Постановка выгрузки в фоновую очередь"""
+    from app.routes.export import submit_export_job as submit_job
+    return submit_job()
+
+@main_bp.route('/api/export/jobs/<job_id>')
+def get_export_job(job_id):
+    """Состояние фоновой выгрузки"""
+    from app.routes.export import get_export_job as export_job
+    return export_job(job_id)
+
+@main_bp.route('/api/export/jobs/<job_id>/download')
+def download_export_job(job_id):
+    """Скачивание готового файла фоновой выгрузки"""
+    from app.routes.export import download_export_job as download_job
+    return download_job(job_id)
+
+@main_bp.route('/api/export/bulk', methods=['GET', 'POST'])
+def export_bulk():
+    """Выгрузка данных нескольких блоков одним ZIP архивом"""
+    from app.routes.block_export import export_bulk as bulk_export_handler
+    return bulk_export_handler()
+
 @main_bp.route('/api/export/block/<block_id>/<data_type>/<format_type>')
 def export_block_data(block_id, data_type, format_type):
     """Экспорт данных конкретного блока"""
@@ -26,6 +26,48 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // Постраничная загрузка таблицы блоков: сортировка и фильтры на сервере
+    const BLOCKS_PAGE_SIZE = 100;
+    const blocksQuery = {
+        sort: '-percent_drilled_actual',
+        prefix: '',
+        min_percent: '',
+        max_percent: '',
+        is_blasted: ''
+    };
+    let blocksCursor = null;
+    let blocksRequest = 0;
+    let shiftsByBlock = new Map();
+    let efficiencyByBlock = new Map();
+    let filterTimer = null;
+    
+    document.querySelectorAll('#blocks-table th.sortable').forEach(th => {
+        th.addEventListener('click', function() {
+            const column = th.dataset.sort;
+            blocksQuery.sort = blocksQuery.sort === '-' + column ? column : '-' + column;
+            document.querySelectorAll('#blocks-table th.sortable').forEach(other => {
+                other.classList.remove('sorted-asc', 'sorted-desc');
+            });
+            th.classList.add(blocksQuery.sort.startsWith('-') ? 'sorted-desc' : 'sorted-asc');
+            loadBlocksPage(true);
+        });
+    });
+    
+    [['filter-prefix', 'prefix'], ['filter-min-percent', 'min_percent'],
+     ['filter-max-percent', 'max_percent'], ['filter-blasted', 'is_blasted']].forEach(([id, param]) => {
+        const input = document.getElementById(id);
+        input.addEventListener(input.tagName === 'SELECT' ? 'change' : 'input', function() {
+            blocksQuery[param] = input.value.trim();
+            // Запрос после паузы ввода, а не на каждый символ
+            clearTimeout(filterTimer);
+            filterTimer = setTimeout(() => loadBlocksPage(true), 300);
+        });
+    });
+    
+    document.getElementById('blocks-more').addEventListener('click', function() {
+        loadBlocksPage(false);
+    });
+    
     // Функция загрузки данных
     async function loadData() {
         try {
@@ -33,19 +75,18 @@ document.addEventListener('DOMContentLoaded', function() {
             const blocksProgress = await fetch('/api/blocks/progress').then(res => res.json());
             updateBlocksProgress(blocksProgress);
             
-            // Загрузка прогресса по блокам
-            const drillingProgress = await fetch('/api/blocks/drilling_progress').then(res => res.json());
-            blocksData = drillingProgress;
-            
             // Загрузка оставшихся смен
             const shiftsResponse = await fetch('/api/blocks/remaining_shifts').then(res => res.json());
             remainingShiftsData = shiftsResponse;
+            shiftsByBlock = new Map(remainingShiftsData.map(item => [item.block_id, item]));
             
             // Загрузка эффективности бурения
             const efficiencyResponse = await fetch('/api/blocks/efficiency').then(res => res.json());
             efficiencyData = efficiencyResponse;
+            efficiencyByBlock = new Map(efficiencyData.map(item => [item.block_id, item]));
             
-            updateBlocksTable(blocksData);
+            // Первая страница прогресса по блокам
+            await loadBlocksPage(true);
             
             // Загрузка производительности моделей станков
             const rigModels = await fetch('/api/rigs/models').then(res => res.json());
@@ -60,6 +101,30 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Загрузка страницы таблицы блоков (reset - с начала списка)
+    async function loadBlocksPage(reset) {
+        const params = new URLSearchParams({limit: BLOCKS_PAGE_SIZE});
+        Object.entries(blocksQuery).forEach(([key, value]) => {
+            if (value !== '') params.set(key, value);
+        });
+        if (!reset && blocksCursor) params.set('after', blocksCursor);
+        
+        // Ответы устаревших запросов (при быстрой смене фильтров) отбрасываются
+        const requestId = ++blocksRequest;
+        const response = await fetch(`/api/blocks/drilling_progress?${params}`);
+        const page = await response.json();
+        if (requestId !== blocksRequest) return;
+        if (!response.ok) {
+            console.error('Ошибка загрузки блоков:', page.error);
+            return;
+        }
+        
+        blocksData = reset ? page.items : blocksData.concat(page.items);
+        blocksCursor = page.next;
+        updateBlocksTable(page.items, reset);
+        document.getElementById('blocks-more').style.display = blocksCursor ? 'inline-block' : 'none';
+    }
+    
     // Обновление статистики по блокам
     function updateBlocksProgress(data) {
         document.getElementById('total-blocks').textContent = data.total_blocks;
@@ -68,17 +133,18 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('blocks-progress-fill').style.width = data.percent_drilled + '%';
     }
     
-    // Обновление таблицы блоков
-    function updateBlocksTable(data) {
+    // Обновление таблицы блоков (reset - очистить перед добавлением строк)
+    function updateBlocksTable(data, reset = true) {
         const tbody = document.querySelector('#blocks-table tbody');
-        tbody.innerHTML = '';
+        if (reset) tbody.innerHTML = '';
         
+        const fragment = document.createDocumentFragment();
         data.forEach(block => {
             const row = document.createElement('tr');
             
             // Находим данные о сменах и эффективности для текущего блока
-            const shiftsInfo = remainingShiftsData.find(item => item.block_id === block.block_id);
-            const efficiencyInfo = efficiencyData.find(item => item.block_id === block.block_id);
+            const shiftsInfo = shiftsByBlock.get(block.block_id);
+            const efficiencyInfo = efficiencyByBlock.get(block.block_id);
             
             row.innerHTML = `
                 <td>${block.block_id}</td>
@@ -101,8 +167,9 @@ document.addEventListener('DOMContentLoaded', function() {
             });
             
             row.style.cursor = 'pointer';
-            tbody.appendChild(row);
+            fragment.appendChild(row);
         });
+        tbody.appendChild(fragment);
     }
     
     // Инициализация графика производительности моделей станков
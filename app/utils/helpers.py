@@ -1,16 +1,8 @@
-from flask import jsonify
-import decimal
+from app.utils import serialization
 
 def json_response(data, status_code=200):
-    """Создание JSON ответа с поддержкой Decimal"""
-    def decimal_default(obj):
-        if isinstance(obj, decimal.Decimal):
-            return float(obj)
-        raise TypeError
-    
-    response = jsonify(data)
-    response.status_code = status_code
-    return response
+    """Создание компактного JSON ответа с поддержкой Decimal, дат и numpy"""
+    return serialization.json_response(data, status_code)
 
 def format_coordinates(x, y, z):
     """Форматирование координат"""
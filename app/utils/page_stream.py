@@ -0,0 +1,97 @@
+import json
+import logging
+import time
+
+from flask import Response, current_app, stream_with_context
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+# Граница секции в выводе шаблона; клиенту не отправляется
+FLUSH_MARKER = '\x00flush\x00'
+
+# Вывод при ошибке после отправки заголовков. Ошибка может случиться внутри
+# <script> (данные секции встраиваются в код страницы), поэтому сначала
+# он закрывается; вне скрипта лишний </script> браузер пропускает.
+ERROR_MARKUP = '</script><div class="error-message">Ошибка загрузки данных страницы</div>'
+
+class LazySections:
+    """Данные страницы, загружаемые по секциям при первом обращении из шаблона.
+
+    loaders - {переменная шаблона: функция загрузки секции}; функция
+    возвращает словарь переменных секции и вызывается один раз, даже если
+    секция дает несколько переменных. В шаблоне переменные читаются как
+    атрибуты (page.report_data), а перед первой переменной секции стоит
+    {{ page.flush() }}: при потоковом выводе все отрисованное до этой точки
+    отправляется клиенту до запроса данных секции.
+    """
+
+    def __init__(self, loaders, streaming=False):
+        self._loaders = loaders
+        self._values = {}
+        self.streaming = streaming
+
+    def __getattr__(self, name):
+        loaders = self.__dict__.get('_loaders', {})
+        if name not in loaders:
+            raise AttributeError(name)
+        if name not in self._values:
+            loader = loaders[name]
+            started = time.monotonic()
+            self._values.update(loader())
+            logger.debug(f"Page section {loader.__name__} loaded in {time.monotonic() - started:.3f}s")
+        return self._values[name]
+
+    def flush(self):
+        return Markup(FLUSH_MARKER) if self.streaming else ''
+
+def _flushed(chunks):
+    """Склейка мелких фрагментов вывода Jinja до ближайшей границы секции"""
+    buffer = []
+    for chunk in chunks:
+        if chunk == FLUSH_MARKER:
+            if buffer:
+                yield ''.join(buffer)
+                buffer = []
+            continue
+        buffer.append(chunk)
+    if buffer:
+        yield ''.join(buffer)
+
+def _error_markup(error_url):
+    if not error_url:
+        return ERROR_MARKUP
+    return f"{ERROR_MARKUP}<script>window.location.replace({json.dumps(error_url)});</script>"
+
+def stream_page(template_name, page, on_complete=None, error_url=None, **context):
+    """Потоковый ответ: шаблон отдается частями по границам секций page.
+
+    on_complete(html) вызывается с полной страницей, если она отрисована без
+    ошибок; при ошибке выводится сообщение и, если задан error_url, браузер
+    переходит на этот адрес (как redirect при обычной отрисовке).
+    """
+    page.streaming = True
+    context['page'] = page
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+
+    def generate():
+        started = time.monotonic()
+        parts = []
+        try:
+            for chunk in _flushed(template.generate(context)):
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            # Заголовки уже отправлены - ошибка выводится в конце страницы
+            logger.error(f"Error streaming {template_name}: {str(e)}")
+            yield _error_markup(error_url)
+            return
+        if on_complete is not None:
+            on_complete(''.join(parts))
+        logger.info(f"Streamed {template_name} in {time.monotonic() - started:.3f}s")
+
+    response = Response(stream_with_context(generate()), mimetype='text/html')
+    # Без буферизации ответа на обратном прокси
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,89 @@
+import decimal
+import json
+from datetime import date, datetime, time
+
+from flask import Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - без orjson работает стандартный json
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy нужен только для массивов numpy
+    np = None
+
+JSON_MIMETYPE = 'application/json'
+
+# Размер пачки строк при потоковой отдаче массива
+STREAM_CHUNK_ROWS = 1000
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _default(value):
+    """Типы, которых нет в JSON: Decimal, даты, numpy"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if np is not None:
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, np.generic):
+            return value.item()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(data):
+    """Компактная сериализация в байты UTF-8 (orjson, если установлен)"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+def iter_array(rows, chunk_rows=STREAM_CHUNK_ROWS):
+    """JSON массив частями по chunk_rows строк, без сборки всего документа"""
+    yield b'['
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            # Сериализуем пачку как массив и отрезаем скобки
+            yield (b'' if first else b',') + dumps(chunk)[1:-1]
+            first = False
+            chunk = []
+    if chunk:
+        yield (b'' if first else b',') + dumps(chunk)[1:-1]
+    yield b']'
+
+def json_response(data, status_code=200):
+    """JSON ответ через быстрый сериализатор"""
+    return Response(dumps(data), status=status_code, mimetype=JSON_MIMETYPE)
+
+def json_stream_response(rows, status_code=200):
+    """Потоковый JSON ответ для больших массивов"""
+    return Response(stream_with_context(iter_array(rows)), status=status_code, mimetype=JSON_MIMETYPE)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON провайдер Flask на быстром сериализаторе: jsonify без изменений в маршрутах.
+
+    Ключи не сортируются и вывод всегда компактный; вызовы dumps с
+    дополнительными параметрами уходят в стандартный провайдер.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+def serializer_name():
+    """Используемый сериализатор (для логов и бенчмарков)"""
+    return 'orjson' if orjson is not None else 'json'
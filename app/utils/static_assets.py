@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - без brotli отдаются только .gz варианты
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINTED_EXTENSIONS = ('.css', '.js')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+IMMUTABLE_CACHE_CONTROL = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+
+# Готовые сжатые варианты в порядке предпочтения
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+def _write_atomic(path, content):
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(partial, 'wb') as fileobj:
+        fileobj.write(content)
+    os.replace(partial, path)
+
+class StaticAssets:
+    """Статические css/js с хэшем содержимого в имени файла.
+
+    При создании приложения (или заранее: python -m app.utils.static_assets)
+    файлы копируются в static/<output_dir> под именем имя.<хэш>.расширение
+    вместе со сжатыми вариантами .gz и .br (если установлен brotli), а
+    url_for('static', filename=...) выдает адрес копии. Копии отдаются с
+    Cache-Control: immutable и готовым сжатием по Accept-Encoding: при
+    изменении файла меняется его адрес, и браузеру нечего перепроверять.
+    """
+
+    def __init__(self, output_dir='dist'):
+        self.output_dir = output_dir
+        self.manifest = {}
+        self._fingerprinted = set()
+
+    def init_app(self, app):
+        if not app.config.get('STATIC_FINGERPRINT', True):
+            return
+        try:
+            self.manifest = self.build(app.static_folder)
+        except OSError as e:
+            # Каталог static только для чтения и без готовой сборки - обычная отдача
+            logger.warning(f"Static assets fingerprinting disabled: {str(e)}")
+            return
+        self._fingerprinted = set(self.manifest.values())
+        app.url_defaults(self._url_defaults)
+        app.view_functions['static'] = self._serve
+
+    def build(self, static_folder):
+        """Копии файлов с хэшем в имени и сжатые варианты; манифест {исходный путь: путь копии}"""
+        output_root = os.path.join(static_folder, self.output_dir)
+        manifest = {}
+        written = 0
+        for root, dirs, files in os.walk(static_folder):
+            dirs[:] = [name for name in dirs if os.path.join(root, name) != output_root]
+            for name in files:
+                if not name.endswith(FINGERPRINTED_EXTENSIONS):
+                    continue
+                source = os.path.join(root, name)
+                with open(source, 'rb') as fileobj:
+                    content = fileobj.read()
+
+                relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+                stem, extension = os.path.splitext(relative)
+                digest = hashlib.sha256(content).hexdigest()[:12]
+                target = f"{self.output_dir}/{stem}.{digest}{extension}"
+                manifest[relative] = target
+                written += self._write_variants(os.path.join(static_folder, target), content)
+
+        logger.info(f"Static assets fingerprinted: {len(manifest)} files, {written} written")
+        return manifest
+
+    @staticmethod
+    def _write_variants(path, content):
+        """Запись копии и сжатых вариантов; имя зависит от содержимого, поэтому готовые файлы не переписываются"""
+        variants = [(path, lambda: content), (f"{path}.gz", lambda: gzip.compress(content, 9, mtime=0))]
+        if brotli is not None:
+            variants.append((f"{path}.br", lambda: brotli.compress(content, quality=11)))
+
+        written = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for variant_path, compress in variants:
+            if not os.path.exists(variant_path):
+                _write_atomic(variant_path, compress())
+                written += 1
+        return written
+
+    def _url_defaults(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = self.manifest[values['filename']]
+
+    def _serve(self, filename):
+        """Отдача static: копии с хэшем - со сжатием и бессрочным кэшем"""
+        if filename not in self._fingerprinted:
+            return current_app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] and \
+                    os.path.exists(os.path.join(current_app.static_folder, filename + suffix)):
+                response = send_from_directory(current_app.static_folder, filename + suffix,
+                                               mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(current_app.static_folder, filename,
+                                           mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+static_assets = StaticAssets()
+
+if __name__ == '__main__':
+    # Сборка при деплое: python -m app.utils.static_assets
+    logging.basicConfig(level=logging.INFO)
+    static_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+    for source, target in sorted(static_assets.build(static_folder).items()):
+        print(f"{source} -> {target}")
@@ -0,0 +1,90 @@
+# bench_deviation_engine.py
+"""Бенчмарк расчета отклонений: SQL функции calc_*_deviations против
+расчета в приложении (app/models/deviation_engine.py).
+
+Для каждого блока замеряется загрузка DeviationFrame обоими путями и
+сверяются число строк и значения общих колонок (полезная длина и перебур
+в расчете приложения не заполняются и не сравниваются). При любом
+расхождении скрипт завершается с кодом 1.
+
+Запуск:
+    python benchmarks/bench_deviation_engine.py --block-id 599719204 --repeat 20
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from app.models.database import db_manager
+from app.models.deviation_engine import deviation_engine
+from app.models.deviation_frame import DeviationFrame
+
+COMPARED_COLUMNS = (
+    'planned_x', 'planned_y', 'actual_x', 'actual_y', 'deviation',
+    'planned_length', 'actual_length', 'length_diff',
+    'planned_diameter', 'actual_diameter', 'diameter_diff',
+    'planned_angle', 'actual_angle', 'angle_diff',
+    'planned_azimuth', 'actual_azimuth', 'azimuth_diff',
+)
+
+def timed_load(cursor, block_id, engine_enabled, repeat):
+    deviation_engine.enabled = engine_enabled
+    timings = []
+    frame = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        frame = DeviationFrame.load(cursor, block_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    return frame, statistics.median(timings)
+
+def compare(sql_frame, engine_frame, tolerance):
+    """Число расхождений по колонкам и скважины, которых нет в одном из наборов"""
+    mismatches = {}
+    for name in sql_frame.names:
+        for column in COMPARED_COLUMNS:
+            expected = sql_frame.value(name, column)
+            actual = engine_frame.value(name, column)
+            if expected is None and actual is None:
+                continue
+            if expected is None or actual is None or not math.isclose(expected, actual, abs_tol=tolerance):
+                mismatches[column] = mismatches.get(column, 0) + 1
+    missing = set(sql_frame.names) ^ set(engine_frame.names)
+    return mismatches, missing
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--block-id', required=True, action='append')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    args = parser.parse_args()
+
+    failed = False
+    header = f"{'block':<14}{'holes':>7}{'sql, ms':>10}{'engine, ms':>12}{'speedup':>9}  mismatches"
+    print(header)
+    print('-' * len(header))
+
+    with db_manager.get_connection() as conn:
+        with conn.cursor() as cursor:
+            for block_id in args.block_id:
+                sql_frame, sql_ms = timed_load(cursor, block_id, False, args.repeat)
+                engine_frame, engine_ms = timed_load(cursor, block_id, True, args.repeat)
+                mismatches, missing = compare(sql_frame, engine_frame, args.tolerance)
+                details = ', '.join(f"{column}={count}" for column, count in mismatches.items()) or 'none'
+                if missing:
+                    details += f"; unpaired holes: {len(missing)}"
+                if len(sql_frame) != len(engine_frame):
+                    details += f"; rows: sql={len(sql_frame)}, engine={len(engine_frame)}"
+                failed = failed or bool(mismatches or missing) or len(sql_frame) != len(engine_frame)
+                print(f"{block_id:<14}{len(engine_frame):>7}{sql_ms:>10.2f}{engine_ms:>12.2f}"
+                      f"{sql_ms / engine_ms if engine_ms else 0:>9.1f}  {details}")
+        conn.rollback()
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# bench_prepared_statements.py
+"""Микро-бенчмарк реестра подготовленных запросов.
+
+Сравнивает время планирования (Planning Time из EXPLAIN ANALYZE) и полное
+время выполнения горячих запросов в обычном виде и через PREPARE/EXECUTE.
+
+Запуск:
+    python benchmarks/bench_prepared_statements.py --block-id 599719204 --repeat 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from app.models.database import db_manager
+from app.models.prepared_statements import prepared_statements
+
+def planning_time(cursor, query, params):
+    """Время планирования запроса в миллисекундах"""
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0].get('Planning Time', 0.0)
+
+def bench_statement(conn, name, params, repeat):
+    """Замеры одного запроса: обычный путь против подготовленного"""
+    statement = prepared_statements.get(name)
+    plain_params = {f"p{i + 1}": value for i, value in enumerate(params)}
+    placeholders = ', '.join(['%s'] * len(params))
+    execute_sql = f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}"
+
+    with conn.cursor() as cursor:
+        prepared_statements.execute(cursor, name, params)
+        cursor.fetchall()
+
+        plain_planning = [planning_time(cursor, statement['fallback'], plain_params) for _ in range(repeat)]
+        prepared_planning = [planning_time(cursor, execute_sql, params) for _ in range(repeat)]
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            cursor.execute(statement['fallback'], plain_params)
+            cursor.fetchall()
+        plain_total = (time.perf_counter() - started) * 1000 / repeat
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            prepared_statements.execute(cursor, name, params)
+            cursor.fetchall()
+        prepared_total = (time.perf_counter() - started) * 1000 / repeat
+
+    return {
+        'statement': name,
+        'plain_planning_ms': statistics.median(plain_planning),
+        'prepared_planning_ms': statistics.median(prepared_planning),
+        'plain_call_ms': plain_total,
+        'prepared_call_ms': prepared_total
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--block-id', required=True)
+    parser.add_argument('--block-name')
+    parser.add_argument('--relief-item-id')
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    cases = [
+        ('block_name_by_id', (args.block_id,)),
+        ('block_info_by_id', (args.block_id,)),
+        ('block_boreholes', (args.block_id,)),
+        ('block_grid', (args.block_id,)),
+        ('boreholes_3d_by_block', (args.block_id,)),
+        ('relief_items_by_block', (args.block_id,)),
+    ]
+    if args.block_name:
+        cases.append(('block_by_name', (args.block_name,)))
+    if args.relief_item_id:
+        cases.append(('relief_points_by_item', (args.relief_item_id,)))
+
+    header = f"{'statement':<24}{'plan, ms':>10}{'prep plan':>11}{'saved':>9}{'call, ms':>10}{'prep call':>11}"
+    print(header)
+    print('-' * len(header))
+
+    with db_manager.get_connection() as conn:
+        for name, params in cases:
+            r = bench_statement(conn, name, params, args.repeat)
+            saved = r['plain_planning_ms'] - r['prepared_planning_ms']
+            print(f"{name:<24}{r['plain_planning_ms']:>10.3f}{r['prepared_planning_ms']:>11.3f}{saved:>9.3f}"
+                  f"{r['plain_call_ms']:>10.3f}{r['prepared_call_ms']:>11.3f}")
+        conn.rollback()
+
+if __name__ == '__main__':
+    main()
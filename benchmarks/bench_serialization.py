@@ -0,0 +1,102 @@
+# bench_serialization.py
+"""Бенчмарк сериализации больших JSON ответов.
+
+Сравнивает текущий путь (стандартный провайдер jsonify и json.dumps с
+indent=2 для выгрузок) с быстрым сериализатором app.utils.serialization:
+компактным dumps и потоковой отдачей массива пачками. По умолчанию данные
+генерируются для блока на 50 000 скважин в форме ответа
+/api/block/<id>/boreholes; с --block-id берутся из БД.
+
+Запуск:
+    python benchmarks/bench_serialization.py --holes 50000 --repeat 5
+    python benchmarks/bench_serialization.py --block-id 599719204
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.utils import serialization
+
+def synthetic_block(holes):
+    """Скважины блока с NUMERIC полями, как их отдает драйвер без приведения"""
+    rnd = random.Random(42)
+    return [
+        {
+            'Name': f"{i // 100 + 1}-{i % 100 + 1}",
+            'X': Decimal(f"{rnd.uniform(1000, 2000):.3f}"),
+            'Y': Decimal(f"{rnd.uniform(1000, 2000):.3f}"),
+            'Z': Decimal(f"{rnd.uniform(100, 200):.3f}"),
+            'Length': Decimal(f"{rnd.uniform(10, 20):.2f}"),
+            'Diameter': Decimal('250.0'),
+            'Angle': Decimal(f"{rnd.uniform(0, 15):.1f}"),
+            'Azimuth': Decimal(f"{rnd.uniform(0, 360):.1f}"),
+            'T': 3 if i % 3 else 2
+        }
+        for i in range(holes)
+    ]
+
+def block_from_db(block_id):
+    from psycopg2.extras import RealDictCursor
+    from app.models.database import db_manager
+    import app.models.prepared_statements  # noqa: F401 - регистрация запросов
+
+    return db_manager.execute_prepared('boreholes_3d_by_block', (block_id,), cursor_factory=RealDictCursor)
+
+def measure(func, repeat):
+    """Медиана времени (мс) и размер результата в байтах"""
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), size
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON serialization benchmark')
+    parser.add_argument('--holes', type=int, default=50000)
+    parser.add_argument('--block-id', help='Взять скважины блока из БД')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = block_from_db(args.block_id) if args.block_id else synthetic_block(args.holes)
+    float_rows = [{key: float(value) if isinstance(value, Decimal) else value for key, value in row.items()}
+                  for row in rows]
+
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = serialization.FastJSONProvider(app)
+
+    def streamed(data):
+        return lambda: sum(len(chunk) for chunk in serialization.iter_array(data))
+
+    cases = [
+        ('jsonify (default provider)', lambda: len(default_provider.response(rows).get_data())),
+        ('json.dumps indent=2 (export)', lambda: len(json.dumps(rows, ensure_ascii=False, indent=2, default=float).encode('utf-8'))),
+        ('jsonify (fast provider)', lambda: len(fast_provider.response(rows).get_data())),
+        ('serialization.dumps', lambda: len(serialization.dumps(rows))),
+        ('serialization.iter_array', streamed(rows)),
+        ('serialization.dumps (float rows)', lambda: len(serialization.dumps(float_rows))),
+        ('serialization.iter_array (float rows)', streamed(float_rows)),
+    ]
+
+    print(f"Rows: {len(rows)}, serializer: {serialization.serializer_name()}, repeat: {args.repeat}")
+    print(f"{'case':<40} {'median ms':>10} {'bytes':>12}")
+    with app.app_context():
+        for name, func in cases:
+            elapsed, size = measure(func, args.repeat)
+            print(f"{name:<40} {elapsed:>10.1f} {size:>12}")
+
+if __name__ == '__main__':
+    main()
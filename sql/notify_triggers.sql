@@ -0,0 +1,80 @@
+-- notify_triggers.sql
+-- Триггеры уведомлений об изменении данных блоков для LISTEN/NOTIFY.
+-- Приложение слушает каналы ниже (app/models/invalidation.py) и сбрасывает
+-- кэши только затронутых блоков.
+--
+-- Каналы:
+--   boreholes_changed   - public."Boreholes"
+--   block_info_changed  - public."BlockInfo"
+--   relief_changed      - public."ReliefItems", public."ReliefPoints"
+--   rigs_changed        - public."DrillingRigs" и таблицы данных станков
+
+CREATE OR REPLACE FUNCTION public.notify_block_data_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    channel   text := TG_ARGV[0];
+    new_row   jsonb := CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END;
+    old_row   jsonb := CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END;
+    block_id  text := COALESCE(new_row ->> 'BlockID', old_row ->> 'BlockID');
+    payload   jsonb;
+BEGIN
+    -- Точки рельефа не хранят блок: берем его из элемента рельефа
+    IF TG_TABLE_NAME = 'ReliefPoints' THEN
+        SELECT ri."BlockID"::text INTO block_id
+        FROM public."ReliefItems" ri
+        WHERE ri."ItemID"::text = COALESCE(new_row ->> 'ReliefItemID', old_row ->> 'ReliefItemID');
+    END IF;
+
+    payload := jsonb_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'block_id', block_id
+    );
+
+    -- Для скважин передаем тип записи до и после изменения (2 - план, 3 - факт)
+    IF TG_TABLE_NAME = 'Boreholes' THEN
+        payload := payload || jsonb_build_object(
+            'name', COALESCE(new_row ->> 'Name', old_row ->> 'Name'),
+            't_old', (old_row ->> 'T')::int,
+            't_new', (new_row ->> 'T')::int
+        );
+    END IF;
+
+    PERFORM pg_notify(channel, payload::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS boreholes_notify ON public."Boreholes";
+CREATE TRIGGER boreholes_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public."Boreholes"
+    FOR EACH ROW EXECUTE FUNCTION public.notify_block_data_changed('boreholes_changed');
+
+DROP TRIGGER IF EXISTS block_info_notify ON public."BlockInfo";
+CREATE TRIGGER block_info_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public."BlockInfo"
+    FOR EACH ROW EXECUTE FUNCTION public.notify_block_data_changed('block_info_changed');
+
+DROP TRIGGER IF EXISTS relief_items_notify ON public."ReliefItems";
+CREATE TRIGGER relief_items_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public."ReliefItems"
+    FOR EACH ROW EXECUTE FUNCTION public.notify_block_data_changed('relief_changed');
+
+DROP TRIGGER IF EXISTS relief_points_notify ON public."ReliefPoints";
+CREATE TRIGGER relief_points_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public."ReliefPoints"
+    FOR EACH ROW EXECUTE FUNCTION public.notify_block_data_changed('relief_changed');
+
+DROP TRIGGER IF EXISTS drilling_rigs_notify ON public."DrillingRigs";
+CREATE TRIGGER drilling_rigs_notify
+    AFTER INSERT OR UPDATE OR DELETE ON public."DrillingRigs"
+    FOR EACH ROW EXECUTE FUNCTION public.notify_block_data_changed('rigs_changed');
+
+-- Таблицы сменных записей бурения, из которых считают calculate_rig_productivity_by_block()
+-- и calculate_remaining_shifts_by_block_rig(), подключаются тем же триггером, например:
+--
+-- CREATE TRIGGER drilling_records_notify
+--     AFTER INSERT OR UPDATE OR DELETE ON public."<таблица записей бурения>"
+--     FOR EACH ROW EXECUTE FUNCTION public.notify_block_data_changed('rigs_changed');
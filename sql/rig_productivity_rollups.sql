@@ -0,0 +1,127 @@
+-- rig_productivity_rollups.sql
+-- Приращения производительности станков по времени обновления.
+-- Приложение (app/models/rig_rollups.py) периодически и по уведомлениям
+-- rigs_changed вызывает refresh_rig_productivity_rollup(): функция сравнивает
+-- накопленные итоги calculate_rig_productivity_by_block() с последним
+-- снимком и добавляет разницу в сменную корзину текущего времени. Сутки и
+-- недели получаются суммированием сменных корзин.
+--
+-- Сменные записи бурения в функцию не передаются, поэтому корзина - время
+-- обновления, а не смена бурения: пропущенные обновления сливают смены в одну
+-- корзину, исправления итогов дают отрицательные приращения, истории до
+-- первого запуска нет, а каждый запуск пересчитывает итоги по всей истории.
+-- Ряд отдается как /api/rigs/productivity/refresh-deltas и не используется
+-- как выборка сменной выработки.
+--
+-- Таблицы:
+--   rig_productivity_snapshot - последние накопленные итоги по станку и блоку
+--   rig_productivity_rollup   - приращения по корзинам времени обновления (начало смены, станок, блок)
+
+CREATE TABLE IF NOT EXISTS public.rig_productivity_snapshot (
+    rig_id        text NOT NULL,
+    block_id      text NOT NULL,
+    total_depth   double precision NOT NULL DEFAULT 0,
+    drill_hours   double precision NOT NULL DEFAULT 0,
+    shifts_count  double precision NOT NULL DEFAULT 0,
+    updated_at    timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (rig_id, block_id)
+);
+
+CREATE TABLE IF NOT EXISTS public.rig_productivity_rollup (
+    bucket_start  timestamptz NOT NULL,
+    rig_id        text NOT NULL,
+    block_id      text NOT NULL,
+    depth         double precision NOT NULL DEFAULT 0,
+    drill_hours   double precision NOT NULL DEFAULT 0,
+    shifts_count  double precision NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket_start, rig_id, block_id)
+);
+
+CREATE INDEX IF NOT EXISTS rig_productivity_rollup_rig_idx
+    ON public.rig_productivity_rollup (rig_id, bucket_start);
+
+CREATE INDEX IF NOT EXISTS rig_productivity_rollup_block_idx
+    ON public.rig_productivity_rollup (block_id, bucket_start);
+
+-- shift_hours - длительность смены, shift_offset_hours - начало первой смены суток (UTC).
+-- Возвращает число пар станок/блок, итоги которых изменились.
+CREATE OR REPLACE FUNCTION public.refresh_rig_productivity_rollup(
+    shift_hours integer DEFAULT 12,
+    shift_offset_hours integer DEFAULT 8
+)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    shift_seconds double precision := shift_hours * 3600;
+    offset_seconds double precision := shift_offset_hours * 3600;
+    bucket timestamptz;
+    changed integer;
+BEGIN
+    -- Несколько процессов приложения обновляют свертку по очереди
+    PERFORM pg_advisory_xact_lock(hashtext('refresh_rig_productivity_rollup'));
+
+    bucket := to_timestamp(
+        floor((extract(epoch FROM now()) - offset_seconds) / shift_seconds) * shift_seconds + offset_seconds
+    );
+
+    CREATE TEMP TABLE rig_productivity_current ON COMMIT DROP AS
+    SELECT
+        rig_id::text AS rig_id,
+        block_id::text AS block_id,
+        COALESCE(total_depth, 0)::double precision AS total_depth,
+        COALESCE(drill_hours, 0)::double precision AS drill_hours,
+        COALESCE(shifts_count, 0)::double precision AS shifts_count
+    FROM public.calculate_rig_productivity_by_block()
+    WHERE rig_id IS NOT NULL AND block_id IS NOT NULL;
+
+    -- Первый запуск только фиксирует базу: прошлая история не относится к текущей смене
+    IF NOT EXISTS (SELECT 1 FROM public.rig_productivity_snapshot) THEN
+        INSERT INTO public.rig_productivity_snapshot (rig_id, block_id, total_depth, drill_hours, shifts_count)
+        SELECT rig_id, block_id, total_depth, drill_hours, shifts_count FROM rig_productivity_current;
+        GET DIAGNOSTICS changed = ROW_COUNT;
+        RETURN changed;
+    END IF;
+
+    CREATE TEMP TABLE rig_productivity_delta ON COMMIT DROP AS
+    SELECT
+        COALESCE(c.rig_id, s.rig_id) AS rig_id,
+        COALESCE(c.block_id, s.block_id) AS block_id,
+        COALESCE(c.total_depth, 0) - COALESCE(s.total_depth, 0) AS depth,
+        COALESCE(c.drill_hours, 0) - COALESCE(s.drill_hours, 0) AS drill_hours,
+        COALESCE(c.shifts_count, 0) - COALESCE(s.shifts_count, 0) AS shifts_count
+    FROM rig_productivity_current c
+    FULL JOIN public.rig_productivity_snapshot s
+        ON s.rig_id = c.rig_id AND s.block_id = c.block_id
+    WHERE c.rig_id IS NULL OR s.rig_id IS NULL
+       OR c.total_depth <> s.total_depth
+       OR c.drill_hours <> s.drill_hours
+       OR c.shifts_count <> s.shifts_count;
+
+    INSERT INTO public.rig_productivity_rollup AS r (bucket_start, rig_id, block_id, depth, drill_hours, shifts_count)
+    SELECT bucket, rig_id, block_id, depth, drill_hours, shifts_count FROM rig_productivity_delta
+    ON CONFLICT (bucket_start, rig_id, block_id) DO UPDATE SET
+        depth = r.depth + EXCLUDED.depth,
+        drill_hours = r.drill_hours + EXCLUDED.drill_hours,
+        shifts_count = r.shifts_count + EXCLUDED.shifts_count;
+    GET DIAGNOSTICS changed = ROW_COUNT;
+
+    DELETE FROM public.rig_productivity_snapshot s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM rig_productivity_current c
+        WHERE c.rig_id = s.rig_id AND c.block_id = s.block_id
+    );
+
+    INSERT INTO public.rig_productivity_snapshot AS s (rig_id, block_id, total_depth, drill_hours, shifts_count, updated_at)
+    SELECT c.rig_id, c.block_id, c.total_depth, c.drill_hours, c.shifts_count, now()
+    FROM rig_productivity_current c
+    JOIN rig_productivity_delta d ON d.rig_id = c.rig_id AND d.block_id = c.block_id
+    ON CONFLICT (rig_id, block_id) DO UPDATE SET
+        total_depth = EXCLUDED.total_depth,
+        drill_hours = EXCLUDED.drill_hours,
+        shifts_count = EXCLUDED.shifts_count,
+        updated_at = EXCLUDED.updated_at;
+
+    RETURN changed;
+END;
+$$;
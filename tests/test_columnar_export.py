@@ -0,0 +1,66 @@
+# test_columnar_export.py
+"""Колоночная выгрузка словарей (stream_records).
+
+Запуск:
+    python -m unittest discover -s tests
+"""
+import io
+import os
+import sys
+import unittest
+from decimal import Decimal
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from app.models import columnar_export
+
+def critical_rows(distance_count):
+    """Критические отклонения как из DeviationFrame.critical_export_rows(): сначала расстояние, затем длина"""
+    rows = [
+        {'borehole_name': f"d{i}", 'type': 'distance', 'deviation': 6.5, 'threshold': 5, 'is_critical': True}
+        for i in range(distance_count)
+    ]
+    rows.append({
+        'borehole_name': 'l1', 'type': 'length', 'deviation': Decimal('-2.5'), 'planned': 12,
+        'percent_deviation': 20.8, 'threshold': '10%', 'is_critical': True
+    })
+    return rows
+
+def read_table(chunks, format_type):
+    data = b''.join(chunks)
+    if format_type == 'arrow':
+        return columnar_export.pa.ipc.open_stream(data).read_all()
+    return columnar_export.pq.read_table(io.BytesIO(data))
+
+@unittest.skipUnless(columnar_export.is_available(), 'pyarrow is not installed')
+class StreamRecordsTest(unittest.TestCase):
+
+    def test_mixed_critical_rows_with_schema(self):
+        rows = critical_rows(3)
+        for format_type in columnar_export.COLUMNAR_FORMATS:
+            chunks = columnar_export.stream_records(
+                rows, format_type, batch_size=2, schema=columnar_export.critical_schema()
+            )
+            table = read_table(chunks, format_type).to_pylist()
+            self.assertEqual(len(table), len(rows), format_type)
+            self.assertEqual(table[0]['threshold'], '5')
+            self.assertEqual(table[-1]['threshold'], '10%')
+            self.assertEqual(table[-1]['planned'], 12.0)
+            self.assertEqual(table[-1]['deviation'], -2.5)
+
+    def test_inferred_schema_promotes_mixed_types(self):
+        rows = critical_rows(1)
+        table = read_table(columnar_export.stream_records(rows, 'arrow'), 'arrow')
+        self.assertEqual(str(table.schema.field('threshold').type), 'string')
+        self.assertEqual(str(table.schema.field('deviation').type), 'double')
+        self.assertEqual(str(table.schema.field('planned').type), 'int64')
+        self.assertEqual(table.num_rows, 2)
+
+    def test_int_and_float_promote_to_float(self):
+        rows = [{'value': 1}, {'value': 2.5}, {'value': Decimal('3.25')}]
+        table = read_table(columnar_export.stream_records(rows, 'arrow'), 'arrow')
+        self.assertEqual(table.column('value').to_pylist(), [1.0, 2.5, 3.25])
+
+if __name__ == '__main__':
+    unittest.main()
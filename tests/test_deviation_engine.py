@@ -0,0 +1,55 @@
+# test_deviation_engine.py
+"""Сопоставление проектных и фактических скважин (pair_rows).
+
+Запуск:
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from app.models.deviation_engine import ACTUAL_T, PLANNED_T, compute, pair_rows
+from app.models.deviation_frame import DeviationFrame
+
+def borehole(name, kind, x):
+    return (name, kind, x, 0.0, 0.0, 10.0, 0.2, 0.0, 0.0)
+
+class PairRowsTest(unittest.TestCase):
+
+    def test_unpaired_names_are_skipped(self):
+        names, planned, actual = pair_rows([
+            borehole('1', PLANNED_T, 0.0),
+            borehole('1', ACTUAL_T, 1.0),
+            borehole('2', PLANNED_T, 0.0),
+            borehole(None, ACTUAL_T, 0.0),
+        ])
+        self.assertEqual(names, ['1'])
+        self.assertEqual(list(actual['x'] - planned['x']), [1.0])
+
+    def test_duplicate_names_pair_like_sql_join(self):
+        names, planned, actual = pair_rows([
+            borehole('1', PLANNED_T, 0.0),
+            borehole('1', PLANNED_T, 5.0),
+            borehole('1', ACTUAL_T, 1.0),
+            borehole('1', ACTUAL_T, 2.0),
+        ])
+        self.assertEqual(names, ['1'] * 4)
+        self.assertEqual(
+            sorted(zip(planned['x'], actual['x'])),
+            [(0.0, 1.0), (0.0, 2.0), (5.0, 1.0), (5.0, 2.0)]
+        )
+
+        frame = DeviationFrame.from_columns(names, compute(names, planned, actual))
+        self.assertEqual(len(frame), 4)
+        self.assertEqual(frame.value('1', 'deviation'), 1.0)
+
+    def test_no_pairs(self):
+        names, planned, actual = pair_rows([borehole('1', PLANNED_T, 0.0)])
+        self.assertEqual(names, [])
+        self.assertEqual(planned['x'].size, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# test_listing_index.py
+"""Постраничная выдача SortedListing.
+
+Запуск:
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from app.models.listing_index import SortedListing
+
+def rig_rows():
+    """3 станка по 3 блока: rig_id повторяется в строках разных блоков"""
+    return [
+        {'rig_id': str(rig), 'block_id': str(block), 'total_depth': float(rig * 10 + block)}
+        for rig in range(1, 4)
+        for block in range(1, 4)
+    ]
+
+def make_listing(rows):
+    return SortedListing(
+        'test', lambda: rows, ('rig_id', 'block_id'),
+        ('rig_id', 'block_id', 'total_depth'), 'rig_id',
+        name_column='rig_id', version=lambda: 'v1'
+    )
+
+def all_pages(listing, **params):
+    items = []
+    after = None
+    while True:
+        page = listing.page(after=after, **params)
+        items.extend(page['items'])
+        after = page['next']
+        if after is None:
+            return items, page['total']
+
+class SortedListingPageTest(unittest.TestCase):
+
+    def test_pages_cover_rows_with_repeated_sort_values(self):
+        rows = rig_rows()
+        for sort in ('rig_id', '-rig_id', 'total_depth', '-total_depth'):
+            items, total = all_pages(make_listing(rows), limit=2, sort=sort)
+            self.assertEqual(len(items), len(rows), sort)
+            self.assertEqual(
+                {(row['rig_id'], row['block_id']) for row in items},
+                {(row['rig_id'], row['block_id']) for row in rows},
+                sort
+            )
+            self.assertEqual(total, len(rows))
+
+    def test_null_values_are_paged_last(self):
+        rows = rig_rows()
+        rows[0]['total_depth'] = None
+        items, _ = all_pages(make_listing(rows), limit=4, sort='total_depth')
+        self.assertEqual(len(items), len(rows))
+        self.assertIsNone(items[-1]['total_depth'])
+
+    def test_total_counts_filtered_rows(self):
+        items, total = all_pages(make_listing(rig_rows()), limit=2, prefix='2')
+        self.assertEqual(len(items), 3)
+        self.assertEqual(total, 3)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            make_listing(rig_rows()).page(after='not-a-cursor')
+
+if __name__ == '__main__':
+    unittest.main()
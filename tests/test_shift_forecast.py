@@ -0,0 +1,42 @@
+# test_shift_forecast.py
+"""Число смен до выработки остатка (shifts_to_complete).
+
+Запуск:
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+import numpy as np
+
+from app.models.shift_forecast import shifts_to_complete, MAX_SHIFTS
+
+class ShiftsToCompleteTest(unittest.TestCase):
+
+    def test_constant_productivity(self):
+        result = shifts_to_complete(25.0, np.array([10.0]), 5, np.random.default_rng(1))
+        np.testing.assert_allclose(result, 2.5)
+
+    def test_near_zero_productivity_rig(self):
+        # ~38500 смен: несколько десятков пачек ограниченного размера
+        samples = np.array([0.12, 0.13, 0.14])
+        result = shifts_to_complete(5000.0, samples, 200, np.random.default_rng(1))
+        self.assertTrue(np.isfinite(result).all())
+        self.assertAlmostEqual(result.mean(), 5000.0 / 0.13, delta=500)
+
+    def test_unreachable_remaining_depth(self):
+        samples = np.array([1e-4, 2e-4])
+        result = shifts_to_complete(5000.0, samples, 2000, np.random.default_rng(1))
+        self.assertTrue(np.isinf(result).all())
+        self.assertGreater(5000.0 / samples.max(), MAX_SHIFTS)
+
+    def test_zero_productivity(self):
+        result = shifts_to_complete(10.0, np.array([0.0]), 3, np.random.default_rng(1))
+        self.assertTrue(np.isinf(result).all())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# test_versioned_cache.py
+"""Кэш значений по версии данных (VersionedCache).
+
+Запуск:
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from app.models.invalidation import VersionedCache
+
+class StaticBus:
+    """Шина без слушателя: покрытие таблиц задается в тесте"""
+
+    def __init__(self, covered):
+        self.covered = covered
+
+    def expired(self, tables, stored_at, fallback_ttl):
+        return not self.covered and time.monotonic() - stored_at > fallback_ttl
+
+class VersionedCacheTest(unittest.TestCase):
+
+    def test_concurrent_builds_of_one_key_run_once(self):
+        cache = VersionedCache(bus=StaticBus(True))
+        calls = []
+        results = []
+
+        def builder():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'value'
+
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_build('key', 'v1', builder)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 8)
+
+    def test_version_change_rebuilds(self):
+        cache = VersionedCache(bus=StaticBus(True))
+        self.assertEqual(cache.get_or_build('key', 'v1', lambda: 1), 1)
+        self.assertEqual(cache.get_or_build('key', 'v1', lambda: 2), 1)
+        self.assertEqual(cache.get_or_build('key', 'v2', lambda: 3), 3)
+
+    def test_none_is_cached(self):
+        cache = VersionedCache(bus=StaticBus(True))
+        calls = []
+        for _ in range(2):
+            cache.get_or_build('key', 'v1', lambda: calls.append(1))
+        self.assertEqual(len(calls), 1)
+
+    def test_uncovered_tables_expire(self):
+        cache = VersionedCache(fallback_ttl=0, bus=StaticBus(False))
+        cache.put('key', 'v1', 1)
+        time.sleep(0.01)
+        self.assertIsNone(cache.get('key', 'v1'))
+
+    def test_max_entries_evicts_least_recently_used(self):
+        cache = VersionedCache(max_entries=2, bus=StaticBus(True))
+        cache.put('a', 'v1', 1)
+        cache.put('b', 'v1', 2)
+        cache.get('a', 'v1')
+        cache.put('c', 'v1', 3)
+        self.assertEqual(cache.get('a', 'v1'), 1)
+        self.assertIsNone(cache.get('b', 'v1'))
+        self.assertEqual(len(cache), 2)
+
+if __name__ == '__main__':
+    unittest.main()